@@ -12,6 +12,7 @@ from .fedbase import BasicClient as Client
 import system_simulator.base as ss
 import config as cfg
 import collections
+import copy
 import numpy as np
 
 class Server(BasicServer):
@@ -20,6 +21,16 @@ class Server(BasicServer):
         self.tolerance_for_latency = 0
         self.tiers = None
 
+    # the tiers with their credits, probabilities and accuracies change across rounds
+    def get_checkpoint_state(self):
+        state = BasicServer.get_checkpoint_state(self)
+        state['tiers'] = copy.deepcopy(self.tiers)
+        return state
+
+    def load_checkpoint_state(self, state):
+        BasicServer.load_checkpoint_state(self, state)
+        self.tiers = copy.deepcopy(state['tiers'])
+
     def profiling_and_tiering(self):
         # collecting the latency for each client
         client_latencies = [c._latency for c in self.clients]
@@ -31,6 +31,23 @@ class Server(BasicServer):
             self.model = self.aggregate(currently_updated_models)
         return len(received_models) > 0
 
+    def get_checkpoint_state(self):
+        state = super(Server, self).get_checkpoint_state()
+        state['client_taus'] = list(self.client_taus)
+        return state
+
+    def load_checkpoint_state(self, state):
+        super(Server, self).load_checkpoint_state(state)
+        self.client_taus = list(state['client_taus'])
+
+    def get_time_to_next_event(self):
+        # the next moment of either periodically sampling clients or receiving packages
+        t = cfg.clock.current_time
+        next_t = 1 if t < 1 else t + self.period - t % self.period
+        next_arrival = cfg.clock.next_arrival_time()
+        if next_arrival is not None: next_t = min(next_t, max(int(np.ceil(next_arrival)), t + 1))
+        return next_t - t
+
     def s(self, delta_tau):
         if self.flag == 'constant':
             return 1
@@ -1,6 +1,13 @@
 import numpy as np
 import flgo.utils.fmodule
 from flgo.utils import fmodule
+from flgo.utils import fvmap
+from flgo.utils import feval
+from flgo.utils import fcompress
+from flgo.utils import fcheckpoint
+from flgo.utils import fbatch
+from flgo.utils import fcontext
+from flgo.utils import fpool
 import copy
 import os
 import flgo.system_simulator.base as ss
@@ -20,12 +27,16 @@ class BasicServer:
         if option['pretrain'] != '':
             self.model.load_state_dict(torch.load(option['pretrain'])['model'])
             cfg.logger.info('The pretrained model parameters in {} will be loaded'.format(option['pretrain']))
+        if option['flat_model']:
+            # models copied from or computed with the global model will also be flattened
+            self.model.flatten()
         # basic configuration
         self.task = option['task']
         self.eval_interval = option['eval_interval']
         self.num_threads = option['num_threads']
         # server calculator
         self.calculator = cfg.TaskCalculator(self.device, optimizer_name = option['optimizer'])
+        self.evaluator = feval.Evaluator(self.calculator, option['test_batch_size'], option['num_workers'])
         # hyper-parameters during training process
         self.num_rounds = option['num_rounds']
         self.proportion = option['proportion']
@@ -37,9 +48,22 @@ class BasicServer:
         # systemic option
         self.tolerance_for_latency = 999999
         self.sending_package_buffer = [None for _ in range(9999)]
+        self._model_snapshot = None
+        # the recent versions of the global model for delta downloads and the versions last sent to the clients,
+        # which the compressed models uploaded by the clients are relative to
+        self.model_version = 0
+        self._model_versions = collections.OrderedDict()
+        self._sent_versions = {}
+        # the clients rebuild the global model by applying the deltas to their cached versions, which would drift
+        # away from the server's versions if the deltas were compressed lossily
+        if option['download_compressor'] != '' and not fcompress.get_compressor(option['download_compressor']).lossless:
+            raise ValueError("The compressor of delta downloads should be lossless (e.g. 'sparse'), but got '{}'".format(option['download_compressor']))
         # algorithm-dependent parameters
         self.algo_para = {}
         self.current_round = 1
+        # saving the checkpoint of the run every checkpoint_interval rounds
+        self.checkpoint_interval = option['checkpoint_interval']
+        self._resumed = False
         # all options
         self.option = option
 
@@ -51,12 +75,14 @@ class BasicServer:
         Start the federated learning symtem where the global model is trained iteratively.
         """
         cfg.logger.time_start('Total Time Cost')
-        cfg.logger.info("--------------Initial Evaluation--------------")
-        cfg.logger.time_start('Eval Time Cost')
-        cfg.logger.log_once()
-        cfg.logger.time_end('Eval Time Cost')
+        if not self._resumed:
+            cfg.logger.info("--------------Initial Evaluation--------------")
+            cfg.logger.time_start('Eval Time Cost')
+            cfg.logger.log_once()
+            cfg.logger.flush_record()
+            cfg.logger.time_end('Eval Time Cost')
         while self.current_round <= self.num_rounds:
-            cfg.clock.step()
+            cfg.clock.step(self.get_time_to_next_event() if cfg.clock.event_skipping else 1)
             # iterate
             updated = self.iterate()
             # using logger to evaluate the model if the model is updated
@@ -66,6 +92,7 @@ class BasicServer:
                 if cfg.logger.check_if_log(self.current_round, self.eval_interval):
                     cfg.logger.time_start('Eval Time Cost')
                     cfg.logger.log_once()
+                    cfg.logger.flush_record()
                     cfg.logger.time_end('Eval Time Cost')
                 # check if early stopping
                 if cfg.logger.early_stop(): break
@@ -74,12 +101,59 @@ class BasicServer:
             self.global_lr_scheduler(self.current_round)
             # clear package buffer
             self.sending_package_buffer = [None for _ in self.clients]
+            # save the checkpoint at the end of the round
+            if (updated is True or updated is None) and self.checkpoint_interval > 0 and (self.current_round - 1) % self.checkpoint_interval == 0:
+                fcheckpoint.save_checkpoint(self.get_checkpoint_path(), self)
         cfg.logger.info("=================End==================")
         cfg.logger.time_end('Total Time Cost')
         # save results as .json file
         cfg.logger.save_output_as_json()
+        # release the workers of training clients in parallel
+        if getattr(cfg, 'worker_pool', None) is not None:
+            cfg.worker_pool.close()
+            cfg.worker_pool = None
         return
 
+    def get_checkpoint_path(self):
+        if self.option['checkpoint'] != '': return self.option['checkpoint']
+        return os.path.join(self.option['task'], 'checkpoint', os.path.splitext(cfg.logger.get_output_name())[0] + '.ckpt')
+
+    def get_checkpoint_state(self):
+        """
+        Collect the state of the server and its clients that changes across rounds. Algorithms that keep
+        additional states across rounds (e.g. control variates) should extend this method and load_checkpoint_state,
+        otherwise resuming the run warns about the attributes created by `initialize` that are not saved.
+        :return
+            a dict of the state
+        """
+        return {
+            'current_round': self.current_round,
+            'model': self.model.state_dict(),
+            'lr': self.lr,
+            'tolerance_for_latency': self.tolerance_for_latency,
+            'model_version': self.model_version,
+            'model_versions': [(version, snapshot.state) for version, snapshot in self._model_versions.items()],
+            'sent_versions': dict(self._sent_versions),
+            'clients': [c.get_checkpoint_state() for c in self.clients],
+        }
+
+    def load_checkpoint_state(self, state):
+        """
+        Restore the state collected by get_checkpoint_state
+        :param
+            state: a dict of the state
+        """
+        self.current_round = state['current_round']
+        self.model.load_state_dict(state['model'])
+        self.lr = state['lr']
+        self.tolerance_for_latency = state['tolerance_for_latency']
+        self.model_version = state['model_version']
+        self._model_versions = collections.OrderedDict([(version, fcheckpoint.load_snapshot(snapshot_state, self.model)) for version, snapshot_state in state['model_versions']])
+        self._sent_versions = dict(state['sent_versions'])
+        for c, client_state in zip(self.clients, state['clients']):
+            c.load_checkpoint_state(client_state)
+        self._resumed = True
+
     def iterate(self):
         """
         The standard iteration of each federated round that contains three
@@ -112,6 +186,12 @@ class BasicServer:
         # prepare packages for clients
         for cid in communicate_clients:
             received_package_buffer[cid] = None
+        # broadcast one read-only snapshot of the global model to all the clients
+        if self.option['shared_broadcast'] and len(communicate_clients)>0:
+            self._model_snapshot = fmodule.ModelSnapshot(self.model, share_memory=self.num_threads>1)
+        if (self.is_delta_download() or self.option['compressor'] != '') and len(communicate_clients)>0: self.update_model_version()
+        if self.option['compressor'] != '':
+            for cid in communicate_clients: self._sent_versions[cid] = self.model_version
         try:
             for cid in communicate_clients:
                 self.sending_package_buffer[cid] = self.pack(cid)
@@ -123,11 +203,20 @@ class BasicServer:
                 self.model.to(self.device)
             else:
                 raise e
-        if self.num_threads <= 1:
+        if self.num_threads <= 1 and self.option['vmap_clients'] and self.is_batched_trainable(communicate_clients):
+            # computing all the clients simultaneously in a vectorized way
+            packages_received_from_clients = self.communicate_in_batch(communicate_clients)
+        elif self.num_threads <= 1:
             # computing iteratively
             for client_id in communicate_clients:
                 response_from_client_id = self.communicate_with(client_id)
                 packages_received_from_clients.append(response_from_client_id)
+        elif getattr(cfg, 'worker_pool', None) is not None and type(self).communicate_with is BasicServer.communicate_with:
+            # computing in parallel with the persistent pool where the clients are resident
+            for client_id in communicate_clients:
+                self.clients[client_id].update_device(next(cfg.dev_manager))
+                packages_received_from_clients.append(cfg.worker_pool.reply_async(self.clients[client_id], self.sending_package_buffer[client_id]))
+            packages_received_from_clients = [cfg.worker_pool.get(x) for x in packages_received_from_clients]
         else:
             # computing in parallel with torch.multiprocessing
             pool = mp.Pool(self.num_threads)
@@ -153,6 +242,39 @@ class BasicServer:
         # listen for the client's response
         return self.clients[client_id].reply(self.sending_package_buffer[client_id])
 
+    def is_batched_trainable(self, client_ids):
+        """
+        Check whether the clients can be trained simultaneously by `communicate_in_batch`, which
+        requires the clients to use the standard local training procedure and the model to be supported by utils.fvmap.
+        The batched training bypasses the wrappers of the methods of the clients (e.g. by the profiler) and trains all
+        the clients on one device, so the clients with wrapped methods or on different devices are trained one by one.
+        :param
+            client_ids: the ids of the clients to communicate with
+        :return
+            True if the clients can be trained in batch else False
+        """
+        if len(client_ids) <= 1 or type(self).communicate_with is not BasicServer.communicate_with: return False
+        for cid in client_ids:
+            Client = type(self.clients[cid])
+            if Client.reply is not BasicClient.reply or Client.train is not BasicClient.train: return False
+            if 'reply' in vars(self.clients[cid]) or 'train' in vars(self.clients[cid]): return False
+        if len(set(str(self.clients[cid].device) for cid in client_ids)) > 1: return False
+        return fvmap.is_supported(self.model, self.clients[client_ids[0]].calculator)
+
+    def communicate_in_batch(self, client_ids):
+        """
+        Train the models of the clients simultaneously by vectorizing their forward and backward
+        passes over clients, which is equivalent to calling `communicate_with` for each client.
+        :param
+            client_ids: the ids of the clients to communicate with
+        :return
+            client_packages: a list of the replies from the clients
+        """
+        clients = [self.clients[cid] for cid in client_ids]
+        models = [c.unpack(self.sending_package_buffer[cid]) for c, cid in zip(clients, client_ids)]
+        fvmap.train(clients, models)
+        return [c.pack(model) for c, model in zip(clients, models)]
+
     def pack(self, client_id):
         """
         Pack the necessary information for the client's local training.
@@ -162,10 +284,67 @@ class BasicServer:
         :return
             a dict that only contains the global model as default.
         """
+        if self.is_delta_download():
+            delta = self.pack_model_delta(client_id)
+            if delta is not None: return {"model": delta}
         return {
-            "model" : copy.deepcopy(self.model),
+            "model" : self._model_snapshot if self.option['shared_broadcast'] else copy.deepcopy(self.model),
         }
 
+    def is_delta_download(self):
+        # the clients trained in other processes cannot keep their cached models consistent with the server
+        return self.option['delta_download'] > 0 and self.num_threads <= 1
+
+    def update_model_version(self):
+        """Record the current global model as a new version if it differs from the latest version"""
+        if len(self._model_versions) > 0:
+            latest = self._model_versions[self.model_version].state
+            current = self.model.state_dict()
+            if all([torch.equal(current[k], v.to(current[k].device)) for k, v in latest.items()]): return
+        self.model_version += 1
+        self._model_versions[self.model_version] = fmodule.ModelSnapshot(self.model)
+        self.prune_model_versions()
+
+    def prune_model_versions(self):
+        """Drop the versions that are neither the latest ones for delta downloads nor the ones that the uploads in flight are relative to"""
+        retained = set(list(self._model_versions.keys())[-max(self.option['delta_download'], 1):]) | set(self._sent_versions.values())
+        for version in [v for v in self._model_versions.keys() if v not in retained]: self._model_versions.pop(version)
+
+    def release_upload_reference(self, client_ids):
+        """
+        Forget the versions sent to the clients whose uploads have been received or cancelled, so that
+        only the versions of the uploads still in flight are retained
+        :param
+            client_ids: the ids of the clients
+        """
+        if len(self._sent_versions) == 0: return
+        for cid in client_ids: self._sent_versions.pop(cid, None)
+        self.prune_model_versions()
+
+    def get_upload_reference(self, client_id):
+        """
+        Get the version of the global model last sent to the client, which the compressed model uploaded by the client is relative to
+        :param
+            client_id: the id of the client
+        :return
+            the ModelSnapshot of the version, or None if no version has been sent to the client
+        """
+        return self._model_versions.get(self._sent_versions.get(client_id))
+
+    def pack_model_delta(self, client_id):
+        """
+        Pack the difference between the latest global model and the version held by the client,
+        where the client reports the version of its cached global model.
+        :param
+            client_id: the id of the client
+        :return
+            the ModelDelta, or None if the client holds no version or a version that is too old
+        """
+        base_version = self.clients[client_id]._cached_model_version
+        if base_version is None or base_version not in self._model_versions: return None
+        compressor = fcompress.get_compressor(self.option['download_compressor'] or 'sparse')
+        return fcompress.ModelDelta(base_version, self.model_version, self._model_versions[self.model_version], self._model_versions[base_version], compressor)
+
     def unpack(self, packages_received_from_clients):
         """
         Unpack the information from the received packages. Return models and losses as default.
@@ -241,22 +420,23 @@ class BasicServer:
         if len(models) == 0: return self.model
         local_data_vols = [c.datavol for c in self.clients]
         total_data_vol = sum(local_data_vols)
+        # the models are accumulated into a single running buffer one by one
         if self.aggregation_option == 'weighted_scale':
             p = [1.0 * local_data_vols[cid] /total_data_vol for cid in self.received_clients]
             K = len(models)
             N = self.num_clients
-            return fmodule._model_sum([model_k * pk for model_k, pk in zip(models, p)]) * N / K
+            return fmodule._model_stream_sum(models, [pk * N / K for pk in p])
         elif self.aggregation_option == 'uniform':
-            return fmodule._model_average(models)
+            return fmodule._model_stream_sum(models, [1.0 / len(models) for _ in models])
         elif self.aggregation_option == 'weighted_com':
             p = [1.0 * local_data_vols[cid] / total_data_vol for cid in self.received_clients]
-            w = fmodule._model_sum([model_k * pk for model_k, pk in zip(models, p)])
-            return (1.0-sum(p))*self.model + w
+            res = fmodule._model_scale_(copy.deepcopy(self.model), 1.0-sum(p))
+            return fmodule._model_stream_sum(models, p, res)
         else:
             p = [1.0 * local_data_vols[cid] / total_data_vol for cid in self.received_clients]
             sump = sum(p)
             p = [pk/sump for pk in p]
-            return fmodule._model_sum([model_k * pk for model_k, pk in zip(models, p)])
+            return fmodule._model_stream_sum(models, p)
 
     def global_test(self, dataflag='valid'):
         """
@@ -266,6 +446,15 @@ class BasicServer:
         :return
             metrics: a dict contains the lists of each metric_value of the clients
         """
+        if self.evaluator.is_supported() and all([type(c).test is BasicClient.test for c in self.clients]):
+            # evaluate the data of all the clients by one consolidated pass
+            client_ids = [cid for cid, c in enumerate(self.clients) if (c.train_data if dataflag=='train' else c.valid_data) is not None]
+            if getattr(cfg, 'worker_pool', None) is not None:
+                metrics = cfg.worker_pool.global_test(self.model, client_ids, dataflag)
+            else:
+                datasets = [self.clients[cid].train_data if dataflag=='train' else self.clients[cid].valid_data for cid in client_ids]
+                metrics = self.evaluator.evaluate(self.model, datasets)
+            return collections.defaultdict(list, metrics)
         all_metrics = collections.defaultdict(list)
         for c in self.clients:
             client_metrics = c.test(self.model, dataflag)
@@ -322,6 +511,14 @@ class BasicServer:
     def get_tolerance_for_latency(self):
         return self.tolerance_for_latency
 
+    def get_time_to_next_event(self):
+        """
+        Return the units of time that the clock can directly skip to reach the next moment when the server
+        has things to do (e.g. sampling clients or receiving packages), which is used when the clock skips
+        the idle time. The synchronous server always has things to do at each moment.
+        """
+        return 1
+
     def wait_time(self, t=1):
         ss.clock.step(t)
         return
@@ -349,6 +546,9 @@ class BasicServer:
         setattr(self, flag+'_data', data)
 
 class BasicClient:
+    # whether the state of the local optimizer (e.g. momentum buffers) is carried over to the next local training
+    preserve_optimizer_state = False
+
     def __init__(self, option={}):
         self.id = None
         # create local dataset
@@ -365,9 +565,27 @@ class BasicClient:
         self.num_steps = option['num_steps']
         self.num_epochs = option['num_epochs']
         self.model = None
+        self._local_model = None
+        # the compressor of the uploaded models and the reference model that the compressed difference is relative to
+        self.compressor = fcompress.get_compressor(option['compressor'])
+        self._compression_reference = None
+        # the cached global model and its version for receiving the deltas of the global model
+        self._cached_model = None
+        self._cached_model_version = None
         self.test_batch_size = option['test_batch_size']
         self.loader_num_workers = option['num_workers']
         self.current_steps = 0
+        # the state of the RNG when creating the local DataLoader and the number of batches drawn from it
+        self._data_loader_rng = None
+        self._data_loader_pos = 0
+        self._pending_data_loader = None
+        # gather the local batches by indexing the tensors of the training data, and the reused buffer of permutations
+        self.index_sampler = option['index_sampler']
+        self._batch_perm = None
+        # reuse the model and the optimizer of local training across rounds ('client' or 'worker' scope, or 'none')
+        self.train_context = option['train_context']
+        self.train_context_capacity = option['train_context_capacity']
+        self._optimizer_state = None
         # system setting
         self._effective_num_steps = self.num_steps
         self._latency = 0
@@ -387,7 +605,7 @@ class BasicClient:
         :return
         """
         model.train()
-        optimizer = self.calculator.get_optimizer(model, lr = self.learning_rate, weight_decay=self.weight_decay, momentum=self.momentum)
+        optimizer = self.get_optimizer(model)
         for iter in range(self.num_steps):
             # get a batch of data
             batch_data = self.get_batch_data()
@@ -396,8 +614,37 @@ class BasicClient:
             loss = self.calculator.compute_loss(model, batch_data)['loss']
             loss.backward()
             optimizer.step()
+        self.save_optimizer_state(optimizer)
         return
 
+    def get_train_context(self):
+        """
+        Get the reusable training context of the client in this process, which is shared by all the clients
+        in the process of a WorkerPool worker when self.train_context is 'worker'
+        :return
+            the fcontext.TrainingContext
+        """
+        key = 'worker' if self.train_context == 'worker' and fpool.in_worker() else self.id
+        return fcontext.get_context(key, self.train_context_capacity)
+
+    def get_optimizer(self, model):
+        """
+        Get the optimizer of local training, which is reused across rounds if self.train_context is not 'none'.
+        The state of the optimizer is restored from the last local training if self.preserve_optimizer_state is True.
+        :param
+            model: the model to be trained
+        :return
+            the optimizer
+        """
+        # a new optimizer is created for each local training without the reusable context
+        context = fcontext.TrainingContext() if self.train_context == 'none' else self.get_train_context()
+        state = self._optimizer_state if self.preserve_optimizer_state else None
+        return fcontext.get_optimizer(context, model, self.calculator.get_optimizer, self.id, state, lr=self.learning_rate, weight_decay=self.weight_decay, momentum=self.momentum)
+
+    def save_optimizer_state(self, optimizer):
+        """Keep the state of the optimizer for the next local training if self.preserve_optimizer_state is True"""
+        if self.preserve_optimizer_state: self._optimizer_state = optimizer.state_dict()
+
     @ fmodule.with_multi_gpus
     def test(self, model, dataflag='valid'):
         """
@@ -423,7 +670,31 @@ class BasicClient:
             the unpacked information that can be rewritten
         """
         # unpack the received package
-        return received_pkg['model']
+        model = received_pkg['model']
+        if isinstance(model, fcompress.ModelDelta):
+            # rebuild the global model from the cached version
+            if self._cached_model_version != model.base_version: raise RuntimeError("Client {} doesn't hold the version {} of the global model".format(self.id, model.base_version))
+            version, model = model.version, model.apply(self._cached_model)
+        else:
+            version = None
+        reference = model
+        if self.train_context != 'none':
+            # load the received weights into the reusable model of the training context, leaving the received one untouched
+            model = fcontext.load_model(self.get_train_context(), model)
+        elif isinstance(model, fmodule.ModelSnapshot):
+            # materialize the broadcast snapshot into the reusable local model
+            self._local_model = model.materialize(self._local_model)
+            model = self._local_model
+        elif self.compressor is not None:
+            # train the reusable local model so that the received model stays unchanged as the reference
+            self._local_model = fcontext.load_weights(model, self._local_model)
+            model = self._local_model
+        # remember the received model so that only the difference will be compressed when packing the same model
+        if self.compressor is not None: self._compression_reference = (model, reference)
+        if self.server is not None and self.server.is_delta_download():
+            self._cached_model = reference if isinstance(reference, fmodule.ModelSnapshot) else fmodule.ModelSnapshot(model)
+            self._cached_model_version = version if version is not None else self.server.model_version
+        return model
 
     def reply(self, svr_pkg):
         """
@@ -453,9 +724,24 @@ class BasicClient:
             package: a dict that contains the necessary information for the server
         """
         return {
-            "model" : model,
+            "model" : self.compress(model),
         }
 
+    def compress(self, model):
+        """
+        Compress the model to be uploaded if the compressor is set. When the model is the one
+        unpacked from the server's package, only its difference from the received model is compressed,
+        and the server adds it to its own copy of the version sent to the client.
+        :param
+            model: the model to be uploaded
+        :return
+            the compressed model, or the model itself when no compressor is set
+        """
+        if self.compressor is None: return model
+        reference = self._compression_reference
+        self._compression_reference = None
+        return fcompress.CompressedModel(model, self.compressor, reference[1] if reference is not None and reference[0] is model else None)
+
     def is_idle(self):
         """
         Check if the client is active to participate training.
@@ -477,6 +763,16 @@ class BasicClient:
     def is_working(self):
         return cfg.state_updater.client_states[self.id]=='working'
 
+    @property
+    def _prob_available(self):
+        """The probability of the client becoming available, which is kept by the state updater"""
+        return cfg.state_updater.get_variable(self.id, 'prob_available')[0]
+
+    @property
+    def _prob_unavailable(self):
+        """The probability of the client becoming unavailable, which is kept by the state updater"""
+        return cfg.state_updater.get_variable(self.id, 'prob_unavailable')[0]
+
     def train_loss(self, model):
         """
         Get the task specified loss of the model on local training data
@@ -536,16 +832,94 @@ class BasicClient:
         :return:
             a batch of data
         """
+        # the DataLoader restored from the checkpoint is recreated when it's used for the first time
+        if self._pending_data_loader is not None:
+            self.data_loader = self.restore_data_loader(*self._pending_data_loader)
+            self._pending_data_loader = None
         try:
             batch_data = next(self.data_loader)
         except:
-            self.data_loader = iter(self.calculator.get_dataloader(self.train_data, batch_size=self.batch_size, num_workers=self.loader_num_workers))
+            self._data_loader_rng, self._data_loader_pos = torch.get_rng_state(), 0
+            self.data_loader = self.create_data_loader()
             batch_data = next(self.data_loader)
+        self._data_loader_pos += 1
         # clear local DataLoader when finishing local training
         self.current_steps = (self.current_steps+1) % self.num_steps
         if self.current_steps == 0:self.data_loader = None
         return batch_data
 
+    def create_data_loader(self):
+        """
+        Create the iterator over the shuffled batches of the local training data for one epoch, where the batches
+        are gathered by fbatch.IndexBatchLoader if self.index_sampler is True and the training data supports it
+        :return:
+            the iterator of batches
+        """
+        if self.index_sampler and fbatch.get_batch_fn(self.train_data) is not None:
+            loader = fbatch.IndexBatchLoader(self.train_data, self.batch_size, self._batch_perm)
+            self._batch_perm = loader.perm
+            return loader
+        return iter(self.calculator.get_dataloader(self.train_data, batch_size=self.batch_size, num_workers=self.loader_num_workers))
+
+    def restore_data_loader(self, rng_state, pos):
+        """
+        Recreate the local DataLoader from the RNG state of its creation and skip the batches drawn from it
+        :param
+            rng_state: the state of the torch RNG when the DataLoader was created
+            pos: the number of batches drawn from the DataLoader
+        :return:
+            the iterator of the remaining batches
+        """
+        current_rng_state = torch.get_rng_state()
+        self._data_loader_rng, self._data_loader_pos = rng_state, pos
+        torch.set_rng_state(rng_state)
+        data_loader = self.create_data_loader()
+        if isinstance(data_loader, fbatch.IndexBatchLoader): data_loader.skip(pos)
+        else:
+            for _ in range(pos): next(data_loader)
+        torch.set_rng_state(current_rng_state)
+        return data_loader
+
+    def get_checkpoint_state(self):
+        """
+        Collect the state of the client that changes across rounds
+        :return
+            a dict of the state
+        """
+        return {
+            'learning_rate': self.learning_rate,
+            'batch_size': self.batch_size,
+            'num_steps': self.num_steps,
+            'num_epochs': self.num_epochs,
+            'current_steps': self.current_steps,
+            # the local DataLoader is recreated from the RNG state of its creation and the number of batches drawn from it
+            'data_loader': (self._data_loader_rng, self._data_loader_pos) if self.data_loader is not None else self._pending_data_loader,
+            'compression_residual': getattr(self.compressor, 'residual', None),
+            'cached_model': self._cached_model.state if self._cached_model is not None else None,
+            'cached_model_version': self._cached_model_version,
+            'optimizer_state': self._optimizer_state,
+        }
+
+    def load_checkpoint_state(self, state):
+        """
+        Restore the state collected by get_checkpoint_state
+        :param
+            state: a dict of the state
+        """
+        self.learning_rate = state['learning_rate']
+        self.batch_size = state['batch_size']
+        self.num_steps = state['num_steps']
+        self.num_epochs = state['num_epochs']
+        self.current_steps = state['current_steps']
+        # the DataLoader is recreated lazily so that the restored client can still be copied into the workers of WorkerPool
+        self.data_loader = None
+        self._pending_data_loader = state['data_loader']
+        if self.compressor is not None and state['compression_residual'] is not None:
+            self.compressor.residual = state['compression_residual']
+        self._cached_model = fcheckpoint.load_snapshot(state['cached_model'], self.server.model) if state['cached_model'] is not None else None
+        self._cached_model_version = state['cached_model_version']
+        self._optimizer_state = state['optimizer_state']
+
     def update_device(self, dev):
         """
         Update running-time GPU device to the inputted dev, including change the client's device and the task_calculator's device
@@ -1,6 +1,6 @@
 """This is a non-official implementation of 'Federated Learning with Buffered Asynchronous Aggregation' (http://arxiv.org/abs/2106.06639). """
 from .fedasync import Server as AsyncServer
-from .fedbase import BasicClient
+from .fedbase import BasicServer, BasicClient
 import system_simulator.base as ss
 import config as cfg
 import copy
@@ -46,6 +46,21 @@ class Server(AsyncServer):
             self.updated = True
         return
 
+    # the buffer of fedbuff replaces the timestamps of fedasync as the state across rounds
+    def get_checkpoint_state(self):
+        state = BasicServer.get_checkpoint_state(self)
+        state['k'] = self.k
+        state['accumulate_delta'] = self.accumulate_delta.state_dict() if self.accumulate_delta is not None else None
+        return state
+
+    def load_checkpoint_state(self, state):
+        BasicServer.load_checkpoint_state(self, state)
+        self.k = state['k']
+        self.accumulate_delta = None
+        if state['accumulate_delta'] is not None:
+            self.accumulate_delta = copy.deepcopy(self.model)
+            self.accumulate_delta.load_state_dict(state['accumulate_delta'])
+
 
 
 class Client(BasicClient):
@@ -1,3 +1,4 @@
+import functools
 import json
 import urllib
 import zipfile
@@ -54,6 +55,12 @@ class SENTIMENT140(Dataset):
     def __getitem__(self, index):
         return torch.tensor(self.x[index], dtype=torch.long), self.y[index]
 
+    def get_batch(self, indices):
+        # the tensors of all the samples are built on the first call and shared by the batches
+        if not hasattr(self, 'tensors'): self.tensors = (torch.tensor(self.x, dtype=torch.long), torch.tensor(self.y))
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        return self.tensors[0][indices], self.tensors[1][indices]
+
     def __len__(self):
         return len(self.x)
 
@@ -205,17 +212,22 @@ class TaskPipe(BasicTaskPipe):
             ujson.dump(feddata, outf)
         return
 
+    def load_source_data(self, name):
+        return SENTIMENT140(root=self.feddata['rawdata_path'], train=(name=='train'))
+
+    def build_client_dataset(self, cname):
+        return self.TaskDataset(self.get_source_data('train'), self.feddata[cname]['data'])
+
     def load_data(self, running_time_option) -> dict:
         # load the datasets
-        train_data = SENTIMENT140(root=self.feddata['rawdata_path'], train=True)
-        test_data = SENTIMENT140(root=self.feddata['rawdata_path'], train=False)
+        train_data, test_data = self.get_source_data('train'), self.get_source_data('test')
         # rearrange data for server
         server_data_test, server_data_valid = self.split_dataset(test_data, running_time_option['test_holdout'])
         task_data = {'server': {'test': server_data_test, 'valid': server_data_valid}}
         # rearrange data for clients
         for cid, cname in enumerate(self.feddata['client_names']):
-            cdata = self.TaskDataset(train_data, self.feddata[cname]['data'])
-            cdata_train, cdata_valid = self.split_dataset(cdata, running_time_option['train_holdout'])
+            cdata = self.feddata[cname]['data']
+            cdata_train, cdata_valid = self.split_client_dataset(functools.partial(self.build_client_dataset, cname), len(cdata), running_time_option)
             task_data[cname] = {'train': cdata_train, 'valid': cdata_valid}
         return task_data
 
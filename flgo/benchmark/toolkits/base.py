@@ -1,10 +1,14 @@
 import importlib
 import shutil
+import collections
+import functools
+import pickle
 from abc import ABCMeta, abstractmethod
 import random
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import warnings
 import torch
 from torch.utils.data import Dataset
 try:
@@ -12,6 +16,446 @@ try:
 except:
     import json
 
+def _as_numeric_array(value):
+    """Convert the value into a numeric np.ndarray with at least one dimension, or return None if failed."""
+    if not isinstance(value, (list, np.ndarray)): return None
+    try:
+        arr = np.asarray(value)
+    except ValueError:
+        return None
+    if arr.ndim == 0 or arr.dtype.kind not in 'biuf': return None
+    return arr
+
+def save_task_binary(feddata, path):
+    """
+    Save `feddata` as a directory of .npy arrays, where the numeric lists at the same position
+    of all the clients' data are concatenated into one array with an offsets index of the
+    clients' partitions, and the rest of `feddata` is saved in `meta.json`.
+    :param
+        feddata: the dict that describes the federated task (i.e. the content of data.json)
+        path: the directory to save the task
+    """
+    if not os.path.exists(path): os.makedirs(path)
+    client_names = feddata['client_names']
+
+    def encode(values, name):
+        # values: the values at the same position of all the partitions
+        if all([isinstance(v, dict) for v in values]) and all([v.keys() == values[0].keys() for v in values]):
+            res = [{} for _ in values]
+            for k in values[0].keys():
+                for r, ek in zip(res, encode([v[k] for v in values], name + '.' + str(k))): r[k] = ek
+            return res
+        arrs = [_as_numeric_array(v) for v in values]
+        if any([a is None for a in arrs]): return values
+        ref = [a for a in arrs if a.size > 0]
+        if len(ref) == 0: return values
+        ref = ref[0]
+        arrs = [a if a.size > 0 else np.empty((0,) + ref.shape[1:], dtype=ref.dtype) for a in arrs]
+        if any([a.shape[1:] != ref.shape[1:] for a in arrs]): return values
+        np.save(os.path.join(path, name + '.npy'), np.concatenate(arrs))
+        np.save(os.path.join(path, name + '.offsets.npy'), np.cumsum([0] + [len(a) for a in arrs]))
+        return [{'__npy__': name, '__part__': i} for i in range(len(values))]
+
+    meta = {}
+    for key, value in feddata.items():
+        if key in client_names: continue
+        meta[key] = value if key == 'client_names' else encode([value], key)[0]
+    for cname, cdata in zip(client_names, encode([feddata[cname] for cname in client_names], 'clients')):
+        meta[cname] = cdata
+    with open(os.path.join(path, 'meta.json'), 'w') as outf:
+        json.dump(meta, outf)
+
+def load_task_binary(path, mmap_mode='r'):
+    """
+    Load the federated task saved by `save_task_binary`, where the arrays are memory-mapped
+    and each partition is a view into the array.
+    :param
+        path: the directory of the task
+        mmap_mode: the mode of memory-mapping the arrays (None means loading into memory)
+    :return
+        feddata: the dict that has the same structure as the content of data.json
+    """
+    with open(os.path.join(path, 'meta.json'), 'r') as inf:
+        meta = json.load(inf)
+    arrays = {}
+
+    def decode(node):
+        if isinstance(node, dict):
+            if '__npy__' in node:
+                name = node['__npy__']
+                if name not in arrays:
+                    arrays[name] = (np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode), np.load(os.path.join(path, name + '.offsets.npy')))
+                arr, offsets = arrays[name]
+                return arr[offsets[node['__part__']]:offsets[node['__part__'] + 1]]
+            return {k: decode(v) for k, v in node.items()}
+        return node
+    return decode(meta)
+
+def convert_task_to_binary(task_path, remove_json=False):
+    """
+    Convert the existing task stored as data.json into the binary format
+    :param
+        task_path: the path of the task
+        remove_json: remove data.json after converting
+    """
+    json_path = os.path.join(task_path, 'data.json')
+    with open(json_path, 'r') as inf:
+        feddata = json.load(inf)
+    save_task_binary(feddata, os.path.join(task_path, 'data'))
+    if remove_json: os.remove(json_path)
+    return
+
+class MemmapXYDataset(Dataset):
+    """
+    The dataset of samples (x, y) backed by the memory-mapped arrays (e.g. the partitions of clients
+    loaded by `load_task_binary`), where only the pages of the touched samples will be loaded into memory.
+    """
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __len__(self):
+        return len(self.y)
+
+    def _to_tensor(self, value):
+        value = torch.from_numpy(np.array(value))
+        # keep the same dtype as torch.tensor(list) does
+        return value.to(torch.get_default_dtype()) if value.is_floating_point() else value
+
+    def _to_x(self, value):
+        return self._to_tensor(value)
+
+    def __getitem__(self, index):
+        return self._to_x(self.x[index]), self._to_tensor(self.y[index])
+
+    def get_batch(self, indices):
+        """Gather the samples of the indices into a batch (x, y) at once"""
+        indices = np.asarray(indices, dtype=np.int64)
+        return self._to_x(self.x[indices]), self._to_tensor(self.y[indices])
+
+    def __getitems__(self, indices):
+        # DataLoader fetches the batch by this method, where the samples are the views of the gathered batch
+        x, y = self.get_batch(indices)
+        return list(zip(x, y))
+
+# the names of the random augmentations in torchvision.transforms besides the ones named by Random*
+RANDOM_TRANSFORMS = ['ColorJitter', 'AutoAugment', 'RandAugment', 'TrivialAugmentWide', 'AugMix', 'GaussianBlur', 'ElasticTransform']
+
+def is_deterministic_transform(transform):
+    """Check whether the transform (e.g. torchvision.transforms.Compose) contains no random augmentation"""
+    if transform is None: return True
+    transforms = getattr(transform, 'transforms', None)
+    if isinstance(transforms, (list, tuple)): return all([is_deterministic_transform(t) for t in transforms])
+    name = type(transform).__name__
+    return not (name.startswith('Random') or name in RANDOM_TRANSFORMS)
+
+class PredecodedDataset(MemmapXYDataset):
+    """
+    The dataset of the samples that have been transformed once by `predecode_dataset`, whose features are stored
+    as float16/float32 arrays or as uint8 arrays with the per-channel scale and offset (i.e. x = q * scale + offset).
+    """
+    def __init__(self, x, y, scale=None, offset=None):
+        super(PredecodedDataset, self).__init__(x, y)
+        self.scale = None if scale is None else torch.from_numpy(scale)
+        self.offset = None if offset is None else torch.from_numpy(offset)
+
+    def _to_x(self, value):
+        if self.scale is None: return self._to_tensor(value)
+        return torch.from_numpy(np.array(value)).to(torch.get_default_dtype()) * self.scale + self.offset
+
+def _channel_shape(x):
+    # the shape of the per-channel statistics that broadcasts to both a sample and a batch of samples
+    return (x.shape[1],) + (1,) * (x.ndim - 2) if x.ndim >= 2 else ()
+
+def predecode_dataset(dataset, path, dtype='float16', batch_size=256):
+    """
+    Apply the (deterministic) transform of the dataset to all the samples once and store the results as arrays in
+    path, which are memory-mapped by all the processes using them. The directory is written into a temporary one
+    first and then renamed, so the existing directory is always complete and will be loaded instead.
+    :param
+        dataset: the dataset whose samples are (x, y) tensors (e.g. torchvision datasets with transforms)
+        path: the directory of the arrays
+        dtype: the dtype to store x, which is one of 'float16', 'float32' and 'uint8' (i.e. quantized per channel)
+        batch_size: the number of samples transformed at a time
+    :return
+        the PredecodedDataset
+    """
+    if not os.path.exists(path):
+        tmp_path = path + '.tmp{}'.format(os.getpid())
+        if os.path.exists(tmp_path): shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        xs, ys, pos = None, np.empty((len(dataset),), dtype=np.int64), 0
+        # the generator keeps the global random state unchanged by iterating the DataLoader
+        for batch in torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False, generator=torch.Generator()):
+            x = batch[0].numpy()
+            # the features to be quantized are kept as float32 until the ranges of channels are known
+            if xs is None: xs = np.lib.format.open_memmap(os.path.join(tmp_path, 'x.f32.npy' if dtype == 'uint8' else 'x.npy'), mode='w+', dtype=np.float32 if dtype == 'uint8' else dtype, shape=(len(dataset),) + x.shape[1:])
+            xs[pos:pos + len(x)] = x
+            ys[pos:pos + len(x)] = batch[1].numpy()
+            pos += len(x)
+        if dtype == 'uint8':
+            axes = tuple([i for i in range(xs.ndim) if i != 1])
+            low = np.min(xs, axis=axes).reshape(_channel_shape(xs)).astype(np.float32)
+            scale = ((np.max(xs, axis=axes).reshape(_channel_shape(xs)) - low) / 255.0).astype(np.float32)
+            scale[scale == 0] = 1.0
+            qs = np.lib.format.open_memmap(os.path.join(tmp_path, 'x.npy'), mode='w+', dtype=np.uint8, shape=xs.shape)
+            for i in range(0, len(xs), batch_size):
+                qs[i:i + batch_size] = np.rint((xs[i:i + batch_size] - low) / scale)
+            qs.flush()
+            np.save(os.path.join(tmp_path, 'scale.npy'), scale)
+            np.save(os.path.join(tmp_path, 'offset.npy'), low)
+            del xs, qs
+            os.remove(os.path.join(tmp_path, 'x.f32.npy'))
+        elif xs is not None:
+            xs.flush()
+            del xs
+        else:
+            np.save(os.path.join(tmp_path, 'x.npy'), np.empty((0,), dtype=dtype))
+        np.save(os.path.join(tmp_path, 'y.npy'), ys)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process has predecoded the same dataset
+            shutil.rmtree(tmp_path)
+    return load_predecoded_dataset(path)
+
+def load_predecoded_dataset(path):
+    """Load the PredecodedDataset saved by `predecode_dataset`"""
+    scale, offset = None, None
+    if os.path.exists(os.path.join(path, 'scale.npy')):
+        scale, offset = np.load(os.path.join(path, 'scale.npy')), np.load(os.path.join(path, 'offset.npy'))
+    return PredecodedDataset(np.load(os.path.join(path, 'x.npy'), mmap_mode='r'), np.load(os.path.join(path, 'y.npy')), scale, offset)
+
+def has_random_transform(dataset):
+    """Check whether the dataset or the datasets that it's built on (e.g. the parents of subsets) apply random augmentations"""
+    if callable(getattr(type(dataset), 'materialize', None)): dataset = dataset.materialize()
+    if isinstance(dataset, torch.utils.data.ConcatDataset): return any([has_random_transform(d) for d in dataset.datasets])
+    if not (is_deterministic_transform(getattr(dataset, 'transform', None)) and is_deterministic_transform(getattr(dataset, 'target_transform', None))): return True
+    parent = getattr(dataset, 'dataset', None)
+    return parent is not None and has_random_transform(parent)
+
+def _materialize_xy(dataset, batch_size=256):
+    """Collect the samples (x, y) of the dataset into two arrays, or return None if the samples are not pairs of tensors"""
+    xs, ys = [], []
+    try:
+        for batch in torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False):
+            if not isinstance(batch, (list, tuple)) or len(batch) != 2 or not all([isinstance(b, torch.Tensor) for b in batch]): return None
+            xs.append(batch[0].numpy())
+            ys.append(batch[1].numpy())
+    except (TypeError, RuntimeError):
+        # the samples cannot be collated into tensors (e.g. graphs or sequences of different lengths)
+        return None
+    return np.concatenate(xs), np.concatenate(ys)
+
+def _is_jsonable(value):
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError, OverflowError):
+        return False
+
+def _save_prepared_parts(task_data, path):
+    # save the arrays of each dataset as a part of the column (e.g. train.x) one by one, so that only one
+    # dataset is materialized at a time (e.g. the client datasets of --lazy_data stay bounded by their LRU)
+    parts = collections.defaultdict(list)
+    meta = {'client_names': list(task_data.keys())}
+    for name, datasets in task_data.items():
+        meta[name] = {}
+        for flag, dataset in datasets.items():
+            if dataset is not None and not isinstance(dataset, Dataset):
+                # the additional entries of the parties (e.g. the information of the local data) are kept as they are
+                if not _is_jsonable(dataset): return None
+                meta[name][flag] = {'__value__': dataset}
+                continue
+            if dataset is None or len(dataset) == 0:
+                meta[name][flag] = dataset if dataset is None else {'x': None, 'y': None}
+                continue
+            # a single realization of random augmentations shouldn't be frozen into the cache
+            if has_random_transform(dataset): return None
+            xy = _materialize_xy(dataset)
+            if xy is None: return None
+            meta[name][flag] = {}
+            for field, arr in zip(['x', 'y'], xy):
+                column = parts[(flag, field)]
+                if len(column) > 0 and (column[0][1] != arr.shape[1:] or column[0][2] != arr.dtype): return None
+                part_name = '.'.join(['part', flag, field, str(len(column))]) + '.npy'
+                np.save(os.path.join(path, part_name), arr)
+                meta[name][flag][field] = {'__npy__': '.'.join(['prepared', flag, field]), '__part__': len(column)}
+                column.append((part_name, arr.shape[1:], arr.dtype, len(arr)))
+            del xy
+    # concatenate the parts of each column on the disk
+    for (flag, field), column in parts.items():
+        name = '.'.join(['prepared', flag, field])
+        lengths = [num for _, _, _, num in column]
+        out = np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=column[0][2], shape=(sum(lengths),) + column[0][1])
+        offset = 0
+        for part_name, _, _, num in column:
+            out[offset:offset + num] = np.load(os.path.join(path, part_name), mmap_mode='r')
+            offset += num
+            os.remove(os.path.join(path, part_name))
+        out.flush()
+        del out
+        np.save(os.path.join(path, name + '.offsets.npy'), np.cumsum([0] + lengths))
+    return meta
+
+def save_prepared_task_data(task_data, path):
+    """
+    Save the prepared task data (i.e. the datasets of all the parties after splitting and transforming) into
+    the binary format of `save_task_binary`, where the samples of each dataset are materialized as arrays x and y
+    one dataset at a time. The directory is written into a temporary one first and then renamed, so that the
+    concurrent runs won't read an incomplete cache.
+    :param
+        task_data: the dict of {party_name: {flag: dataset}} returned by `load_data` of task pipes, where the
+        entries that are not datasets should be jsonable
+        path: the directory to save the prepared task data
+    :return
+        True if saved, or False if the samples of any dataset cannot be materialized as (x, y) tensors or are randomly augmented
+    """
+    tmp_path = path + '.tmp{}'.format(os.getpid())
+    if os.path.exists(tmp_path): shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    meta = _save_prepared_parts(task_data, tmp_path)
+    if meta is None:
+        shutil.rmtree(tmp_path)
+        return False
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as outf:
+        json.dump(meta, outf)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process has saved the same data
+        shutil.rmtree(tmp_path)
+    return True
+
+def load_prepared_task_data(path):
+    """
+    Load the task data saved by `save_prepared_task_data`, where each dataset is a MemmapXYDataset
+    :param
+        path: the directory of the prepared task data
+    :return
+        task_data: the dict of {party_name: {flag: dataset}}
+    """
+    feddata = load_task_binary(path)
+    task_data = {}
+    for name in feddata['client_names']:
+        task_data[name] = {}
+        for flag, xy in feddata[name].items():
+            if xy is None: task_data[name][flag] = None
+            elif '__value__' in xy: task_data[name][flag] = xy['__value__']
+            elif xy['x'] is None: task_data[name][flag] = MemmapXYDataset(np.empty((0,)), np.empty((0,), dtype=np.int64))
+            else: task_data[name][flag] = MemmapXYDataset(xy['x'], xy['y'])
+    return task_data
+
+def _identity(x):
+    return x
+
+# the caches and the task pipes restored from pickles in the current process (e.g. in the workers of WorkerPool),
+# which are shared by all the lazy datasets received by the process instead of being rebuilt for each message
+_RESTORED_CACHES = {}
+_RESTORED_PIPES = {}
+
+def _restore_dataset_cache(key, capacity):
+    if key not in _RESTORED_CACHES: _RESTORED_CACHES[key] = DatasetLRU(capacity, key)
+    return _RESTORED_CACHES[key]
+
+def _restore_task_pipe(pipe_class, state):
+    key = (pipe_class, state['task_path'])
+    if key not in _RESTORED_PIPES:
+        pipe = pipe_class.__new__(pipe_class)
+        pipe.__dict__.update(state)
+        pipe.load_feddata()
+        _RESTORED_PIPES[key] = pipe
+    return _RESTORED_PIPES[key]
+
+class DatasetLRU:
+    """The bounded LRU cache of the materialized datasets of clients, where capacity<=0 means no bound"""
+    def __init__(self, capacity=0, key=None):
+        self.capacity = capacity
+        self.key = key if key is not None else (os.getpid(), id(self))
+        self.items = collections.OrderedDict()
+
+    def get(self, handle):
+        if handle in self.items:
+            self.items.move_to_end(handle)
+        else:
+            self.items[handle] = handle.build()
+            if 0 < self.capacity < len(self.items): self.items.popitem(last=False)
+        return self.items[handle]
+
+    def __reduce__(self):
+        # only the capacity is shipped and the receiver materializes the datasets within its own cache
+        return _restore_dataset_cache, (self.key, self.capacity)
+
+class LazyClientData:
+    """
+    The handle of the local datasets of a client, which defers building them until they are accessed.
+    The evicted datasets will be rebuilt identically by `build_fn` and split by `split_fn` with the seeded
+    generator when being accessed again. The handle is pickled as this recipe when `build_fn` and `split_fn`
+    can be pickled (e.g. the methods of the task pipe bound by functools.partial).
+    """
+    def __init__(self, build_fn, cache, split_fn=None, holdout=0.0, seed=0):
+        self.build_fn = build_fn
+        self.cache = cache
+        self.split_fn = split_fn
+        self.holdout = holdout
+        self.seed = seed
+        self._picklable = None
+
+    def build(self):
+        dataset = self.build_fn()
+        if self.split_fn is None: return dataset
+        return self.split_fn(dataset, self.holdout, torch.Generator().manual_seed(self.seed))
+
+    def get(self):
+        return self.cache.get(self)
+
+    def is_picklable(self):
+        """Check whether the recipe of the handle can be pickled"""
+        if self._picklable is None:
+            try:
+                pickle.dumps((self.build_fn, self.split_fn))
+                self._picklable = True
+            except (pickle.PicklingError, AttributeError, TypeError):
+                self._picklable = False
+        return self._picklable
+
+class LazyDataset(Dataset):
+    """
+    The dataset whose length is known in advance and whose content is materialized by `client_data` on the first access.
+    :param
+        client_data: the LazyClientData that builds the datasets of the client
+        index: the position of this dataset in the datasets built by `client_data`
+        length: the size of this dataset
+    """
+    def __init__(self, client_data, index, length):
+        self.client_data = client_data
+        self.index = index
+        self.length = length
+
+    def materialize(self):
+        return self.client_data.get()[self.index]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        return self.materialize()[idx]
+
+    def __getitems__(self, idxs):
+        dataset = self.materialize()
+        if callable(getattr(dataset, '__getitems__', None)): return dataset.__getitems__(idxs)
+        return [dataset[i] for i in idxs]
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ['client_data', 'index', 'length']: raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def __reduce__(self):
+        # the handle is shipped as its recipe (e.g. to the worker processes) so that the receiver materializes the dataset
+        # on demand within its own LRU, and the materialized dataset is shipped only if the recipe cannot be pickled
+        if self.client_data.is_picklable(): return LazyDataset, (self.client_data, self.index, self.length)
+        return _identity, (self.materialize(),)
+
 class AbstractTaskGenerator(metaclass=ABCMeta):
     @abstractmethod
     def load_data(self, *args, **kwarg):
@@ -125,10 +569,37 @@ class BasicTaskPipe(AbstractTaskPipe):
 
     def __init__(self, task_path):
         self.task_path = task_path
-        if os.path.exists(os.path.join(self.task_path, 'data.json')):
+        self.load_feddata()
+
+    def load_feddata(self):
+        if os.path.exists(os.path.join(self.task_path, 'data', 'meta.json')):
+            self.feddata = load_task_binary(os.path.join(self.task_path, 'data'))
+        elif os.path.exists(os.path.join(self.task_path, 'data.json')):
             with open(os.path.join(self.task_path, 'data.json'), 'r') as inf:
                 self.feddata = json.load(inf)
 
+    def __reduce__(self):
+        # the pipe is shipped as a part of the recipe of the lazy client datasets (e.g. to the worker processes), where
+        # the task data and the source datasets are loaded once by the receiver instead of being shipped
+        state = {k: v for k, v in self.__dict__.items() if k not in ['feddata', '_source_data']}
+        return _restore_task_pipe, (self.__class__, state)
+
+    def get_source_data(self, name):
+        """
+        Get the dataset that the local datasets of clients are built on (e.g. the whole training data),
+        which is loaded by `load_source_data` once in each process
+        :param
+            name: the name of the dataset (e.g. 'train')
+        :return
+            the dataset
+        """
+        if getattr(self, '_source_data', None) is None: self._source_data = {}
+        if name not in self._source_data: self._source_data[name] = self.load_source_data(name)
+        return self._source_data[name]
+
+    def load_source_data(self, name):
+        raise NotImplementedError
+
     def save_task(self, generator):
         # Construct `feddata` and store it into the disk for recover the partitioned datasets again from it
         raise NotImplementedError
@@ -137,6 +608,10 @@ class BasicTaskPipe(AbstractTaskPipe):
         # Load the data and process it to the format that can be distributed to different objects
         raise NotImplementedError
 
+    def save_feddata(self, feddata):
+        # Store `feddata` into the disk in the binary columnar format
+        save_task_binary(feddata, os.path.join(self.task_path, 'data'))
+
     def generate_objects(self, running_time_option, algorithm, scene='horizontal') -> list:
         # Generate the virtual objects (i.e. coordinators and participants) in the FL system
         if scene=='horizontal':
@@ -176,11 +651,34 @@ class BasicTaskPipe(AbstractTaskPipe):
             for data_name, data in ob_data.items():
                 ob.set_data(data, data_name)
 
-    def split_dataset(self, dataset, p=0.0):
+    def split_dataset(self, dataset, p=0.0, generator=None):
         if p == 0: return dataset, None
         s1 = int(len(dataset) * p)
         s2 = len(dataset) - s1
-        return torch.utils.data.random_split(dataset, [s2, s1])
+        if generator is None: return torch.utils.data.random_split(dataset, [s2, s1])
+        return torch.utils.data.random_split(dataset, [s2, s1], generator=generator)
+
+    def split_client_dataset(self, build_dataset, num_samples, running_time_option):
+        """
+        Split the local dataset of a client into the training part and the validation part. If
+        running_time_option['lazy_data'] is True, the dataset won't be built and split until it's accessed,
+        and at most running_time_option['lazy_data_capacity'] clients' datasets will be kept in memory.
+        :param
+            build_dataset: the function that builds the local dataset of the client, which should be picklable
+            (e.g. a method of the pipe bound by functools.partial) to ship the lazy datasets without materializing them
+            num_samples: the size of the local dataset
+            running_time_option: the option of running time
+        :return
+            the training dataset and the validation dataset
+        """
+        p = running_time_option['train_holdout']
+        if not running_time_option.get('lazy_data', False): return self.split_dataset(build_dataset(), p)
+        if not hasattr(self, 'dataset_cache'): self.dataset_cache = DatasetLRU(running_time_option.get('lazy_data_capacity', 0))
+        # the split is seeded to keep it unchanged after the datasets being evicted and rebuilt
+        seed = int(torch.randint(0, 2 ** 31 - 1, (1,)))
+        client_data = LazyClientData(build_dataset, self.dataset_cache, self.split_dataset, p, seed)
+        num_valid = int(num_samples * p)
+        return LazyDataset(client_data, 0, num_samples - num_valid), (LazyDataset(client_data, 1, num_valid) if p > 0 else None)
 
     def task_exists(self):
         """Check whether the task already exists."""
@@ -274,15 +772,19 @@ class XYHorizontalTaskPipe(BasicTaskPipe):
         client_names = self.gen_client_names(len(generator.local_datas))
         feddata = {'client_names': client_names, 'server': {'data': generator.test_data}}
         for cid in range(len(client_names)): feddata[client_names[cid]] = {'data': generator.local_datas[cid]}
-        with open(os.path.join(self.task_path, 'data.json'), 'w') as outf:
-            json.dump(feddata, outf)
+        self.save_feddata(feddata)
+
+    def to_dataset(self, data):
+        # the data loaded from the binary task is memory-mapped and won't be loaded into memory
+        if isinstance(data['x'], np.ndarray) and isinstance(data['y'], np.ndarray):
+            return MemmapXYDataset(data['x'], data['y'])
+        return self.TaskDataset(torch.tensor(data['x']), torch.tensor(data['y']))
+
+    def build_client_dataset(self, cname):
+        return self.to_dataset(self.feddata[cname]['data'])
 
     def load_data(self, running_time_option) -> dict:
-        test_data = self.feddata['server']['data']
-        test_data = self.TaskDataset(torch.tensor(test_data['x']), torch.tensor(test_data['y']))
-        local_datas = [self.TaskDataset(torch.tensor(self.feddata[cname]['data']['x']),
-                                        torch.tensor(self.feddata[cname]['data']['y'])) for cname in
-                       self.feddata['client_names']]
+        test_data = self.to_dataset(self.feddata['server']['data'])
         server_data_test, server_data_valid = self.split_dataset(test_data, running_time_option['test_holdout'])
         task_data = {'server': {'test': server_data_test, 'valid': server_data_valid}}
         for key in self.feddata['server'].keys():
@@ -290,8 +792,8 @@ class XYHorizontalTaskPipe(BasicTaskPipe):
                 continue
             task_data['server'][key] = self.feddata['server'][key]
         for cid, cname in enumerate(self.feddata['client_names']):
-            cdata = local_datas[cid]
-            cdata_train, cdata_valid = self.split_dataset(cdata, running_time_option['train_holdout'])
+            cdata = self.feddata[cname]['data']
+            cdata_train, cdata_valid = self.split_client_dataset(functools.partial(self.build_client_dataset, cname), len(cdata['y']), running_time_option)
             task_data[cname] = {'train': cdata_train, 'valid': cdata_valid}
             for key in self.feddata[cname]:
                 if key == 'data':
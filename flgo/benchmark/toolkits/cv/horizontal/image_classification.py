@@ -1,3 +1,5 @@
+import copy
+import functools
 import random
 import torch.utils.data
 import ujson
@@ -25,6 +27,7 @@ class BuiltinClassPipe(BasicTaskPipe):
             self.dataset = dataset
             self.indices = indices
             self.perturbation = {idx:p for idx, p in zip(indices, perturbation)} if perturbation is not None else None
+            self.index_array = np.asarray(indices, dtype=np.int64)
 
         def __getitem__(self, idx):
             if self.perturbation is None:
@@ -34,6 +37,17 @@ class BuiltinClassPipe(BasicTaskPipe):
             else:
                 return self.dataset[self.indices[idx]][0] + self.perturbation[self.indices[idx]],  self.dataset[self.indices[idx]][1]
 
+        def get_batch(self, idxs):
+            """Gather the samples into a batch (x, y) at once from the dataset that supports `get_batch` (e.g. PredecodedDataset)"""
+            x, y = self.dataset.get_batch(self.index_array[np.asarray(idxs, dtype=np.int64)])
+            if self.perturbation is not None: x = x + torch.stack([self.perturbation[self.indices[i]] for i in idxs]).to(x.dtype)
+            return x, y
+
+        def __getitems__(self, idxs):
+            if not hasattr(self.dataset, 'get_batch'): return [self[i] for i in idxs]
+            x, y = self.get_batch(idxs)
+            return list(zip(x, y))
+
     def __init__(self, task_name, buildin_class, transform=None):
         super(BuiltinClassPipe, self).__init__(task_name)
         self.builtin_class = buildin_class
@@ -44,26 +58,50 @@ class BuiltinClassPipe(BasicTaskPipe):
         feddata = {'client_names': client_names, 'server_data': list(range(len(generator.test_data))),  'rawdata_path': generator.rawdata_path, 'additional_option': generator.additional_option}
         for cid in range(len(client_names)): feddata[client_names[cid]] = {'data': generator.local_datas[cid],}
         if hasattr(generator.partitioner, 'local_perturbation'): feddata['local_perturbation'] = generator.partitioner.local_perturbation
-        with open(os.path.join(self.task_path, 'data.json'), 'w') as outf:
-            ujson.dump(feddata, outf)
+        self.save_feddata(feddata)
         return
 
+    def load_source_data(self, name):
+        dataset = self.builtin_class(root=self.feddata['rawdata_path'], download=True, train=(name=='train'), transform=self.transform, **self.feddata['additional_option'])
+        if getattr(self, 'predecode_option', {}).get('predecode_data', False): dataset = self.predecode(dataset, name, self.predecode_option)
+        return dataset
+
+    def build_client_dataset(self, cid, cname):
+        pert = self.feddata['local_perturbation'][cid] if 'local_perturbation' in self.feddata.keys() else None
+        cpert = None if pert is None else [torch.tensor(t) for t in pert]
+        return self.TaskDataset(self.get_source_data('train'), self.feddata[cname]['data'], cpert)
+
     def load_data(self, running_time_option) -> dict:
         # load the datasets
-        train_data = self.builtin_class(root=self.feddata['rawdata_path'], download=True, train=True, transform=self.transform, **self.feddata['additional_option'])
-        test_data = self.builtin_class(root=self.feddata['rawdata_path'], download=True, train=False, transform=self.transform, **self.feddata['additional_option'])
+        self.predecode_option = {k: running_time_option[k] for k in ['predecode_data', 'predecode_dtype'] if k in running_time_option}
+        train_data, test_data = self.get_source_data('train'), self.get_source_data('test')
         # rearrange data for server
         server_data_test, server_data_valid = self.split_dataset(test_data, running_time_option['test_holdout'])
         task_data = {'server': {'test': server_data_test, 'valid': server_data_valid}}
         # rearrange data for clients
-        local_perturbation = self.feddata['local_perturbation'] if 'local_perturbation' in self.feddata.keys() else [None for _ in self.feddata['client_names']]
         for cid, cname in enumerate(self.feddata['client_names']):
-            cpert = None if  local_perturbation[cid] is None else [torch.tensor(t) for t in local_perturbation[cid]]
-            cdata = self.TaskDataset(train_data, self.feddata[cname]['data'], cpert)
-            cdata_train, cdata_valid = self.split_dataset(cdata, running_time_option['train_holdout'])
+            build_dataset = functools.partial(self.build_client_dataset, cid, cname)
+            cdata_train, cdata_valid = self.split_client_dataset(build_dataset, len(self.feddata[cname]['data']), running_time_option)
             task_data[cname] = {'train':cdata_train, 'valid':cdata_valid}
         return task_data
 
+    def predecode(self, dataset, name, running_time_option):
+        """
+        Transform the samples of the dataset once and store them under the task, so that the clients gather
+        their batches from the memory-mapped arrays instead of decoding and transforming each sample every epoch
+        :param
+            dataset: the dataset built by the builtin class
+            name: the name of the dataset (i.e. 'train' or 'test')
+            running_time_option: the option of running time
+        :return
+            the PredecodedDataset, or the dataset itself if its transform is random
+        """
+        if not is_deterministic_transform(self.transform):
+            warnings.warn("The data won't be predecoded since the transform {} is random.".format(self.transform))
+            return dataset
+        dtype = running_time_option.get('predecode_dtype', 'float16')
+        return predecode_dataset(dataset, os.path.join(self.task_path, 'cache', 'predecoded_' + dtype, name), dtype)
+
 class GeneralCalculator(BasicTaskCalculator):
     def __init__(self, device, optimizer_name='sgd'):
         super(GeneralCalculator, self).__init__(device, optimizer_name)
@@ -105,6 +143,23 @@ class GeneralCalculator(BasicTaskCalculator):
             total_loss += batch_mean_loss * len(batch_data[-1])
         return {'accuracy': 1.0*num_correct/len(dataset), 'loss':total_loss/len(dataset)}
 
+    @torch.no_grad()
+    def get_sample_metrics(self, model, batch_data):
+        """
+        Compute the metrics of each sample in the batch, whose averages over a dataset are equal to the results of `test`.
+        :param model:
+        :param batch_data:
+        :return: {'accuracy': 1-D tensor, 'loss': 1-D tensor}
+        """
+        batch_data = self.to_device(batch_data)
+        outputs = model(batch_data[0])
+        criterion = copy.copy(self.criterion)
+        criterion.reduction = 'none'
+        loss = criterion(outputs, batch_data[-1])
+        y_pred = outputs.data.max(1, keepdim=True)[1]
+        correct = y_pred.eq(batch_data[-1].data.view_as(y_pred)).view(-1)
+        return {'accuracy': correct.float(), 'loss': loss}
+
     def to_device(self, data):
         return data[0].to(self.device), data[1].to(self.device)
 
@@ -3,6 +3,7 @@ import random
 
 import numpy as np
 import collections
+import flgo.utils.flabel as flabel
 
 class AbstractPartitioner(metaclass=ABCMeta):
     @ abstractmethod
@@ -80,82 +81,95 @@ class IIDPartitioner(BasicPartitioner):
         return local_datas
 
 class DirichletPartitioner(BasicPartitioner):
-    def __init__(self, num_clients = 100, alpha=1.0, imbalance=0, flag_index=-1):
+    def __init__(self, num_clients = 100, alpha=1.0, imbalance=0, flag_index=-1, error_bound=1e-6, max_iter=-1, num_candidates=64):
+        """
+        :param
+            num_clients: the number of clients
+            alpha: the concentration parameter of the Dirichlet distribution of the label proportions of clients
+            imbalance: the imbalance of the local data sizes
+            flag_index: the position of the label in each sample
+            error_bound: the bound of the squared error (divided by the number of classes) between the label
+            distribution of the partitioned data and the one of the whole data
+            max_iter: the maximum number of iterations of fitting the label proportions, and -1 means 20*num_clients
+            num_candidates: the number of the candidate proportions drawn at each iteration
+        """
         self.num_clients = num_clients
         self.alpha = alpha
         self.imbalance = imbalance
         self.flag_index = flag_index
+        self.error_bound = error_bound
+        self.max_iter = max_iter if max_iter > 0 else 20 * num_clients
+        self.num_candidates = num_candidates
 
     def __str__(self):
         name = "dir{:.2f}".format(self.alpha)
         if self.imbalance>0: name += '_imb{:.1f}'.format(self.imbalance)
         return name
 
+    def draw_proportions(self, p, size):
+        """Draw `size` label proportions from Dirichlet(alpha*p) as a (size x num_classes) array"""
+        proportions = np.random.dirichlet(self.alpha * p, size)
+        for _ in range(10):
+            nan_rows = np.isnan(proportions).any(axis=1)
+            if not nan_rows.any(): return proportions
+            proportions[nan_rows] = np.random.dirichlet(self.alpha * p, int(nan_rows.sum()))
+        # the draws of a too small alpha degrade to the one-hot proportions in the limit of alpha->0
+        nan_rows = np.flatnonzero(np.isnan(proportions).any(axis=1))
+        proportions[nan_rows] = 0.0
+        proportions[nan_rows, np.random.choice(len(p), len(nan_rows), p=p)] = 1.0
+        return proportions
+
+    def fit_proportions(self, proportions, samples_per_client, p):
+        """
+        Let the label distribution of the union of the clients' data approach p by swapping the proportion of one
+        client for the best of the candidate proportions at each iteration, where the mixture of the proportions
+        weighted by the local data sizes is updated incrementally.
+        :param
+            proportions: the (num_clients x num_classes) array of the label proportions of clients
+            samples_per_client: the array of the local data sizes
+            p: the label distribution of the whole data
+        :return
+            the fitted proportions
+        """
+        total = samples_per_client.sum()
+        mixture = samples_per_client @ proportions
+        error = ((mixture / total - p) ** 2).sum()
+        max_error = self.error_bound / len(p)
+        # the clients with more data have larger effects on the mixture
+        order = np.argsort(-samples_per_client, kind='stable')
+        for it in range(self.max_iter):
+            if error <= max_error: break
+            cid = order[it % self.num_clients]
+            candidates = self.draw_proportions(p, self.num_candidates)
+            alter_mixtures = (mixture - samples_per_client[cid] * proportions[cid]) + samples_per_client[cid] * candidates
+            alter_errors = ((alter_mixtures / total - p) ** 2).sum(axis=1)
+            best = np.argmin(alter_errors)
+            if alter_errors[best] < error:
+                proportions[cid] = candidates[best]
+                mixture, error = alter_mixtures[best], alter_errors[best]
+        return proportions
+
     def __call__(self, data):
-        attrs = [d[self.flag_index] for d in data]
-        num_attrs = len(set(attrs))
-        samples_per_client = self.data_imbalance_generator(self.num_clients, len(data), self.imbalance)
-        # count the label distribution
-        lb_counter = collections.Counter(attrs)
-        p = np.array([1.0 * v / len(data) for v in lb_counter.values()])
-        lb_dict = {}
-        attrs = np.array(attrs)
-        for lb in range(len(lb_counter.keys())):
-            lb_dict[lb] = np.where(attrs == lb)[0]
-        proportions = [np.random.dirichlet(self.alpha * p) for _ in range(self.num_clients)]
-        while np.any(np.isnan(proportions)):
-            proportions = [np.random.dirichlet(self.alpha * p) for _ in range(self.num_clients)]
-        sorted_cid_map = {k: i for k, i in zip(np.argsort(samples_per_client), [_ for _ in range(self.num_clients)])}
-        error_increase_interval = 500
-        max_error = 1e-6 / num_attrs
-        loop_count = 0
-        crt_id = 0
-        crt_error = 100000
-        while True:
-            if loop_count >= error_increase_interval:
-                loop_count = 0
-                max_error = max_error * 10
-            # generate dirichlet distribution till ||E(proportion) - P(D)||<=1e-5*self.num_classes
-            mean_prop = np.sum([pi * di for pi, di in zip(proportions, samples_per_client)], axis=0)
-            mean_prop = mean_prop / mean_prop.sum()
-            error_norm = ((mean_prop - p) ** 2).sum()
-            if crt_error - error_norm >= max_error:
-                print("Error: {:.8f}".format(error_norm))
-                crt_error = error_norm
-            if error_norm <= max_error:
-                break
-            excid = sorted_cid_map[crt_id]
-            crt_id = (crt_id + 1) % self.num_clients
-            sup_prop = [np.random.dirichlet(self.alpha * p) for _ in range(self.num_clients)]
-            del_prop = np.sum([pi * di for pi, di in zip(proportions, samples_per_client)], axis=0)
-            del_prop -= samples_per_client[excid] * proportions[excid]
-            for i in range(error_increase_interval-loop_count):
-                alter_norms = []
-                for cid in range(self.num_clients):
-                    if np.any(np.isnan(sup_prop[cid])):
-                        continue
-                    alter_prop = del_prop + samples_per_client[excid] * sup_prop[cid]
-                    alter_prop = alter_prop / alter_prop.sum()
-                    error_alter = ((alter_prop - p) ** 2).sum()
-                    alter_norms.append(error_alter)
-                if min(alter_norms)<error_norm:
-                    break
-            if len(alter_norms) > 0 and min(alter_norms) < error_norm:
-                alcid = np.argmin(alter_norms)
-                proportions[excid] = sup_prop[alcid]
-            loop_count += 1
-        local_datas = [[] for _ in range(self.num_clients)]
-        self.dirichlet_dist = []  # for efficiently visualizing
-        for lb in lb_counter.keys():
-            lb_idxs = lb_dict[lb]
-            lb_proportion = np.array([pi[lb] * si for pi, si in zip(proportions, samples_per_client)])
-            lb_proportion = lb_proportion / lb_proportion.sum()
-            lb_proportion = (np.cumsum(lb_proportion) * len(lb_idxs)).astype(int)[:-1]
-            lb_datas = np.split(lb_idxs, lb_proportion)
-            self.dirichlet_dist.append([len(lb_data) for lb_data in lb_datas])
-            local_datas = [local_data + lb_data.tolist() for local_data, lb_data in zip(local_datas, lb_datas)]
-        self.dirichlet_dist = np.array(self.dirichlet_dist).T
+        attrs = flabel.get_labels(data, self.flag_index)
+        labels, targets, counts = np.unique(attrs, return_inverse=True, return_counts=True)
+        targets = targets.reshape(-1)
+        p = counts / len(data)
+        samples_per_client = np.array(self.data_imbalance_generator(self.num_clients, len(data), self.imbalance))
+        proportions = self.fit_proportions(self.draw_proportions(p, self.num_clients), samples_per_client, p)
+        # split the samples of each label according to the label proportions weighted by the local data sizes
+        lb_proportion = proportions * samples_per_client[:, None]
+        lb_proportion = lb_proportion / lb_proportion.sum(axis=0, keepdims=True)
+        bounds = (np.cumsum(lb_proportion, axis=0) * counts).astype(int)
+        bounds[-1] = counts
+        # the (num_clients x num_classes) numbers of samples
+        self.dirichlet_dist = np.diff(np.vstack([np.zeros((1, len(labels)), dtype=bounds.dtype), bounds]), axis=0)
+        # the samples sorted by labels are assigned to the clients label by label
+        sorted_samples = np.argsort(targets, kind='stable')
+        owners = np.repeat(np.tile(np.arange(self.num_clients), len(labels)), self.dirichlet_dist.T.reshape(-1))
+        sorted_samples = sorted_samples[np.argsort(owners, kind='stable')]
+        local_datas = np.split(sorted_samples, np.cumsum(self.dirichlet_dist.sum(axis=1))[:-1])
         for i in range(self.num_clients): np.random.shuffle(local_datas[i])
+        local_datas = [ld.tolist() for ld in local_datas]
         self.local_datas = local_datas
         return local_datas
 
@@ -170,15 +184,14 @@ class DiversityPartitioner(BasicPartitioner):
         return name
 
     def __call__(self, data):
-        labels = [d[self.flag_index] for d in data]
-        num_classes = len(set(labels))
-        dpairs = [[did, lb] for did,lb in zip(list(range(len(data))), labels)]
+        labels = flabel.get_labels(data, self.flag_index)
+        num_classes = len(np.unique(labels))
         num = max(int(self.diversity* num_classes), 1)
         K = num_classes
         local_datas = [[] for _ in range(self.num_clients)]
         if num == K:
             for k in range(K):
-                idx_k = [p[0] for p in dpairs if p[1] == k]
+                idx_k = np.flatnonzero(labels == k).tolist()
                 np.random.shuffle(idx_k)
                 split = np.array_split(idx_k, self.num_clients)
                 for cid in range(self.num_clients):
@@ -198,7 +211,7 @@ class DiversityPartitioner(BasicPartitioner):
                         times[ind] += 1
                 contain.append(current)
             for k in range(K):
-                idx_k = [p[0] for p in dpairs if p[1] == k]
+                idx_k = np.flatnonzero(labels == k).tolist()
                 np.random.shuffle(idx_k)
                 split = np.array_split(idx_k, times[k])
                 ids = 0
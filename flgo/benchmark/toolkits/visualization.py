@@ -4,10 +4,11 @@ import matplotlib.colors
 import collections
 import numpy as np
 import os
+import flgo.utils.flabel as flabel
 
 def visualize_by_class(generator, partitioner):
-    all_labels = [d[-1] for d in generator.train_data]
-    num_classes = len(set(all_labels))
+    all_labels = flabel.get_labels(generator.train_data)
+    num_classes = len(np.unique(all_labels))
     ax = plt.subplots()
     colors = [key for key in matplotlib.colors.CSS4_COLORS.keys()]
     random.shuffle(colors)
@@ -28,8 +29,7 @@ def visualize_by_class(generator, partitioner):
         data_columns = [len(cidx) for cidx in generator.local_datas]
         row_map = {k: i for k, i in zip(np.argsort(data_columns), [_ for _ in range(generator.partitioner.num_clients)])}
         for cid, cidxs in enumerate(generator.local_datas):
-            labels = [int(generator.train_data[did][-1]) for did in cidxs]
-            lb_counter = collections.Counter(labels)
+            lb_counter = collections.Counter(all_labels[np.asarray(cidxs, dtype=np.int64)].astype(np.int64).tolist())
             offset = 0
             y_bottom = row_map[cid] - client_height / 2.0
             y_top = row_map[cid] + client_height / 2.0
@@ -9,6 +9,7 @@ import collections
 import copy
 import matplotlib as mpl
 import prettytable as pt
+from flgo.experiment.logger.basic_logger import RecordStream
 try:
     import ujson as json
 except:
@@ -19,9 +20,16 @@ class Record:
         self.task = task
         self.name = name
         self.rec_path = os.path.join(task, 'record', name)
-        with open(self.rec_path, 'r') as inf:
-            s_inf = inf.read()
-            rec = json.loads(s_inf)
+        if name.endswith('.jsonl'):
+            # the streaming record is read line by line
+            rec = RecordStream(self.rec_path).read()
+            # organized as the saved record, where only the values of the latest round of the keys containing '_dist' are kept
+            for key in rec.keys():
+                if '_dist' in key and len(rec[key]) > 0: rec[key] = rec[key][-1]
+        else:
+            with open(self.rec_path, 'r') as inf:
+                s_inf = inf.read()
+                rec = json.loads(s_inf)
         self.data = rec
         self.set_communication_round()
         self.set_client_id()
@@ -91,6 +99,8 @@ class Selector:
             # check headers
             for header in self.headers:
                 tmp.extend([f for f in all_records if f.startswith(header) and f.endswith('.json')])
+                # the streaming records of the unfinished runs
+                tmp.extend([f for f in all_records if f.startswith(header) and f.endswith('.jsonl') and f[:-1] not in all_records])
             res[task] = self.filename_filter(tmp, self.filter)
         return res
 
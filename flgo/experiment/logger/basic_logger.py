@@ -8,6 +8,75 @@ try:
 except:
     import json
 
+def _to_jsonable(x):
+    if isinstance(x, np.generic): return x.item()
+    if isinstance(x, np.ndarray): return x.tolist()
+    if isinstance(x, (list, tuple)): return [_to_jsonable(xi) for xi in x]
+    if isinstance(x, dict): return {k: _to_jsonable(v) for k, v in x.items()}
+    return x
+
+class RecordStream:
+    """
+    The append-only record file, where each line is a json object. The first line contains the
+    option of the experiment, and each of the following lines contains the round and the values
+    appended to the output of the logger since the previous line (i.e. {'round': r, 'data': {...}}).
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def create(self, option):
+        with open(self.filepath, 'w') as outf:
+            outf.write(json.dumps({'option': _to_jsonable(option)}) + '\n')
+
+    def append(self, round, data):
+        with open(self.filepath, 'a') as outf:
+            outf.write(json.dumps({'round': round, 'data': _to_jsonable(data)}) + '\n')
+            outf.flush()
+
+    def truncate(self, round):
+        """Remove the lines written after `round` (e.g. when resuming from the checkpoint of `round`)"""
+        lines = []
+        for rec, line in self.iter_lines(with_raw=True):
+            if 'round' in rec and rec['round'] > round: break
+            lines.append(line)
+        tmp_path = self.filepath + '.tmp'
+        with open(tmp_path, 'w') as outf:
+            outf.writelines(lines)
+        os.replace(tmp_path, self.filepath)
+
+    def iter_lines(self, with_raw=False):
+        with open(self.filepath, 'r') as inf:
+            for line in inf:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # the last line may be incomplete if the run crashed while writing it
+                    break
+                yield (rec, line) if with_raw else rec
+
+    def read(self, keep_dist=False):
+        """
+        Read the output line by line, where only the values of the latest round of the keys containing '_dist'
+        are kept unless keep_dist is True
+        :param
+            keep_dist: keep the values of all the rounds for the keys containing '_dist'
+        :return
+            output: a dict that has the same form as `Logger.output` (i.e. each key is mapped to the list of its
+            values of the rounds) with the option, which is organized into the saved record by `Logger.organize_output`
+        """
+        output = collections.defaultdict(list)
+        option = None
+        for rec in self.iter_lines():
+            if 'option' in rec:
+                option = rec['option']
+                continue
+            for key, values in rec['data'].items():
+                if '_dist' in key and not keep_dist: output[key] = values[-1:]
+                else: output[key].extend(values)
+        output = dict(output)
+        output['option'] = option
+        return output
+
 class Logger(logging.Logger):
 
     _LEVEL = {
@@ -31,6 +100,9 @@ class Logger(logging.Logger):
         self.temp = "{:<30s}{:.4f}"
         self.time_costs = []
         self.time_buf = {}
+        # the streaming record and the number of the values of each key that have been written into it
+        self.record_stream = None
+        self._num_streamed = {}
         self.formatter = logging.Formatter('%(asctime)s %(filename)s %(funcName)s [line:%(lineno)d] %(levelname)s %(message)s')
         self.handler_list = []
         self.overwrite = not self.option['no_overwrite']
@@ -77,6 +149,7 @@ class Logger(logging.Logger):
     def save_output_as_json(self, filepath=None):
         """Save the self.output as .json file"""
         if len(self.output) == 0: return
+        self.restore_streamed_dist()
         self.organize_output()
         self.output_to_jsonable_dict()
         if filepath is None:
@@ -96,6 +169,79 @@ class Logger(logging.Logger):
                 json.dump(dict(self.output), outf)
         except:
             self.error('Failed to save flw.logger.output as results')
+        # save the summary of the profiler as `filepath` with the suffix '.profile'
+        if getattr(self, 'profiler', None) is not None:
+            try:
+                self.profiler.save(os.path.splitext(filepath)[0] + '.profile')
+            except:
+                self.error('Failed to save the summary of the profiler')
+
+    def get_record_stream(self):
+        if self.record_stream is None:
+            filepath = os.path.join(self.get_output_path(), os.path.splitext(self.get_output_name())[0] + '.jsonl')
+            self.record_stream = RecordStream(filepath)
+        return self.record_stream
+
+    def flush_record(self):
+        """
+        Append the values added into self.output since the last flushing to the streaming record, and only keep
+        the latest values of the keys containing '_dist' in memory. This method is called after each `log_once`.
+        """
+        if not self.option.get('stream_record', False): return
+        stream = self.get_record_stream()
+        if len(self._num_streamed) == 0: stream.create(self.option)
+        data = {}
+        for key, values in self.output.items():
+            if not isinstance(values, list): continue
+            num_streamed = self._num_streamed.get(key, 0)
+            if len(values) > num_streamed: data[key] = values[num_streamed:]
+            if '_dist' in key: self.output[key] = values[-1:]
+            self._num_streamed[key] = len(self.output[key])
+        stream.append(self.current_round, data)
+        return
+
+    def restore_streamed_dist(self):
+        """Restore the values of all the rounds of the keys containing '_dist' from the streaming record"""
+        if not self.option.get('stream_record', False) or len(self._num_streamed) == 0: return
+        stream = self.get_record_stream()
+        if not os.path.exists(stream.filepath): return
+        streamed = stream.read(keep_dist=True)
+        for key, values in streamed.items():
+            if '_dist' not in key or not isinstance(self.output.get(key, None), list): continue
+            # the streamed values of the key are followed by the ones that have not been flushed yet
+            self.output[key] = values + self.output[key][self._num_streamed.get(key, 0):]
+            self._num_streamed[key] = len(self.output[key])
+        return
+
+    def resume_record(self, round):
+        """Restore self.output from the streaming record written until `round`"""
+        stream = self.get_record_stream()
+        if not os.path.exists(stream.filepath): return
+        stream.truncate(round)
+        output = stream.read(keep_dist=True)
+        output.pop('option', None)
+        self.output = collections.defaultdict(list)
+        for key, values in output.items():
+            self.output[key] = values[-1:] if '_dist' in key else values
+            self._num_streamed[key] = len(self.output[key])
+        return
+
+    def get_checkpoint_state(self):
+        return {
+            'output': dict(self.output),
+            'current_round': self.current_round,
+            'num_streamed': dict(self._num_streamed),
+            'early_stop': (self._es_counter, self._es_best_score, self._es_best_round),
+        }
+
+    def load_checkpoint_state(self, state):
+        self.output = collections.defaultdict(list, state['output'])
+        self.current_round = state['current_round']
+        self._es_counter, self._es_best_score, self._es_best_round = state['early_stop']
+        self._num_streamed = dict(state['num_streamed'])
+        # discard the lines streamed after the checkpoint
+        stream = self.get_record_stream()
+        if len(self._num_streamed) > 0 and os.path.exists(stream.filepath): stream.truncate(self.current_round)
 
     def check_is_jsonable(self, x):
         try:
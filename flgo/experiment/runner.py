@@ -1,4 +1,3 @@
-import pynvml
 import time
 import queue
 import sys
@@ -8,9 +7,13 @@ import prettytable as pt
 import argparse
 import yaml
 import itertools
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
 
-pynvml.nvmlInit()
-NUM_DEVICES = pynvml.nvmlDeviceGetCount()
+# the number of GPUs, which is initialized by init_devices()
+NUM_DEVICES = 0
 # The maximum of the allocated memory(MB) of a gpu to a command
 LEAST_FREE_MEMORY = 100
 # run commands if device is being available for more than AVAILABLE_INTERVAL (seconds)
@@ -41,6 +44,35 @@ def read_option():
         config = yaml.load(f, Loader=yaml.FullLoader)
     return config
 
+def init_devices():
+    global NUM_DEVICES
+    NUM_DEVICES = 0
+    if pynvml is not None:
+        try:
+            pynvml.nvmlInit()
+            NUM_DEVICES = pynvml.nvmlDeviceGetCount()
+        except pynvml.NVMLError:
+            NUM_DEVICES = 0
+    return NUM_DEVICES
+
+def config2options(cfg):
+    """
+    Expand the grid of the configuration into the options of runs in the same way as config2cmd
+    :param
+        cfg: a dict where the values of lists are the candidates of the options
+    :return
+        a list of the options (i.e. dicts) of the runs
+    """
+    list_kv = [(k,v) for k,v in cfg.items() if k!='gpu' and type(v) is list]
+    list_k = [e[0] for e in list_kv]
+    common_part = {k:v for k,v in cfg.items() if k!='gpu' and k not in list_k}
+    options = []
+    for c in itertools.product(*[e[1] for e in list_kv]):
+        option = dict(common_part)
+        option.update(zip(list_k, c))
+        options.append(option)
+    return options
+
 def config2cmd(cfg):
     cmds = []
     list_kv = [(k,v) for k,v in cfg.items() if k!='gpu' and type(v) is list]
@@ -197,44 +229,46 @@ class DeviceManager:
                                  stdin=subprocess.PIPE)
             self.pool.add(p)
 
-# init dev
-dev_list = [DeviceManager(i) for i in range(NUM_DEVICES)]
-dev_list.append(DeviceManager(-1))
-config = read_option()
-cmds = config2cmd(config)
-num_cmds = len(cmds)
-# initialize queues of devices with cmds
-num_effective_cmds = 0
-
-# 要改####################################
-for cmd in cmds:
-    if cmd[-1] == '\n':
-        cmd = cmd[:-1]
-    cmd = cmd.strip()
-    if cmd == "":
-        continue
-    num_effective_cmds += 1
-    cmd = BIN_DIR + cmd
-    # choose device
-    idx = cmd.find('gpu')
-    if idx == -1:
-        dev_list[-1].put_cmd(cmd)
-    else:
-        id = int(cmd[idx + 4])
-        dev_list[id].put_cmd(cmd)
-
-for dev in dev_list:
-    dev.num_commands = dev.cmd_queue.qsize()
+if __name__ == '__main__':
+    # init dev
+    init_devices()
+    dev_list = [DeviceManager(i) for i in range(NUM_DEVICES)]
+    dev_list.append(DeviceManager(-1))
+    config = read_option()
+    cmds = config2cmd(config)
+    num_cmds = len(cmds)
+    # initialize queues of devices with cmds
+    num_effective_cmds = 0
 
-while True:
-    num_finished = sum([dm.num_finished for dm in dev_list])
-    output_table(dev_list)
-    for dm in dev_list:
-        dm.flush()
     # 要改####################################
-    num_running = sum([d.num_processing for d in dev_list])
-    num_unfinished = sum([d.cmd_queue.qsize() for d in dev_list])
-    if num_finished >= num_effective_cmds or (num_running == 0 and num_unfinished == 0):
+    for cmd in cmds:
+        if cmd[-1] == '\n':
+            cmd = cmd[:-1]
+        cmd = cmd.strip()
+        if cmd == "":
+            continue
+        num_effective_cmds += 1
+        cmd = BIN_DIR + cmd
+        # choose device
+        idx = cmd.find('gpu')
+        if idx == -1:
+            dev_list[-1].put_cmd(cmd)
+        else:
+            id = int(cmd[idx + 4])
+            dev_list[id].put_cmd(cmd)
+
+    for dev in dev_list:
+        dev.num_commands = dev.cmd_queue.qsize()
+
+    while True:
+        num_finished = sum([dm.num_finished for dm in dev_list])
         output_table(dev_list)
-        break
-    time.sleep(CHECK_INTERVAL)
+        for dm in dev_list:
+            dm.flush()
+        # 要改####################################
+        num_running = sum([d.num_processing for d in dev_list])
+        num_unfinished = sum([d.cmd_queue.qsize() for d in dev_list])
+        if num_finished >= num_effective_cmds or (num_running == 0 and num_unfinished == 0):
+            output_table(dev_list)
+            break
+        time.sleep(CHECK_INTERVAL)
@@ -0,0 +1,233 @@
+"""
+A sweep executor for the grid of hyper-parameters on CPUs. The grid in the YAML configuration
+(the same as the one of runner.py) is expanded into the options of runs, and each run is
+executed in a process forked from the sweeper that calls `flgo.init(...).run()` in-process.
+The runs are scheduled over the CPU cores with a cap of threads for each run. Before forking
+the first run on a task, the sweeper loads the task data into its own memory, so that all the
+runs on the same task (with the same seed and holdout options) share the loaded data through
+fork instead of loading it again. The result of each attempt (i.e. success, failure with the
+traceback, or timeout) is appended to a line-oriented log, the failed runs are retried, and the
+runs that have succeeded in the log are skipped when the sweep is restarted.
+
+Example:
+    python sweeper.py run_config.yml --threads 2 --retries 1
+"""
+import argparse
+import collections
+import importlib
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import yaml
+import prettytable as pt
+try:
+    import ujson as json
+except:
+    import json
+from flgo.experiment.runner import config2options, clear_screen
+
+# check interval (seconds)
+CHECK_INTERVAL = 1
+
+def read_option():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config')
+    parser.add_argument('--threads', help='the number of threads used by each run', type=int, default=1)
+    parser.add_argument('--num_procs', help='the number of runs executed simultaneously, and 0 means using all the cores', type=int, default=0)
+    parser.add_argument('--retries', help='the number of times to retry a failed run', type=int, default=1)
+    parser.add_argument('--timeout', help='the maximum time (seconds) of a run, and 0 means no limit', type=float, default=0)
+    parser.add_argument('--log', help="the log of the attempts of runs, and empty means 'config_name.sweep.jsonl'", type=str, default='')
+    parser.add_argument('--no_preload', help='not to share the task data with the runs by loading it before forking', action="store_true", default=False)
+    try:
+        option = vars(parser.parse_args())
+    except IOError as msg:
+        parser.error(str(msg))
+    if option['log'] == '': option['log'] = os.path.splitext(option['config'])[0] + '.sweep.jsonl'
+    with open(option['config']) as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    return option, config
+
+def get_run_name(option):
+    return ' '.join(['--{} {}'.format(k, v) for k, v in sorted(option.items())])
+
+def load_algorithm(name):
+    # the algorithm is either in flgo.algorithm or a module that can be imported from the working directory
+    try:
+        return importlib.import_module('.'.join(['flgo', 'algorithm', name]))
+    except ImportError:
+        return importlib.import_module(name)
+
+def run(option, threads, conn):
+    """
+    Execute the run in the forked process and send the traceback to the sweeper if it fails
+    :param
+        option: the option of the run
+        threads: the number of threads of the run
+        conn: the connection to the sweeper
+    """
+    try:
+        import torch
+        import flgo
+        torch.set_num_threads(threads)
+        # the arguments of the sweeper shouldn't be parsed as the options of the run
+        sys.argv = sys.argv[:1]
+        option = dict(option)
+        task, algorithm, model = option.pop('task'), load_algorithm(option.pop('algorithm')), option.pop('model', '')
+        option['cache_task_data'] = True
+        option['gpu'] = []
+        flgo.init(task, algorithm, option, model_name=model).run()
+        conn.send(None)
+    except BaseException:
+        conn.send(traceback.format_exc())
+        conn.close()
+        raise
+
+class Sweeper:
+    def __init__(self, options, threads=1, num_procs=0, retries=1, timeout=0, log='', preload=True):
+        """
+        :param
+            options: the options of the runs
+            threads: the number of threads used by each run
+            num_procs: the number of runs executed simultaneously, and 0 means os.cpu_count()//threads
+            retries: the number of times to retry a failed run
+            timeout: the maximum time (seconds) of a run, and 0 means no limit
+            log: the path of the log of attempts, where the runs that have succeeded will be skipped
+            preload: load the task data before forking the runs on the task
+        """
+        self.threads = max(1, threads)
+        self.num_procs = num_procs if num_procs > 0 else max(1, (os.cpu_count() or 1) // self.threads)
+        self.retries = retries
+        self.timeout = timeout
+        self.log = log
+        self.preload = preload
+        self.ctx = multiprocessing.get_context('fork')
+        finished = self.read_finished_runs()
+        # the runs on the same task data are scheduled consecutively so that the preloaded data can be released early
+        self.pending = collections.deque(sorted([o for o in options if get_run_name(o) not in finished], key=self.get_data_key))
+        self.num_total = len(options)
+        self.num_skipped = self.num_total - len(self.pending)
+        self.num_finished = 0
+        self.failed = []
+        self.attempts = collections.defaultdict(int)
+        self.running = {}
+        # the keys of the preloaded data in the sweeper and the ones in the cache of fflow
+        self.preloaded = {}
+
+    def read_finished_runs(self):
+        finished = set()
+        if self.log == '' or not os.path.exists(self.log): return finished
+        with open(self.log, 'r') as inf:
+            for line in inf:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec['status'] == 'finished': finished.add(rec['run'])
+        return finished
+
+    def get_data_key(self, option):
+        # the same key as the cache of fflow, so that the runs sharing the key share the preloaded data
+        import flgo.utils.fflow as fflow
+        run_option = fflow.merge_option({k: v for k, v in option.items() if k not in ['task', 'algorithm', 'model']})
+        run_option['task'] = option['task']
+        return fflow.get_task_data_key(run_option)
+
+    def write_log(self, option, status, error=None, duration=0.0):
+        if self.log == '': return
+        with open(self.log, 'a') as outf:
+            outf.write(json.dumps({'run': get_run_name(option), 'option': option, 'status': status, 'attempt': self.attempts[get_run_name(option)], 'duration': duration, 'error': error}) + '\n')
+
+    def preload_task_data(self, option):
+        import flgo.utils.fflow as fflow
+        key = self.get_data_key(option)
+        if key in self.preloaded: return
+        # release the data that won't be used by the pending runs, since the running ones hold their own copies
+        pending_keys = set([self.get_data_key(o) for o in self.pending])
+        for k in [k for k in self.preloaded if k not in pending_keys]:
+            fflow.clear_task_data_cache(self.preloaded.pop(k))
+        try:
+            run_option = {k: v for k, v in option.items() if k not in ['task', 'algorithm', 'model']}
+            self.preloaded[key] = fflow.preload_task_data(option['task'], run_option)
+        except Exception:
+            # the runs will load the data by themselves
+            traceback.print_exc()
+
+    def launch(self, option):
+        if self.preload: self.preload_task_data(option)
+        recv_conn, send_conn = self.ctx.Pipe(duplex=False)
+        p = self.ctx.Process(target=run, args=(option, self.threads, send_conn), daemon=False)
+        p.start()
+        send_conn.close()
+        self.attempts[get_run_name(option)] += 1
+        # the option, the connection, the start time and the message received from the run
+        self.running[p] = [option, recv_conn, time.time(), None]
+
+    def receive(self, p):
+        # the message is received as soon as it's sent so that the run won't be blocked by a full pipe
+        conn = self.running[p][1]
+        try:
+            if not conn.closed and conn.poll(): self.running[p][3] = ('received', conn.recv())
+        except EOFError:
+            conn.close()
+
+    def collect(self):
+        for p in list(self.running.keys()):
+            self.receive(p)
+            option, conn, start_time, message = self.running[p]
+            duration = time.time() - start_time
+            if p.is_alive():
+                if self.timeout > 0 and duration > self.timeout:
+                    p.terminate()
+                    p.join()
+                    self.finish(p, 'timeout', 'The run exceeded {} seconds'.format(self.timeout), duration)
+                continue
+            p.join()
+            self.receive(p)
+            message = self.running[p][3]
+            error = message[1] if message is not None else 'The process exited with code {}'.format(p.exitcode)
+            self.finish(p, 'finished' if error is None and p.exitcode == 0 else 'failed', error, duration)
+
+    def finish(self, p, status, error, duration):
+        option, conn = self.running.pop(p)[:2]
+        conn.close()
+        self.write_log(option, status, error, duration)
+        if status == 'finished':
+            self.num_finished += 1
+        elif self.attempts[get_run_name(option)] <= self.retries:
+            self.pending.appendleft(option)
+        else:
+            self.failed.append(option)
+
+    def output_table(self):
+        tb = pt.PrettyTable()
+        tb.title = "Sweep on {} processes x {} threads".format(self.num_procs, self.threads)
+        tb.field_names = ['Finished\\Total', 'Skipped', 'Running', 'Pending', 'Failed']
+        tb.add_row(["{}\\{}".format(self.num_finished + self.num_skipped, self.num_total), self.num_skipped, len(self.running), len(self.pending), len(self.failed)])
+        clear_screen()
+        print(tb)
+
+    def run(self, verbose=True):
+        """
+        Execute all the runs
+        :return
+            the options of the runs that failed after retrying
+        """
+        while len(self.pending) > 0 or len(self.running) > 0:
+            while len(self.pending) > 0 and len(self.running) < self.num_procs:
+                self.launch(self.pending.popleft())
+            self.collect()
+            if verbose: self.output_table()
+            time.sleep(CHECK_INTERVAL)
+        return self.failed
+
+if __name__ == '__main__':
+    option, config = read_option()
+    sys.argv = sys.argv[:1]
+    # the sweeper only loads the task data, and the threads of each run are set after forking
+    import torch
+    torch.set_num_threads(1)
+    sweeper = Sweeper(config2options(config), option['threads'], option['num_procs'], option['retries'], option['timeout'], option['log'], not option['no_preload'])
+    failed = sweeper.run()
+    for o in failed: print('Failed: ' + get_run_name(o))
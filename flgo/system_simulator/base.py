@@ -1,8 +1,9 @@
-import sys
-
 import numpy as np
-import queue
+import heapq
+import itertools
+import collections
 import config as cfg
+from flgo.utils import fcompress
 from abc import ABCMeta, abstractmethod
 import functools
 
@@ -24,33 +25,73 @@ def seed_generator(seed=0):
         seed+=1
 
 def size_of_package(package):
+    """
+    Compute the size of the package in bytes. The package can report its own size (e.g. the size after
+    compression) by the key '__size', and each item in the package reports its size by `__sizeof__`
+    (e.g. FModule caches its size).
+    :param
+        package: a dict
+    :return
+        the size of the package
+    """
+    if package is None: return 0
+    if '__size' in package: return package['__size']
     size = 0
     for v in package.values():
-        if type(v) is torch.Tensor:
-            size += sys.getsizeof(v.storage())
+        if isinstance(v, torch.Tensor):
+            size += v.nelement() * v.element_size()
         else:
             size += v.__sizeof__()
     return size
 
 class ElemClock:
+    """
+    The clock of the system that also holds the elements (e.g. packages) arriving in the future. The elements are
+    kept in a binary heap ordered by their arrival time (and then the order of being put), and the elements with
+    keys (e.g. the client id of a package) are indexed by their keys so that they can be cancelled lazily in O(1)
+    and be discarded when reaching the top of the heap.
+    """
     class Elem:
-        def __init__(self, x, time):
+        def __init__(self, x, time, key=None, order=0):
             self.x = x
             self.time = time
+            self.key = key
+            self.order = order
+            self.cancelled = False
 
         def __str__(self):
             return '{} at Time {}'.format(self.x, self.time)
 
         def __lt__(self, other):
-            return self.time < other.time
-
-    def __init__(self):
-        self.q = queue.PriorityQueue()
+            return (self.time, self.order) < (other.time, other.order)
+
+    def __init__(self, event_skipping=False):
+        """
+        :param
+            event_skipping: if True, the states of the system are flushed only once for each step of
+            the clock by integrating over the elapsed time, which allows the clock to jump to the next event.
+            The step is split at the moments when the availability of clients may change (i.e.
+            state_updater.get_time_to_availability_change()) since it's assumed unchanged during each flush
+        """
+        self.q = []
+        self.index = collections.defaultdict(list)
+        self.counter = itertools.count()
+        self.size = 0
         self.time = 0
         self.state_updater = None
+        self.event_skipping = event_skipping
 
     def step(self, delta_t=1):
         if delta_t < 0: raise RuntimeError("Cannot inverse time of system_simulator.cfg.clock.")
+        if self.state_updater is not None and self.event_skipping:
+            # the jump is split where the availability may change since it's assumed unchanged during each flush
+            while delta_t > 0:
+                dt = self.state_updater.get_time_to_availability_change() if hasattr(self.state_updater, 'get_time_to_availability_change') else 1
+                dt = delta_t if dt is None else min(max(int(dt), 1), delta_t)
+                self.state_updater.flush(dt)
+                self.time += dt
+                delta_t -= dt
+            return
         if self.state_updater is not None:
             for t in range(delta_t):
                 self.state_updater.flush()
@@ -60,58 +101,137 @@ class ElemClock:
         if t < self.time: raise RuntimeError("Cannot inverse time of system_simulator.cfg.clock.")
         self.time = t
 
-    def put(self, x, time):
-        self.q.put_nowait(self.Elem(x, time))
+    def put(self, x, time, key=None):
+        """
+        Put the element x that will arrive at `time` into the clock
+        :param
+            x: the element
+            time: the arrival time
+            key: the key to index the element, which is x['__cid'] by default if x is a package
+        """
+        if key is None and isinstance(x, dict): key = x.get('__cid', None)
+        elem = self.Elem(x, time, key, next(self.counter))
+        heapq.heappush(self.q, elem)
+        if key is not None: self.index[key].append(elem)
+        self.size += 1
+
+    def _top(self):
+        # discard the cancelled elements on the top of the heap
+        while len(self.q) > 0 and self.q[0].cancelled: heapq.heappop(self.q)
+        return self.q[0] if len(self.q) > 0 else None
+
+    def _pop(self):
+        elem = self._top()
+        heapq.heappop(self.q)
+        self.size -= 1
+        if elem.key is not None:
+            self.index[elem.key].remove(elem)
+            if len(self.index[elem.key]) == 0: self.index.pop(elem.key)
+        return elem
+
+    def peek(self):
+        """Return the earliest element without removing it, or None if the clock is empty"""
+        elem = self._top()
+        return None if elem is None else elem.x
+
+    def next_arrival_time(self):
+        """Return the earliest time of the elements in the clock, or None if the clock is empty"""
+        elem = self._top()
+        return None if elem is None else elem.time
 
     def get(self):
-        if self.q.empty(): return None
-        return self.q.get().x
+        if self.empty(): return None
+        return self._pop().x
 
     def get_until(self, t):
         res = []
-        while not self.empty():
-            elem = self.q.get()
-            if elem.time > t:
-                self.put(elem.x, elem.time)
-                break
-            pkg = elem.x
-            res.append(pkg)
+        while not self.empty() and self._top().time <= t:
+            res.append(self._pop().x)
         return res
 
     def get_sofar(self):
         return self.get_until(self.current_time)
 
     def gets(self):
-        if self.empty(): return []
         res = []
-        while not self.empty(): res.append(self.q.get())
-        res = [rx.x for rx in res]
+        while not self.empty(): res.append(self._pop().x)
         return res
 
     def clear(self):
-        while not self.empty():
-            self.get()
+        self.q = []
+        self.index = collections.defaultdict(list)
+        self.size = 0
+
+    def cancel(self, keys):
+        """
+        Cancel all the elements with the keys (e.g. the packages of the overdue clients)
+        :param
+            keys: a list of keys
+        """
+        for key in keys:
+            for elem in self.index.pop(key, []):
+                elem.cancelled = True
+                self.size -= 1
+        return
 
     def conditionally_clear(self, f):
-        buf = []
-        while not self.empty(): buf.append(self.q.get())
-        for elem in buf:
-            if not f(elem.x): self.q.put_nowait(elem)
+        for elem in self.q:
+            if not elem.cancelled and f(elem.x):
+                elem.cancelled = True
+                self.size -= 1
+                if elem.key is not None:
+                    self.index[elem.key].remove(elem)
+                    if len(self.index[elem.key]) == 0: self.index.pop(elem.key)
+        self.q = [elem for elem in self.q if not elem.cancelled]
+        heapq.heapify(self.q)
         return
 
     def empty(self):
-        return self.q.empty()
+        return self.size == 0
 
     @ property
     def current_time(self):
         return self.time
 
+    def get_checkpoint_state(self):
+        """Return the time and the elements that haven't arrived (in the order of the heap) of the clock"""
+        elems = sorted([elem for elem in self.q if not elem.cancelled])
+        return {'time': self.time, 'elems': [(elem.x, elem.time, elem.key, elem.order) for elem in elems], 'next_order': next(self.counter)}
+
+    def load_checkpoint_state(self, state):
+        self.clear()
+        self.time = state['time']
+        for x, time, key, order in state['elems']:
+            elem = self.Elem(x, time, key, order)
+            self.q.append(elem)
+            if key is not None: self.index[key].append(elem)
+            self.size += 1
+        # the sorted list is already a heap
+        self.counter = itertools.count(state['next_order'])
+
     def register_state_updater(self, state_updater):
         self.state_updater = state_updater
 
+class ClientStates:
+    """The read-only view of the states of clients, where client_states[cid] is the name of the state of client cid"""
+    def __init__(self, state_updater):
+        self.state_updater = state_updater
+
+    def __getitem__(self, cid):
+        return self.state_updater._STATE[self.state_updater._states[cid]]
+
+    def __len__(self):
+        return len(self.state_updater._states)
+
+    def __iter__(self):
+        return iter([self.state_updater._STATE[s] for s in self.state_updater._states])
+
 class BasicStateUpdater(AbstractStateUpdater):
     _STATE = ['offline', 'idle', 'selected', 'working', 'dropped']
     _VAR_NAMES = ['prob_available', 'prob_unavailable', 'prob_drop', 'working_amount', 'latency']
+    # the variables that won't be set as attributes of clients since they are updated for all the clients frequently,
+    # which are instead read from the state updater by the properties of clients (e.g. client._prob_available)
+    _UNMIRRORED_VARS = ['prob_available', 'prob_unavailable']
     def __init__(self, objects, *args, **kwargs):
         if len(objects)>0:
             self.server = objects[0]
@@ -121,28 +241,84 @@ class BasicStateUpdater(AbstractStateUpdater):
             self.clients = []
         self.all_clients = list(range(len(self.clients)))
         self.random_module = np.random.RandomState(0) if random_seed_gen is None else np.random.RandomState(next(random_seed_gen))
-        # client states and the variables
-        self.client_states = ['idle' for _ in self.clients]
+        # client states are stored as the indices of self._STATE and the number of clients in each state is counted
+        self._state_index = {state: sid for sid, state in enumerate(self._STATE)}
+        self._states = np.full(len(self.clients), self._state_index['idle'], dtype=np.int8)
+        self._state_counts = np.bincount(self._states, minlength=len(self._STATE))
+        self.client_states = ClientStates(self)
         self.roundwise_fixed_availability = False
         self.availability_latest_round = -1
-        self.variables = [{
-            'prob_available': 1.,
-            'prob_unavailable': 0.,
-            'prob_drop': 0.,
-            'working_amount': c.num_steps,
-            'latency': 0,
-        } for c in self.clients]
+        # each variable is stored as an array over all the clients with a mask of whether it has been set for each client
+        self._variables = {}
+        self._variable_masks = {}
+        init_values = {
+            'prob_available': [1. for _ in self.clients],
+            'prob_unavailable': [0. for _ in self.clients],
+            'prob_drop': [0. for _ in self.clients],
+            'working_amount': [c.num_steps for c in self.clients],
+            'latency': [0 for _ in self.clients],
+        }
         for var in self._VAR_NAMES:
-            self.set_variable(self.all_clients, var, [self.variables[cid][var] for cid in self.all_clients])
-        self.state_counter = [{'dropped_counter': 0, 'latency_counter': 0, } for _ in self.clients]
+            self.set_variable(self.all_clients, var, init_values[var])
+        self._dropped_counter = np.zeros(len(self.clients), dtype=np.int64)
+        self._latency_counter = np.zeros(len(self.clients), dtype=np.int64)
+
+    def get_checkpoint_state(self):
+        """Return the states and the variables of clients and the state of the random module"""
+        return {
+            'states': self._states.copy(),
+            'variables': {var: values.copy() for var, values in self._variables.items()},
+            'variable_masks': {var: mask.copy() for var, mask in self._variable_masks.items()},
+            'dropped_counter': self._dropped_counter.copy(),
+            'latency_counter': self._latency_counter.copy(),
+            'availability_latest_round': self.availability_latest_round,
+            'random_state': self.random_module.get_state(),
+        }
+
+    def load_checkpoint_state(self, state):
+        self._states = state['states'].copy()
+        self._state_counts = np.bincount(self._states, minlength=len(self._STATE))
+        self._variables = {var: values.copy() for var, values in state['variables'].items()}
+        self._variable_masks = {var: mask.copy() for var, mask in state['variable_masks'].items()}
+        for var, values in self._variables.items():
+            if var in self._UNMIRRORED_VARS: continue
+            values = values.tolist()
+            for cid in np.flatnonzero(self._variable_masks[var]).tolist():
+                setattr(self.clients[cid], '_'+var, values[cid])
+        self._dropped_counter = state['dropped_counter'].copy()
+        self._latency_counter = state['latency_counter'].copy()
+        self.availability_latest_round = state['availability_latest_round']
+        self.random_module.set_state(state['random_state'])
+
+    @property
+    def variables(self):
+        """The read-only list of {varname: value} of each client rebuilt from the arrays, where only the set variables are included"""
+        columns = {var: (values.tolist(), self._variable_masks[var].tolist()) for var, values in self._variables.items()}
+        return [{var: values[cid] for var, (values, mask) in columns.items() if mask[cid]} for cid in self.all_clients]
+
+    @property
+    def state_counter(self):
+        """The read-only list of {'dropped_counter': ..., 'latency_counter': ...} of each client rebuilt from the arrays"""
+        return [{'dropped_counter': d, 'latency_counter': l} for d, l in zip(self._dropped_counter.tolist(), self._latency_counter.tolist())]
+
+    def _as_ids(self, client_ids):
+        if type(client_ids) is not list and not isinstance(client_ids, np.ndarray): client_ids = [client_ids]
+        return np.asarray(client_ids, dtype=np.int64)
 
     def get_client_with_state(self, state='idle'):
-        return [cid for cid, cstate in enumerate(self.client_states) if cstate == state]
+        return np.flatnonzero(self._states == self._state_index[state]).tolist()
+
+    def count_client_with_state(self, state='idle'):
+        return int(self._state_counts[self._state_index[state]])
 
     def set_client_state(self, client_ids, state):
         if state not in self._STATE: raise RuntimeError('{} not in the default state'.format(state))
         if type(client_ids) is not list: client_ids = [client_ids]
-        for cid in client_ids: self.client_states[cid] = state
+        ids = np.unique(self._as_ids(client_ids))
+        if len(ids)>0:
+            self._state_counts -= np.bincount(self._states[ids], minlength=len(self._STATE))
+            self._states[ids] = self._state_index[state]
+            self._state_counts[self._state_index[state]] += len(ids)
         if state == 'dropped':
             self.set_client_dropped_counter(client_ids)
         if state == 'working':
@@ -151,21 +327,18 @@ class BasicStateUpdater(AbstractStateUpdater):
             self.reset_client_counter(client_ids)
 
     def set_client_latency_counter(self, client_ids = []):
-        if type(client_ids) is not list: client_ids = [client_ids]
-        for cid in client_ids:
-            self.state_counter[cid]['dropped_counter'] = 0
-            self.state_counter[cid]['latency_counter'] = self.variables[cid]['latency']
+        ids = self._as_ids(client_ids)
+        self._dropped_counter[ids] = 0
+        self._latency_counter[ids] = self._variables['latency'][ids]
 
     def set_client_dropped_counter(self, client_ids = []):
-        if type(client_ids) is not list: client_ids = [client_ids]
-        for cid in client_ids:
-            self.state_counter[cid]['latency_counter'] = 0
-            self.state_counter[cid]['dropped_counter'] = self.server.get_tolerance_for_latency()
+        ids = self._as_ids(client_ids)
+        self._latency_counter[ids] = 0
+        if len(ids)>0: self._dropped_counter[ids] = self.server.get_tolerance_for_latency()
 
     def reset_client_counter(self, client_ids = []):
-        if type(client_ids) is not list: client_ids = [client_ids]
-        for cid in client_ids:
-            self.state_counter[cid]['dropped_counter'] = self.state_counter[cid]['latency_counter'] = 0
+        ids = self._as_ids(client_ids)
+        self._dropped_counter[ids] = self._latency_counter[ids] = 0
         return
 
     @property
@@ -189,20 +362,50 @@ class BasicStateUpdater(AbstractStateUpdater):
         return self.get_client_with_state('dropped')
 
     def get_variable(self, client_ids, varname):
-        if len(self.variables) ==0: return None
-        if type(client_ids) is not list: client_ids = [client_ids]
-        return [self.variables[cid][varname] if varname in self.variables[cid].keys() else None for cid in client_ids]
+        if len(self.clients) ==0: return None
+        ids = self._as_ids(client_ids)
+        if varname not in self._variables: return [None for _ in ids]
+        values = self._variables[varname][ids].tolist()
+        mask = self._variable_masks[varname][ids]
+        if mask.all(): return values
+        return [v if m else None for v, m in zip(values, mask)]
 
     def set_variable(self, client_ids, varname, values):
-        if type(client_ids) is not list: client_ids = [client_ids]
-        assert len(client_ids) == len(values)
-        for cid, v in zip(client_ids, values):
-            self.variables[cid][varname] = v
-            setattr(self.clients[cid], '_'+varname, v)
+        ids = self._as_ids(client_ids)
+        assert len(ids) == len(values)
+        if len(ids)==0: return
+        try:
+            arr = np.asarray(values)
+            if arr.dtype.kind not in 'biuf' or arr.ndim != 1: raise ValueError
+        except ValueError:
+            arr = np.empty(len(values), dtype=object)
+            arr[:] = list(values)
+        if varname not in self._variables:
+            self._variables[varname] = np.zeros(len(self.clients), dtype=arr.dtype)
+            self._variable_masks[varname] = np.zeros(len(self.clients), dtype=bool)
+        elif not np.can_cast(arr.dtype, self._variables[varname].dtype, casting='safe'):
+            # promote the dtype of the variable to avoid truncating the values (e.g. int -> float)
+            self._variables[varname] = self._variables[varname].astype(np.result_type(arr.dtype, self._variables[varname].dtype) if arr.dtype != object else object)
+        self._variables[varname][ids] = arr
+        self._variable_masks[varname][ids] = True
+        if varname not in self._UNMIRRORED_VARS:
+            for cid, v in zip(ids.tolist(), values):
+                setattr(self.clients[cid], '_'+varname, v)
 
     def update_client_availability(self, *args, **kwargs):
         return
 
+    def get_time_to_availability_change(self):
+        """
+        Return the units of time after which the probabilities of the availability of clients may change, or None if they
+        won't change within the current round, which is used to split the jump of the clock when the clock skips the idle
+        time. The availability updated by the overridden `update_client_availability` is assumed to change at each unit
+        of time unless it's roundwise fixed, and the state updaters whose availability changes at known moments (e.g.
+        by a timetable) should override this method to let the clock jump further.
+        """
+        if self.roundwise_fixed_availability or getattr(self.update_client_availability, '__func__', None) is BasicStateUpdater.update_client_availability: return None
+        return 1
+
     def update_client_connectivity(self, client_ids, *args, **kwargs):
         return
 
@@ -212,42 +415,50 @@ class BasicStateUpdater(AbstractStateUpdater):
     def update_client_responsiveness(self, client_ids, *args, **kwargs):
         return
 
-    def flush(self):
+    def flush(self, delta_t=1):
+        """
+        Flush the states of clients after `delta_t` units of time. When delta_t>1, the availability of each client is
+        transferred by the delta_t-step transition probabilities of the two-state (i.e. offline and idle) Markov chain,
+        where the probabilities of the chain are assumed to be unchanged during the elapsed time.
+        """
         # +++++++++++++++++++ availability +++++++++++++++++++++
-        # change self.variables[cid]['prob_available'] and self.variables[cid]['prob_unavailable'] for each client `cid`
+        # change the variables 'prob_available' and 'prob_unavailable' for each client `cid`
         self.update_client_availability()
         # update states for offline & idle clients
-        if len(self.idle_clients)==0 or not self.roundwise_fixed_availability or self.server.current_round > self.availability_latest_round:
+        if self.count_client_with_state('idle')==0 or not self.roundwise_fixed_availability or self.server.current_round > self.availability_latest_round:
             self.availability_latest_round = self.server.current_round
-            offline_clients = {cid: 'offline' for cid in self.offline_clients}
-            idle_clients = {cid:'idle' for cid in self.idle_clients}
-            for cid in offline_clients:
-                if (self.random_module.rand() <= self.variables[cid]['prob_available']): offline_clients[cid] = 'idle'
-            for cid in self.idle_clients:
-                if  (self.random_module.rand() <= self.variables[cid]['prob_unavailable']): idle_clients[cid] = 'offline'
-            new_idle_clients = [cid for cid in offline_clients if offline_clients[cid] == 'idle']
-            new_offline_clients = [cid for cid in idle_clients if idle_clients[cid] == 'offline']
-            self.set_client_state(new_idle_clients, 'idle')
-            self.set_client_state(new_offline_clients, 'offline')
+            offline_clients = np.flatnonzero(self._states == self._state_index['offline'])
+            idle_clients = np.flatnonzero(self._states == self._state_index['idle'])
+            prob_available, prob_unavailable = self._variables['prob_available'][offline_clients], self._variables['prob_unavailable'][idle_clients]
+            # the roundwise fixed availability only changes once within a round
+            if delta_t > 1 and not self.roundwise_fixed_availability:
+                prob_available = self._multistep_transition_prob(offline_clients, 'prob_available', delta_t)
+                prob_unavailable = self._multistep_transition_prob(idle_clients, 'prob_unavailable', delta_t)
+            # the random numbers are drawn in the same order as drawing them client by client
+            new_idle_clients = offline_clients[self.random_module.rand(len(offline_clients)) <= prob_available]
+            new_offline_clients = idle_clients[self.random_module.rand(len(idle_clients)) <= prob_unavailable]
+            self.set_client_state(new_idle_clients.tolist(), 'idle')
+            self.set_client_state(new_offline_clients.tolist(), 'offline')
         # update states for dropped clients
-        for cid in self.dropped_clients:
-            self.state_counter[cid]['dropped_counter'] -= 1
-            if self.state_counter[cid]['dropped_counter'] < 0:
-                self.state_counter[cid]['dropped_counter'] = 0
-                self.client_states[cid] = 'offline'
-                if (self.random_module.rand() < self.variables[cid]['prob_unavailable']):
-                    cfg.logger.info('Client {} had just dropped out and is currently offline.'.format(cid))
-                    self.set_client_state([cid], 'offline')
-                else:
-                    cfg.logger.info('Client {} had just dropped out and is currently available.'.format(cid))
-                    self.set_client_state([cid], 'idle')
+        if self.count_client_with_state('dropped')>0:
+            dropped_clients = np.flatnonzero(self._states == self._state_index['dropped'])
+            self._dropped_counter[dropped_clients] -= delta_t
+            recovered_clients = dropped_clients[self._dropped_counter[dropped_clients] < 0]
+            self._dropped_counter[recovered_clients] = 0
+            to_offline = self.random_module.rand(len(recovered_clients)) < self._variables['prob_unavailable'][recovered_clients]
+            for cid, off in zip(recovered_clients.tolist(), to_offline.tolist()):
+                cfg.logger.info('Client {} had just dropped out and is currently {}.'.format(cid, 'offline' if off else 'available'))
+            self.set_client_state(recovered_clients[to_offline].tolist(), 'offline')
+            self.set_client_state(recovered_clients[~to_offline].tolist(), 'idle')
         # Remark: the state transfer fo working clients is instead made once the server received from clients
-        # # update states for working clients
-        # for cid in self.working_clients:
-        #     self.state_counter[cid]['latency_counter'] -= 1
-        #     if self.state_counter[cid]['latency_counter'] < 0:
-        #         self.state_counter[cid]['latency_counter'] = 0
-        #         self.set_client_state([cid], 'offline')
+
+    def _multistep_transition_prob(self, client_ids, varname, delta_t):
+        # the probability of leaving the current state after delta_t steps of the two-state Markov chain
+        pa, pu = self._variables['prob_available'][client_ids], self._variables['prob_unavailable'][client_ids]
+        s = pa + pu
+        p = pa if varname == 'prob_available' else pu
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(s > 0, p / s * (1 - (1 - s) ** delta_t), 0.)
 
 #================================================Decorators==========================================
 # Time Counter for any function which forces the `cfg.clock` to
@@ -287,7 +498,8 @@ def with_dropout(communicate):
         if len(selected_clients) > 0:
             cfg.state_updater.update_client_connectivity(selected_clients)
             probs_drop = cfg.state_updater.get_variable(selected_clients, 'prob_drop')
-            self._dropped_selected_clients = [cid for cid,prob in zip(selected_clients, probs_drop) if cfg.state_updater.random_module.rand() <= prob]
+            drops = cfg.state_updater.random_module.rand(len(selected_clients)) <= np.array(probs_drop)
+            self._dropped_selected_clients = [cid for cid, drop in zip(selected_clients, drops) if drop]
             cfg.state_updater.set_client_state(self._dropped_selected_clients, 'dropped')
             return communicate(self, [cid for cid in selected_clients if cid not in self._dropped_selected_clients], asynchronous)
         else:
@@ -381,13 +593,17 @@ def with_clock(communicate):
             self._overdue_clients = list(set([cid for cid in selected_clients if cid not in eff_cids]))
             # no additional wait for the synchronous selected clients and preserve the later packages from asynchronous clients
             if len(self._overdue_clients) > 0:
-                cfg.clock.conditionally_clear(lambda x: x['__cid'] in self._overdue_clients)
+                cfg.clock.cancel(self._overdue_clients)
+                self.release_upload_reference(self._overdue_clients)
                 cfg.state_updater.set_client_state(self._overdue_clients, 'idle')
             # Resort effective packages
             pkg_map = {pkg_i['__cid']: pkg_i for pkg_i in eff_pkgs}
             eff_pkgs = [pkg_map[cid] for cid in selected_clients if cid in eff_cids]
         cfg.state_updater.set_client_state(eff_cids, 'offline')
         self.received_clients = [pkg_i['__cid'] for pkg_i in eff_pkgs]
+        # decompress the compressed models after their sizes have been accounted
+        eff_pkgs = [fcompress.decompress_package(pkg_i, self.model, self.get_upload_reference(pkg_i['__cid'])) for pkg_i in eff_pkgs]
+        self.release_upload_reference(self.received_clients)
         return self.unpack(eff_pkgs)
     return communicate_with_clock
 
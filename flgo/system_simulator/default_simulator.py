@@ -3,6 +3,8 @@ import config as cfg
 import random
 import numpy as np
 import collections
+import types
+import flgo.utils.flabel as flabel
 
 ################################### Initial Availability Mode ##########################################
 def ideal_client_availability(state_updater, *args, **kwargs):
@@ -22,13 +24,10 @@ def y_max_first_client_availability(state_updater, beta=0.1):
     should be like 'YMaxFirst-x' where x should be replaced by a float number.
     """
     # alpha = float(mode[mode.find('-') + 1:]) if mode.find('-') != -1 else 0.1
-    def label_counter(dataset):
-        return collections.Counter([int(dataset[di][-1]) for di in range(len(dataset))])
-    label_num = len(label_counter(state_updater.state_updater.server.test_data))
+    label_num = len(flabel.get_label_counter(state_updater.server.test_data))
     probs = []
     for c in state_updater.clients:
-        c_counter = label_counter(c.train_data + c.valid_data)
-        c_label = [lb for lb in c_counter.keys()]
+        c_label = [int(lb) for lb in set(flabel.get_label_counter(c.train_data)).union(flabel.get_label_counter(c.valid_data))]
         probs.append((beta * min(c_label) / max(1, label_num - 1)) + (1 - beta))
     state_updater.set_variable(state_updater.all_clients, 'prob_available', probs)
     state_updater.set_variable(state_updater.all_clients, 'prob_unavailable', [1 - p for p in probs])
@@ -67,11 +66,11 @@ def y_fewer_first_client_availability(state_updater, beta=0.2):
     Clients with fewer kinds of labels will owe a larger active rate.
         ci = |set(Yi)|/|set(Y)|, pi = beta*ci + (1-beta)
     """
-    label_num = len(set([int(state_updater.server.test_data[di][-1]) for di in range(len(state_updater.server.test_data))]))
+    label_num = len(flabel.get_label_counter(state_updater.server.test_data))
     probs = []
     for c in state_updater.server.clients:
-        train_set = set([int(c.train_data[di][-1]) for di in range(len(c.train_data))])
-        valid_set = set([int(c.valid_data[di][-1]) for di in range(len(c.valid_data))])
+        train_set = set([int(lb) for lb in flabel.get_label_counter(c.train_data)])
+        valid_set = set([int(lb) for lb in flabel.get_label_counter(c.valid_data)])
         label_set = train_set.union(valid_set)
         probs.append(beta * len(label_set) / label_num + (1 - beta))
     state_updater.set_variable(state_updater.all_clients, 'prob_available', probs)
@@ -128,10 +127,10 @@ def sin_lognormal_client_availability(state_updater, beta=0.1):
 
 def y_cycle_client_availability(state_updater, beta=0.5):
     # beta = float(mode[mode.find('-') + 1:]) if mode.find('-') != -1 else 0.5
-    max_label = max(set([int(state_updater.server.test_data[di][-1]) for di in range(len(state_updater.server.test_data))]))
+    max_label = max([int(lb) for lb in flabel.get_label_counter(state_updater.server.test_data)])
     for c in state_updater.clients:
-        train_set = set([int(c.train_data[di][-1]) for di in range(len(c.train_data))])
-        valid_set = set([int(c.valid_data[di][-1]) for di in range(len(c.valid_data))])
+        train_set = set([int(lb) for lb in flabel.get_label_counter(c.train_data)])
+        valid_set = set([int(lb) for lb in flabel.get_label_counter(c.valid_data)])
         label_set = train_set.union(valid_set)
         c._min_label = min(label_set)
         c._max_label = max(label_set)
@@ -276,25 +275,25 @@ class StateUpdater(BasicStateUpdater):
         avl_mode, avl_para = self.get_mode(option['availability'])
         if avl_mode not in availability_modes: avl_mode, avl_para = 'IDL', ()
         f_avl = availability_modes[avl_mode](self, *avl_para)
-        if f_avl is not None: self.__class__.update_client_availability = f_avl
+        if f_avl is not None: self.update_client_availability = types.MethodType(f_avl, self)
         # +++++++++++++++++++++ connectivity +++++++++++++++++++++
         cfg.logger.info('Initializing Systemic Heterogeneity: ' + 'Connectivity {}'.format(option['connectivity']))
         con_mode, con_para = self.get_mode(option['connectivity'])
         if con_mode not in connectivity_modes: con_mode, con_para = 'IDL', ()
         f_con = connectivity_modes[con_mode](self, *con_para)
-        if f_con is not None: self.__class__.update_client_connectivity = f_con
+        if f_con is not None: self.update_client_connectivity = types.MethodType(f_con, self)
         # +++++++++++++++++++++ completeness +++++++++++++++++++++
         cfg.logger.info('Initializing Systemic Heterogeneity: ' + 'Completeness {}'.format(option['completeness']))
         cmp_mode, cmp_para = self.get_mode(option['completeness'])
         if cmp_mode not in completeness_modes: cmp_mode, cmp_para = 'IDL', ()
         f_cmp = completeness_modes[cmp_mode](self, *cmp_para)
-        if f_cmp is not None: self.__class__.update_client_completeness = f_cmp
+        if f_cmp is not None: self.update_client_completeness = types.MethodType(f_cmp, self)
         # +++++++++++++++++++++ responsiveness ++++++++++++++++++++++++
         cfg.logger.info('Initializing Systemic Heterogeneity: ' + 'Responsiveness {}'.format(option['responsiveness']))
         rsp_mode, rsp_para = self.get_mode(option['responsiveness'])
         if rsp_mode not in responsiveness_modes: rsp_mode, rsp_para = 'IDL', ()
         f_rsp = responsiveness_modes[rsp_mode](self, *rsp_para)
-        if f_rsp is not None: self.__class__.update_client_responsiveness = f_rsp
+        if f_rsp is not None: self.update_client_responsiveness = types.MethodType(f_rsp, self)
         if self.server.tolerance_for_latency == 0:
             self.server.tolerance_for_latency = max([c._latency for c in self.clients])
         return
@@ -254,6 +254,12 @@ class StateUpdater(BasicStateUpdater):
         self.set_variable(self.all_clients, 'prob_available', pa)
         self.set_variable(self.all_clients, 'prob_unavailable', pua)
 
+    def get_time_to_availability_change(self):
+        # the availability is looked up from the timetable of every 15 units of time
+        period = self.availability_table.index[-1]
+        t = cfg.clock.current_time % period
+        return min(15 - t % 15, period - t)
+
     def update_client_responsiveness(self, client_ids, *args, **kwargs):
         # calculate time of uploading and downloading model
         latency = []
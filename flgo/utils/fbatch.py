@@ -0,0 +1,69 @@
+"""
+The batch-level sampler of local training. For the datasets whose samples are rows of in-memory
+(or memory-mapped) tensors, a minibatch is gathered by indexing the tensors with all the indices
+of the batch at once instead of fetching and collating the samples one by one as DataLoader does.
+The supported datasets are TensorDataset, the datasets with the method `get_batch(indices)` (e.g.
+MemmapXYDataset and the datasets of SHAKESPEARE and SENT140), and the subsets of them (e.g. the
+results of random_split and the local datasets of clients).
+"""
+import numpy as np
+import torch
+
+def get_batch_fn(dataset):
+    """
+    Get the function that gathers the samples of the indices of the dataset into a batch at once
+    :param
+        dataset: the dataset
+    :return
+        the function of a 1-D LongTensor of indices, or None if the dataset doesn't support it
+    """
+    # the dataset that defers building itself (e.g. LazyDataset) is gathered from the built one
+    if callable(getattr(type(dataset), 'materialize', None)): return get_batch_fn(dataset.materialize())
+    if isinstance(dataset, torch.utils.data.TensorDataset):
+        return lambda indices: tuple([t[indices] for t in dataset.tensors])
+    if isinstance(dataset, torch.utils.data.Subset):
+        if get_batch_fn(dataset.dataset) is None: return None
+        # the subsets that define their own gathering (e.g. adding perturbations to the features) are respected
+        if callable(getattr(dataset, 'get_batch', None)): return dataset.get_batch
+        parent_fn = get_batch_fn(dataset.dataset)
+        parent_indices = torch.as_tensor(np.asarray(dataset.indices, dtype=np.int64))
+        return lambda indices: parent_fn(parent_indices[indices])
+    if callable(getattr(dataset, 'get_batch', None)): return dataset.get_batch
+    return None
+
+class IndexBatchLoader:
+    """
+    The iterator over the shuffled minibatches of the dataset for one epoch, which yields batches
+    like DataLoader(dataset, batch_size, shuffle=True) (i.e. the last one may be smaller) but gathers
+    each of them at once. The permutation of the epoch is drawn into the buffer `perm`, which is
+    reused across epochs and rounds to avoid allocating it again.
+    :param
+        dataset: the dataset supported by get_batch_fn
+        batch_size: the size of minibatches
+        perm: the buffer of the permutation (e.g. the one of the last loader)
+    """
+    def __init__(self, dataset, batch_size, perm=None):
+        self.gather = get_batch_fn(dataset)
+        self.batch_size = batch_size
+        num_samples = len(dataset)
+        self.perm = perm if perm is not None and len(perm) == num_samples else torch.empty((num_samples,), dtype=torch.long)
+        # the permutation is seeded by the global RNG so that the loader is reproducible from its state
+        seed = int(torch.empty((), dtype=torch.int64).random_().item())
+        torch.randperm(num_samples, generator=torch.Generator().manual_seed(seed), out=self.perm)
+        self.pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return (len(self.perm) + self.batch_size - 1) // self.batch_size
+
+    def __next__(self):
+        if self.pos >= len(self.perm): raise StopIteration
+        indices = self.perm[self.pos:self.pos + self.batch_size]
+        self.pos += self.batch_size
+        return self.gather(indices)
+
+    def skip(self, num_batches):
+        """Skip the next num_batches batches without gathering them"""
+        self.pos += num_batches * self.batch_size
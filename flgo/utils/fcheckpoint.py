@@ -0,0 +1,144 @@
+"""
+Checkpoints of the federated training. The state of the run (i.e. the server and its clients,
+the system simulator, the clock with the packages in flight, the logger and the states of the
+random number generators) is collected explicitly by each object's `get_checkpoint_state` and
+restored by its `load_checkpoint_state`, so that the objects themselves (whose methods may be
+wrapped, e.g. by the system simulator or the profiler) are never pickled. The checkpoint is
+saved at the end of rounds and is written atomically (i.e. into a temporary file which then
+replaces the old checkpoint), so a run that is killed while saving still has the previous one.
+Resuming from the checkpoint by `flgo.init(..., resume=path)` continues the run as if it had
+never been stopped.
+"""
+import copy
+import os
+import random
+import warnings
+import numpy as np
+import torch
+import config as cfg
+from flgo.utils.fmodule import ModelSnapshot
+from flgo.utils.fpool import pack_weights, unpack_weights
+
+def get_rng_state():
+    return {
+        'random': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+    }
+
+def set_rng_state(state):
+    random.setstate(state['random'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available(): torch.cuda.set_rng_state_all(state['cuda'])
+
+def load_snapshot(state, template):
+    """Rebuild the ModelSnapshot of the saved weights by the template model"""
+    model = copy.deepcopy(template)
+    model.load_state_dict(state)
+    return ModelSnapshot(model)
+
+def get_clock_state(clock):
+    state = clock.get_checkpoint_state()
+    # only the weights of the models in the packages are saved
+    state['elems'] = [(pack_weights(x) if isinstance(x, dict) else x, t, key, order) for x, t, key, order in state['elems']]
+    return state
+
+def load_clock_state(clock, state, template):
+    state = dict(state)
+    state['elems'] = [(unpack_weights(x, template) if isinstance(x, dict) else x, t, key, order) for x, t, key, order in state['elems']]
+    clock.load_checkpoint_state(state)
+
+def load_file(filepath):
+    """Load the file saved by torch.save, which contains not only tensors (e.g. the states of RNGs)"""
+    try:
+        return torch.load(filepath, map_location='cpu', weights_only=False)
+    except TypeError:
+        return torch.load(filepath, map_location='cpu')
+
+def initialize_objects(objects):
+    """
+    Initialize the server and the clients by their `initialize` and record the attributes created there, which
+    are the candidates of the algorithm-specific states across rounds (e.g. control variates)
+    :param
+        objects: the server and the clients
+    """
+    for ob in objects:
+        attributes = set(vars(ob))
+        ob.initialize()
+        ob._initialized_attributes = [name for name in vars(ob) if name not in attributes]
+
+def get_unsaved_attributes(ob, basic_class, algo_para={}):
+    """
+    Return the attributes created by the algorithm's `initialize` that are not saved into the checkpoint, i.e.
+    when the class of `ob` doesn't extend get_checkpoint_state of `basic_class`. The hyper-parameters of the
+    algorithm and the methods are not states and thus ignored.
+    :param
+        ob: the server or the client
+        basic_class: BasicServer or BasicClient
+        algo_para: the hyper-parameters of the algorithm
+    :return
+        the list of the names of the unsaved attributes
+    """
+    if type(ob).get_checkpoint_state is not basic_class.get_checkpoint_state: return []
+    return [name for name in getattr(ob, '_initialized_attributes', []) if name not in algo_para and name != 'algo_para' and hasattr(ob, name) and not callable(getattr(ob, name))]
+
+def check_unsaved_states(server):
+    """Warn when the algorithm keeps states across rounds that are not saved into the checkpoint"""
+    from flgo.algorithm.fedbase import BasicServer, BasicClient
+    algo_para = getattr(server, 'algo_para', {})
+    unsaved = {'{}.{}'.format(type(server).__module__, type(server).__name__): get_unsaved_attributes(server, BasicServer, algo_para)}
+    for c in server.clients:
+        name = '{}.{}'.format(type(c).__module__, type(c).__name__)
+        unsaved[name] = sorted(set(unsaved.get(name, [])).union(get_unsaved_attributes(c, BasicClient, algo_para)))
+    for name, attributes in unsaved.items():
+        if len(attributes) == 0: continue
+        warnings.warn("The attributes {} of {} are not saved into the checkpoint, so the resumed run may differ from the "
+                      "uninterrupted one. Extend get_checkpoint_state and load_checkpoint_state of the class to save them.".format(attributes, name))
+    return unsaved
+
+def save_checkpoint(filepath, server):
+    """
+    Save the state of the run into filepath atomically
+    :param
+        filepath: the path of the checkpoint
+        server: the server of the run
+    """
+    server_state, worker_rng = server.get_checkpoint_state(), None
+    # the resident states of the clients that are trained in the workers are collected from the workers
+    if getattr(cfg, 'worker_pool', None) is not None:
+        server_state['clients'], worker_rng = cfg.worker_pool.get_checkpoint_state(server.clients)
+    state = {
+        'server': server_state,
+        'state_updater': cfg.state_updater.get_checkpoint_state(),
+        'clock': get_clock_state(cfg.clock),
+        'logger': cfg.logger.get_checkpoint_state(),
+        'rng': get_rng_state(),
+        'worker_rng': worker_rng,
+    }
+    dirname = os.path.dirname(filepath)
+    if dirname != '' and not os.path.exists(dirname): os.makedirs(dirname)
+    tmp_path = filepath + '.tmp'
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, filepath)
+    return
+
+def load_checkpoint(filepath, server):
+    """
+    Restore the state of the run from the checkpoint
+    :param
+        filepath: the path of the checkpoint
+        server: the server of the run that has been initialized with the same option
+    :return
+        the states of the RNGs of the workers of WorkerPool (or None), which are restored when creating the workers
+    """
+    state = load_file(filepath)
+    check_unsaved_states(server)
+    server.load_checkpoint_state(state['server'])
+    cfg.state_updater.load_checkpoint_state(state['state_updater'])
+    load_clock_state(cfg.clock, state['clock'], server.model)
+    cfg.logger.load_checkpoint_state(state['logger'])
+    # the random number generators are restored at last since restoring the other objects may consume random numbers
+    set_rng_state(state['rng'])
+    return state.get('worker_rng', None)
@@ -0,0 +1,338 @@
+"""
+Compression of the models in the packages uploaded by clients. The floating tensors of the
+model (or of its difference from the reference model that the client received, which the
+server already holds) are concatenated into one vector and encoded by a compressor:
+    topk-r: keep the ratio r of the entries with the largest magnitudes, with error feedback
+    qsgd-b: QSGD that stochastically quantizes the magnitude of each entry relative to the norm of
+        the vector into a sign bit and b-1 bits of level (b=2, 4 or 8, packed into bytes)
+    quant-b: stochastically quantize each entry between the minimum and the maximum into b bits
+    sketch-r-d: count-sketch of d rows whose total size is the ratio r of the vector
+    sparse: losslessly keep the nonzero entries (e.g. of the difference between two models)
+The compressed model reports its real size to the system simulator by `__sizeof__`, and it
+is decompressed on the server's side before being unpacked, where the compressed difference is
+added to the server's own copy of the model that it sent to the client.
+"""
+import copy
+import math
+import torch
+from flgo.utils.fmodule import FModule, ModelSnapshot
+
+class Compressor:
+    # whether the decompressed vector always equals the compressed one
+    lossless = False
+
+    def compress(self, vec):
+        """
+        :param
+            vec: the 1-D tensor to be compressed
+        :return
+            payload: a dict of the tensors that encode the vector
+        """
+        raise NotImplementedError
+
+    def decompress(self, payload, numel, dtype, device):
+        raise NotImplementedError
+
+    def get_args(self):
+        # the hyper-parameters that are needed to decompress the payload
+        raise NotImplementedError
+
+class TopKCompressor(Compressor):
+    def __init__(self, ratio=0.01, error_feedback=True):
+        self.ratio = ratio
+        self.error_feedback = error_feedback
+        self.residual = None
+
+    def compress(self, vec):
+        if self.error_feedback and self.residual is not None and self.residual.shape == vec.shape:
+            vec = vec + self.residual.to(vec.device)
+        k = min(len(vec), max(1, int(math.ceil(len(vec) * self.ratio))))
+        indices = vec.abs().topk(k)[1]
+        values = vec[indices]
+        if self.error_feedback:
+            # accumulate the untransmitted entries into the next update
+            self.residual = vec.clone()
+            self.residual[indices] = 0
+        return {'indices': indices.to(torch.int32), 'values': values}
+
+    def decompress(self, payload, numel, dtype, device):
+        vec = torch.zeros(numel, dtype=dtype, device=device)
+        vec[payload['indices'].long().to(device)] = payload['values'].to(device=device, dtype=dtype)
+        return vec
+
+    def get_args(self):
+        return {'ratio': self.ratio, 'error_feedback': False}
+
+def _pack_bits(q, bits):
+    # pack 8/bits codes of uint8 into each byte
+    per_byte = 8 // bits
+    if per_byte == 1: return q
+    q = torch.cat([q, q.new_zeros((-len(q)) % per_byte)]).view(-1, per_byte)
+    shifts = torch.arange(0, 8, bits, dtype=torch.uint8, device=q.device)
+    return (q << shifts).sum(dim=1, dtype=torch.uint8)
+
+def _unpack_bits(q, bits, numel):
+    per_byte = 8 // bits
+    if per_byte == 1: return q
+    shifts = torch.arange(0, 8, bits, dtype=torch.uint8, device=q.device)
+    return ((q.unsqueeze(1) >> shifts) & (2 ** bits - 1)).view(-1)[:numel]
+
+class QuantizationCompressor(Compressor):
+    def __init__(self, bits=8):
+        self.bits = int(bits)
+        if self.bits not in [1, 2, 4, 8]: raise ValueError("The number of bits should be one of 1, 2, 4 and 8")
+
+    def compress(self, vec):
+        levels = 2 ** self.bits - 1
+        lo, hi = vec.min(), vec.max()
+        scale = (hi - lo) / levels if hi > lo else torch.ones_like(hi)
+        # stochastic rounding makes the quantization unbiased
+        q = torch.floor((vec - lo) / scale + torch.rand_like(vec)).clamp_(0, levels).to(torch.uint8)
+        return {'q': _pack_bits(q, self.bits), 'lo': lo.reshape(1), 'scale': scale.reshape(1)}
+
+    def decompress(self, payload, numel, dtype, device):
+        q = _unpack_bits(payload['q'].to(device), self.bits, numel)
+        return (q.to(dtype) * payload['scale'].to(device=device, dtype=dtype) + payload['lo'].to(device=device, dtype=dtype))
+
+    def get_args(self):
+        return {'bits': self.bits}
+
+class QSGDCompressor(Compressor):
+    """QSGD (Alistarh et al., 2017) with s=2^(bits-1)-1 levels, where each code is a sign bit and a level"""
+    def __init__(self, bits=8):
+        self.bits = int(bits)
+        if self.bits not in [2, 4, 8]: raise ValueError("The number of bits should be one of 2, 4 and 8")
+
+    def compress(self, vec):
+        levels = 2 ** (self.bits - 1) - 1
+        norm = vec.norm()
+        ratio = vec.abs() / norm * levels if norm > 0 else torch.zeros_like(vec)
+        # stochastic rounding of the level makes the quantization unbiased
+        q = torch.floor(ratio + torch.rand_like(vec)).clamp_(0, levels).to(torch.uint8)
+        q = q | ((vec < 0).to(torch.uint8) << (self.bits - 1))
+        return {'q': _pack_bits(q, self.bits), 'norm': norm.reshape(1)}
+
+    def decompress(self, payload, numel, dtype, device):
+        levels = 2 ** (self.bits - 1) - 1
+        q = _unpack_bits(payload['q'].to(device), self.bits, numel)
+        signs = 1 - 2 * ((q >> (self.bits - 1)) & 1).to(dtype)
+        return (q & levels).to(dtype) * signs * (payload['norm'].to(device=device, dtype=dtype) / levels)
+
+    def get_args(self):
+        return {'bits': self.bits}
+
+class CountSketchCompressor(Compressor):
+    def __init__(self, ratio=0.1, rows=1, seed=0):
+        self.ratio = ratio
+        self.rows = max(1, int(rows))
+        self.seed = seed
+        self._hashes = {}
+
+    def get_hashes(self, numel, device):
+        # the hash functions are shared by the clients and the server through the seed
+        if numel not in self._hashes:
+            generator = torch.Generator().manual_seed(self.seed)
+            width = max(1, int(math.ceil(numel * self.ratio / self.rows)))
+            buckets = torch.randint(0, width, (self.rows, numel), generator=generator)
+            signs = torch.randint(0, 2, (self.rows, numel), generator=generator) * 2 - 1
+            self._hashes[numel] = (width, buckets, signs)
+        width, buckets, signs = self._hashes[numel]
+        return width, buckets.to(device), signs.to(device)
+
+    def compress(self, vec):
+        width, buckets, signs = self.get_hashes(len(vec), vec.device)
+        table = vec.new_zeros(self.rows, width)
+        for r in range(self.rows):
+            table[r].index_add_(0, buckets[r], signs[r].to(vec.dtype) * vec)
+        return {'table': table}
+
+    def decompress(self, payload, numel, dtype, device):
+        width, buckets, signs = self.get_hashes(numel, device)
+        table = payload['table'].to(device=device, dtype=dtype)
+        estimates = torch.stack([signs[r].to(dtype) * table[r][buckets[r]] for r in range(self.rows)])
+        return estimates.median(dim=0).values
+
+    def get_args(self):
+        return {'ratio': self.ratio, 'rows': self.rows, 'seed': self.seed}
+
+class SparseCompressor(Compressor):
+    lossless = True
+
+    def compress(self, vec):
+        indices = torch.nonzero(vec).view(-1)
+        # the dense vector is cheaper when most of the entries are nonzero
+        if len(indices) * (4 + vec.element_size()) >= len(vec) * vec.element_size(): return {'values': vec.clone()}
+        return {'indices': indices.to(torch.int32), 'values': vec[indices]}
+
+    def decompress(self, payload, numel, dtype, device):
+        if 'indices' not in payload: return payload['values'].to(device=device, dtype=dtype)
+        vec = torch.zeros(numel, dtype=dtype, device=device)
+        vec[payload['indices'].long().to(device)] = payload['values'].to(device=device, dtype=dtype)
+        return vec
+
+    def get_args(self):
+        return {}
+
+compressors = {
+    'topk': TopKCompressor,
+    'qsgd': QSGDCompressor,
+    'quant': QuantizationCompressor,
+    'sketch': CountSketchCompressor,
+    'sparse': SparseCompressor,
+}
+
+def get_compressor(mode_string=''):
+    """
+    Create the compressor from the string like 'topk-0.01', 'qsgd-8' or 'sketch-0.1-3'
+    :param
+        mode_string: the name of the compressor and its hyper-parameters joined by '-'
+    :return
+        the compressor or None if mode_string is empty
+    """
+    if mode_string is None or mode_string == '': return None
+    mode = mode_string.split('-')
+    name, para = mode[0].lower(), [float(pi) for pi in mode[1:]]
+    if name not in compressors: raise ValueError("Unknown compressor {}".format(name))
+    return compressors[name](*para)
+
+def _state_of(model):
+    return model.state if isinstance(model, ModelSnapshot) else model.state_dict()
+
+def _size_of_tensors(tensors):
+    return sum([t.nelement() * t.element_size() for t in tensors])
+
+class CompressedModel:
+    def __init__(self, model, compressor, reference=None, keep_reference=False):
+        """
+        :param
+            model: the model (or ModelSnapshot) to be compressed
+            compressor: the compressor
+            reference: the model (or ModelSnapshot) that the receiver already holds, and only the difference between
+            `model` and `reference` will be compressed if it's not None
+            keep_reference: keep the reference in the compressed model (which adds its size to the transfer),
+            otherwise the receiver should provide its own copy of the reference when decompressing
+        """
+        state = _state_of(model)
+        ref_state = _state_of(reference) if reference is not None else None
+        self.float_keys = [k for k, v in state.items() if v.is_floating_point()]
+        self.shapes = [state[k].shape for k in self.float_keys]
+        self.others = {k: v.detach().clone() for k, v in state.items() if not v.is_floating_point()}
+        with torch.no_grad():
+            vec = torch.cat([(state[k] - ref_state[k].to(state[k].device) if ref_state is not None else state[k]).reshape(-1) for k in self.float_keys])
+            self.payload = compressor.compress(vec)
+        self.numel, self.dtype = len(vec), vec.dtype
+        self.relative = reference is not None
+        self.reference = reference if keep_reference else None
+        self.decoder = (compressor.__class__, compressor.get_args())
+        if isinstance(model, FModule): self.num_params = model.count_parameters(output=False)
+        elif isinstance(model, ModelSnapshot): self.num_params = sum([v.numel() for v in state.values() if v.is_floating_point()])
+        else: self.num_params = sum([p.numel() for p in model.parameters()])
+        self.size = _size_of_tensors(self.payload.values()) + _size_of_tensors(self.others.values())
+
+    def decompress(self, template, reference=None):
+        """
+        :param
+            template: the model that has the same architecture as the compressed model (e.g. the global model)
+            reference: the receiver's copy of the reference, which is used instead of the kept one if not None
+        :return
+            the decompressed model
+        """
+        device = next(template.parameters()).device
+        decoder = self.decoder[0](**self.decoder[1])
+        vec = decoder.decompress(self.payload, self.numel, self.dtype, device)
+        if reference is None: reference = self.reference
+        if self.relative and reference is None: raise ValueError("The reference of the compressed difference is required to decompress it")
+        ref_state = _state_of(reference) if reference is not None else None
+        state = {}
+        offset = 0
+        for k, shape in zip(self.float_keys, self.shapes):
+            numel = shape.numel()
+            state[k] = vec[offset:offset + numel].view(shape)
+            if ref_state is not None: state[k] = state[k] + ref_state[k].to(device)
+            offset += numel
+        state.update(self.others)
+        model = copy.deepcopy(template)
+        model.load_state_dict(state)
+        return model
+
+    def count_parameters(self, output=False):
+        return self.num_params
+
+    def __sizeof__(self):
+        return self.size
+
+def decompress_package(package, template, reference=None):
+    """
+    Decompress the compressed models in the package
+    :param
+        package: the package received from a client
+        template: the model that has the same architecture as the compressed models
+        reference: the model (or ModelSnapshot) sent to the client, which the compressed differences are relative to
+    :return
+        the package of the decompressed models
+    """
+    if not any([isinstance(v, CompressedModel) for v in package.values()]): return package
+    return {k: (v.decompress(template, reference) if isinstance(v, CompressedModel) else v) for k, v in package.items()}
+
+class ModelDelta:
+    """
+    The difference between two versions of the global model that is sent to the client holding the base version.
+    The entries of the target version that differ from the base version are sent to replace the ones of the base
+    version (instead of the differences being added to them), so that the receiver rebuilds the target version
+    exactly and its cached model never drifts away from the server's version.
+    """
+    def __init__(self, base_version, version, model, base_model, compressor):
+        """
+        :param
+            base_version: the version of the model that the receiver holds
+            version: the version of `model`
+            model: the model (or ModelSnapshot) of the target version
+            base_model: the model (or ModelSnapshot) of the base version
+            compressor: the lossless compressor of the changed entries
+        """
+        self.base_version = base_version
+        self.version = version
+        state, base_state = _state_of(model), _state_of(base_model)
+        self.float_keys = [k for k, v in state.items() if v.is_floating_point()]
+        self.others = {k: v.detach().clone() for k, v in state.items() if not v.is_floating_point()}
+        with torch.no_grad():
+            vec = torch.cat([state[k].reshape(-1) for k in self.float_keys])
+            base_vec = torch.cat([base_state[k].to(vec.device).reshape(-1) for k in self.float_keys])
+            indices = torch.nonzero(vec != base_vec).view(-1)
+            # all the entries are sent when it's cheaper than sending the indices of the changed ones
+            if len(indices) * (4 + vec.element_size()) >= len(vec) * vec.element_size(): self.indices, values = None, vec
+            else: self.indices, values = indices.to(torch.int32), vec[indices]
+            self.payload = compressor.compress(values)
+        self.numel, self.dtype = len(values), vec.dtype
+        self.decoder = (compressor.__class__, compressor.get_args())
+        self.num_params = sum([state[k].numel() for k in self.float_keys])
+        self.size = _size_of_tensors(self.payload.values()) + _size_of_tensors(self.others.values()) + (_size_of_tensors([self.indices]) if self.indices is not None else 0)
+
+    def apply(self, base_model):
+        """
+        :param
+            base_model: the receiver's ModelSnapshot of the base version
+        :return
+            the model of the target version
+        """
+        model = base_model.materialize()
+        device = next(model.parameters()).device
+        values = self.decoder[0](**self.decoder[1]).decompress(self.payload, self.numel, self.dtype, device)
+        state = model.state_dict()
+        with torch.no_grad():
+            vec = torch.cat([state[k].reshape(-1) for k in self.float_keys])
+            if self.indices is None: vec = values
+            else: vec[self.indices.long().to(device)] = values
+            offset = 0
+            for k in self.float_keys:
+                numel = state[k].numel()
+                state[k].copy_(vec[offset:offset + numel].view_as(state[k]))
+                offset += numel
+            for k, v in self.others.items(): state[k].copy_(v)
+        return model
+
+    def count_parameters(self, output=False):
+        return self.num_params
+
+    def __sizeof__(self):
+        return self.size
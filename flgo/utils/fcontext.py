@@ -0,0 +1,102 @@
+"""
+The reusable contexts of local training. A context keeps one model and one optimizer that are
+reused across rounds instead of being created for each local training, where the weights of the
+received global model are loaded into the model of the context in place and the optimizer is
+reset (or restored to the state of the client when the algorithm preserves it) before training.
+The contexts are kept in the process (e.g. each worker of the WorkerPool), either one for each
+client with at most `capacity` contexts alive, or one shared by all the clients in the process.
+"""
+import collections
+import copy
+from flgo.utils.fmodule import ModelSnapshot
+
+class TrainingContext:
+    def __init__(self):
+        self.model = None
+        self.optimizer = None
+        # the model that the optimizer is built on and the client whose state the optimizer holds
+        self.optimizer_model = None
+        self.owner = None
+
+class ContextCache:
+    """The bounded LRU cache of the training contexts, where capacity<=0 means no bound"""
+    def __init__(self, capacity=0):
+        self.capacity = capacity
+        self.items = collections.OrderedDict()
+
+    def get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+        else:
+            self.items[key] = TrainingContext()
+            if 0 < self.capacity < len(self.items): self.items.popitem(last=False)
+        return self.items[key]
+
+_context_cache = ContextCache()
+
+def get_context(key, capacity=0):
+    """
+    Get the training context of the key in this process
+    :param
+        key: the key of the context (e.g. the id of the client)
+        capacity: the maximum number of contexts kept in this process, and 0 means no limit
+    :return
+        the TrainingContext
+    """
+    _context_cache.capacity = capacity
+    return _context_cache.get(key)
+
+def load_model(context, model):
+    """
+    Load the weights of the received model into the model of the context in place, which is created only
+    when the context has no model or a model of a different architecture
+    :param
+        context: the TrainingContext
+        model: the received model (i.e. a FModule or a ModelSnapshot)
+    :return
+        the model of the context
+    """
+    context.model = load_weights(model, context.model)
+    return context.model
+
+def load_weights(model, target=None):
+    """
+    Load the weights of the model into the target model in place
+    :param
+        model: the model (i.e. a FModule or a ModelSnapshot) whose weights are loaded
+        target: the reusable model, and a new one is created if it's None or of a different architecture
+    :return
+        the target model
+    """
+    if isinstance(model, ModelSnapshot): return model.materialize(target)
+    if target is None or target.__class__ is not model.__class__: return copy.deepcopy(model)
+    target.load_state_dict(model.state_dict())
+    return target
+
+def get_optimizer(context, model, create_fn, owner=None, state=None, lr=0.1, weight_decay=0, momentum=0):
+    """
+    Get the optimizer of the model from the context, where the optimizer is reused if it was built on the
+    same model. The state of the reused optimizer is kept if it belongs to the owner and `state` is given,
+    and otherwise is replaced by `state` or cleared.
+    :param
+        context: the TrainingContext
+        model: the model to be trained
+        create_fn: the function that creates the optimizer of the model (e.g. calculator.get_optimizer)
+        owner: the client that uses the optimizer
+        state: the preserved state_dict of the optimizer of the owner, and None means resetting the state
+        lr: the learning rate
+        weight_decay: the weight decay
+        momentum: the momentum
+    :return
+        the optimizer
+    """
+    hyper_paras = {'lr': lr, 'weight_decay': weight_decay, 'momentum': momentum}
+    if context.optimizer is None or context.optimizer_model is not model:
+        context.optimizer, context.optimizer_model, context.owner = create_fn(model, **hyper_paras), model, None
+    if state is None: context.optimizer.state.clear()
+    elif context.owner != owner: context.optimizer.load_state_dict(state)
+    # the hyper-parameters may change across rounds (e.g. decaying learning rates)
+    for group in context.optimizer.param_groups:
+        group.update({k: v for k, v in hyper_paras.items() if k in group})
+    context.owner = owner
+    return context.optimizer
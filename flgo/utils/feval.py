@@ -0,0 +1,68 @@
+"""
+Consolidated evaluation of a model on the local datasets of many clients. Instead of
+building a DataLoader and running the model for each client, the datasets of all the
+clients are concatenated into one indexed dataset (cached across rounds), which is
+evaluated by one pass of large batches. The per-sample metrics are then scattered back
+to the clients by the segment index of samples, which results in the same per-client
+metrics as calling `calculator.test` for each client.
+"""
+import torch
+
+class Evaluator:
+    def __init__(self, calculator, batch_size=512, num_workers=0):
+        """
+        :param
+            calculator: the task calculator that implements `get_sample_metrics(model, batch_data)`
+            batch_size: the batch size of the evaluation
+            num_workers: the number of workers of the DataLoader
+        """
+        self.calculator = calculator
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self._cache = {}
+
+    def is_supported(self):
+        return hasattr(self.calculator, 'get_sample_metrics')
+
+    def get_indexed_dataset(self, datasets):
+        """
+        Concatenate the datasets into one dataset and index the samples by the positions of their datasets
+        :param
+            datasets: a list of datasets
+        :return
+            dataset: the concatenated dataset
+            segments: the index of the dataset that each sample belongs to
+            lengths: the sizes of the datasets
+        """
+        key = tuple([id(d) for d in datasets])
+        if key not in self._cache:
+            lengths = torch.tensor([len(d) for d in datasets])
+            segments = torch.repeat_interleave(torch.arange(len(datasets)), lengths)
+            # the concatenated dataset keeps the references of the datasets, which makes the key stable
+            self._cache[key] = (torch.utils.data.ConcatDataset(datasets), segments, lengths.to(torch.float64))
+        return self._cache[key]
+
+    @torch.no_grad()
+    def evaluate(self, model, datasets):
+        """
+        Evaluate the model on each of the datasets
+        :param
+            model: the model to be evaluated
+            datasets: a list of datasets
+        :return
+            metrics: a dict contains the lists of each metric_value on the datasets
+        """
+        if len(datasets) == 0: return {}
+        dataset, segments, lengths = self.get_indexed_dataset(datasets)
+        model.eval()
+        batch_size = self.batch_size if self.batch_size > 0 else len(dataset)
+        data_loader = self.calculator.get_dataloader(dataset, batch_size=batch_size, shuffle=False, num_workers=self.num_workers)
+        metric_sums = {}
+        offset = 0
+        for batch_data in data_loader:
+            sample_metrics = self.calculator.get_sample_metrics(model, batch_data)
+            for met_name, met_val in sample_metrics.items():
+                if met_name not in metric_sums: metric_sums[met_name] = torch.zeros(len(datasets), dtype=torch.float64)
+                metric_sums[met_name].index_add_(0, segments[offset:offset + len(met_val)], met_val.detach().cpu().to(torch.float64))
+            offset += len(batch_data[-1])
+        return {met_name: (met_sum / lengths).tolist() for met_name, met_sum in metric_sums.items()}
@@ -9,6 +9,10 @@ import flgo.system_simulator
 import flgo.system_simulator.default_simulator
 import flgo.system_simulator.base
 import flgo.utils.fmodule
+import flgo.utils.fpool
+import flgo.utils.fprofile
+import flgo.utils.fcheckpoint
+import flgo.benchmark.toolkits.base
 import flgo.experiment.logger.simple_logger
 import flgo.algorithm
 import config as cfg
@@ -62,17 +66,33 @@ def read_option():
     # the ratio of the amount of the data used to train
     parser.add_argument('--train_holdout', help='the rate of holding out the validation dataset from all the local training datasets', type=float, default=0.1)
     parser.add_argument('--test_holdout', help='the rate of holding out the validation dataset from the training datasets', type=float, default=0.0)
+    parser.add_argument('--lazy_data', help='defer building the local datasets of clients until they are accessed', action="store_true", default=False)
+    parser.add_argument('--lazy_data_capacity', help='the maximum number of clients whose local datasets are kept in memory when lazy_data is set, and 0 means no limit', type=int, default=0)
+    parser.add_argument('--cache_task_data', help='cache the loaded task data in the process to share it with the later runs on the same task', action="store_true", default=False)
+    parser.add_argument('--predecode_data', help='apply the deterministic transforms of the builtin datasets once and store the results as memory-mapped arrays under the task', action="store_true", default=False)
+    parser.add_argument('--predecode_dtype', help='the dtype of the predecoded features, where uint8 quantizes each channel', type=str, choices=['float16', 'float32', 'uint8'], default='float16')
+    parser.add_argument('--cache_task_data_on_disk', help='save the prepared datasets of the task as arrays on the disk to share them with the later runs on the same task', action="store_true", default=False)
     # realistic machine config
     parser.add_argument('--seed', help='seed for random initialization;', type=int, default=0)
     parser.add_argument('--gpu', nargs='*', help='GPU IDs and empty input is equal to using CPU', type=int)
     parser.add_argument('--server_with_cpu', help='seed for random initialization;', action="store_true", default=False)
     parser.add_argument('--num_threads', help="the number of threads in the clients computing session", type=int, default=1)
+    parser.add_argument('--index_sampler', help='gather each local batch of in-memory tensor datasets by indexing at once instead of iterating DataLoader', action="store_true", default=False)
     parser.add_argument('--num_workers', help='the number of workers of DataLoader', type=int, default=0)
     parser.add_argument('--test_batch_size', help='the batch_size used in testing phase;', type=int, default=512)
+    parser.add_argument('--flat_model', help='back the parameters of each model with a contiguous vector to speed up model arithmetic', action="store_true", default=False)
+    parser.add_argument('--train_context', help="reuse the model and the optimizer of local training across rounds, one for each client ('client') or one shared by the clients in each process ('worker')", type=str, choices=['none', 'client', 'worker'], default='none')
+    parser.add_argument('--train_context_capacity', help="the maximum number of the training contexts of clients kept in each process when train_context is 'client', and 0 means no limit", type=int, default=0)
+    parser.add_argument('--shared_broadcast', help='send one read-only snapshot of the global model to all the clients instead of a deep copy for each of them', action="store_true", default=False)
+    parser.add_argument('--compressor', help="the compressor of the models uploaded by clients (e.g. 'topk-0.01', 'qsgd-8', 'quant-8', 'sketch-0.1-3'), and empty means no compression", type=str, default='')
+    parser.add_argument('--delta_download', help='the number of the recent versions of the global model kept by the server to send clients the differences from their cached versions, and 0 means always sending the full model', type=int, default=0)
+    parser.add_argument('--download_compressor', help="the lossless compressor of the differences sent to clients (i.e. 'sparse'), since the clients' cached models would drift away from the server's versions under lossy compression, and empty means 'sparse'", type=str, default='')
+    parser.add_argument('--vmap_clients', help='train the selected clients simultaneously by vectorizing over clients if the model supports it, which falls back to training them one by one when profiling the local training or when the clients are on different devices', action="store_true", default=False)
 
     """Simulator Options"""
     # the simulating systemic configuration of clients and the server that helps constructing the heterogeity in the network condition & computing power
     parser.add_argument('--simulator', help='name of system simulator', type=str, default='default_simulator')
+    parser.add_argument('--event_skipping', help='let the clock jump to the next event instead of stepping one unit of time each time, where the states of clients are sampled once per jump by the multi-step transition probabilities (i.e. equal in distribution but not identical to stepping). The jump is split where the availability may change, so time-varying availability that is not roundwise fixed falls back to stepping one unit of time unless its state updater reports when the availability changes', action="store_true", default=False)
     parser.add_argument('--availability', help="client availability mode", type=str, default = 'IDL')
     parser.add_argument('--connectivity', help="client connectivity mode", type=str, default = 'IDL')
     parser.add_argument('--completeness', help="client completeness mode", type=str, default = 'IDL')
@@ -82,9 +102,13 @@ def read_option():
     # logger setting
     parser.add_argument('--logger', help='the Logger in utils.logger.logger_name will be loaded', type=str, default='basic_logger')
     parser.add_argument('--log_level', help='the level of logger', type=str, default='INFO')
+    parser.add_argument('--stream_record', help='append the results of each evaluation to a line-oriented record file instead of only saving the record at the end', action="store_true", default=False)
+    parser.add_argument('--profile', help='record the wall time, cpu time and peak memory of each phase and save their summary alongside the record', action="store_true", default=False)
     parser.add_argument('--log_file', help='bool controls whether log to file and default value is False', action="store_true", default=False)
     parser.add_argument('--no_log_console', help='bool controls whether log to screen and default value is True', action="store_true", default=False)
     parser.add_argument('--no_overwrite', help='bool controls whether to overwrite the old result', action="store_true", default=False)
+    parser.add_argument('--checkpoint_interval', help='save the checkpoint of the run every __ rounds, and 0 means no checkpoint', type=int, default=0)
+    parser.add_argument('--checkpoint', help="the path of the checkpoint, and empty means 'task/checkpoint/record_name.ckpt'", type=str, default='')
     parser.add_argument('--eval_interval', help='evaluate every __ rounds;', type=int, default=1)
 
     try: option = vars(parser.parse_args())
@@ -121,7 +145,7 @@ def init_taskcore(option):
     return pipe, class_calculator
 
 def init_device(option):
-    dev_list = [torch.device('cpu')] if option['gpu'] is None else [torch.device('cuda:{}'.format(gpu_id)) for gpu_id in option['gpu']]
+    dev_list = [torch.device('cpu')] if option['gpu'] is None or len(option['gpu'])==0 else [torch.device('cuda:{}'.format(gpu_id)) for gpu_id in option['gpu']]
     dev_manager = flgo.utils.fmodule.get_device()
     cfg.logger.info('Initializing devices: '+','.join([str(dev) for dev in dev_list])+' will be used for this running.')
     return dev_list, dev_manager
@@ -149,7 +173,7 @@ def init_system_environment(objects, option):
     # init virtual systemic configuration including network state and the distribution of computing power
     cfg.logger.info('Use `{}` as the system simulator'.format(option['simulator']))
     flgo.system_simulator.base.random_seed_gen = flgo.system_simulator.base.seed_generator(option['seed'])
-    cfg.clock = flgo.system_simulator.base.ElemClock()
+    cfg.clock = flgo.system_simulator.base.ElemClock(option['event_skipping'])
     simulator = getattr(importlib.import_module('.'.join(['system_simulator', option['simulator']])), 'StateUpdater')(objects, option)
     cfg.state_updater = simulator
     cfg.clock.register_state_updater(simulator)
@@ -204,8 +228,8 @@ def gen_task(config, task_path='', rawdata_path='', seed=0):
     except:
         pass
 
-def init(task, algorithm, option, model_name='', Logger=flgo.experiment.logger.simple_logger.Logger, simulator=flgo.system_simulator.default_simulator, scene='horizontal'):
-    # init option
+def merge_option(option):
+    """Fill the option with the default values of the options that are not specified"""
     default_option = read_option()
     for op_key in option:
         if op_key in default_option.keys():
@@ -219,7 +243,86 @@ def init(task, algorithm, option, model_name='', Logger=flgo.experiment.logger.s
                     default_option[op_key] = tuple(option[op_key]) if hasattr(option[op_key], '__iter__') else (option[op_key])
                 else:
                     default_option[op_key] = op_type(option[op_key])
-    option = default_option
+    return default_option
+
+# the task data loaded in this process, which is shared by the runs in this process and the processes forked from it
+_task_data_cache = {}
+
+def get_task_data_key(option):
+    # the options that affect the loaded task data
+    return (os.path.abspath(option['task']), option['seed'], option['train_holdout'], option['test_holdout'], option['lazy_data'], option['lazy_data_capacity'], option['predecode_data'], option['predecode_dtype'])
+
+def get_task_data_cache_path(option):
+    # the directory of the prepared task data on the disk
+    name = 'S{}_TRH{}_TEH{}'.format(option['seed'], option['train_holdout'], option['test_holdout'])
+    # the local datasets are split by the seeded generators when lazy_data is set
+    if option['lazy_data']: name += '_LD'
+    if option['predecode_data']: name += '_PD' + option['predecode_dtype']
+    return os.path.join(option['task'], 'cache', name)
+
+def load_task_data(task_pipe, option):
+    """
+    Load the data of the task by the task pipe. If option['cache_task_data'] is True, the loaded data is cached
+    in this process together with the states of the random number generators after loading, so that a run using
+    the cached data is the same as the one loading the data by itself. If option['cache_task_data_on_disk'] is True,
+    the prepared datasets are also saved as arrays under the task (see `get_task_data_cache_path`) and the later runs
+    with the same seed and holdout options load them by memory-mapping instead of preparing the data again.
+    :param
+        task_pipe: the task pipe of the task
+        option: the running-time option
+    :return
+        task_data: the data of the task
+    """
+    key = get_task_data_key(option)
+    if option['cache_task_data'] and key in _task_data_cache:
+        task_data, rng_state = _task_data_cache[key]
+        flgo.utils.fcheckpoint.set_rng_state(rng_state)
+        return task_data
+    cache_path = get_task_data_cache_path(option) if option['cache_task_data_on_disk'] else None
+    if cache_path is not None and os.path.exists(os.path.join(cache_path, 'rng_state.pt')):
+        task_data = flgo.benchmark.toolkits.base.load_prepared_task_data(cache_path)
+        rng_state = flgo.utils.fcheckpoint.load_file(os.path.join(cache_path, 'rng_state.pt'))
+    else:
+        task_data = task_pipe.load_data(option)
+        rng_state = flgo.utils.fcheckpoint.get_rng_state()
+        # the datasets whose samples are not pairs of tensors (e.g. graphs) or are randomly augmented won't be cached on the disk
+        if cache_path is not None and flgo.benchmark.toolkits.base.save_prepared_task_data(task_data, cache_path):
+            # the state is saved at last to mark the cache as complete
+            torch.save(rng_state, os.path.join(cache_path, 'rng_state.pt'))
+    flgo.utils.fcheckpoint.set_rng_state(rng_state)
+    if option['cache_task_data']: _task_data_cache[key] = (task_data, rng_state)
+    return task_data
+
+def preload_task_data(task, option):
+    """
+    Load the data of the task into the cache of this process (e.g. before forking the processes of the runs on the task)
+    :param
+        task: the path of the task
+        option: the running-time option
+    :return
+        the key of the cached data
+    """
+    option = merge_option(option)
+    option['task'] = task
+    option['cache_task_data'] = True
+    setup_seed(seed=option['seed'])
+    with open(os.path.join(task, 'info'), 'r') as inf:
+        benchmark = json.load(inf)['benchmark']
+    task_pipe = getattr(importlib.import_module('.'.join(['flgo','benchmark',benchmark, 'core'])), 'TaskPipe')(task)
+    load_task_data(task_pipe, option)
+    return get_task_data_key(option)
+
+def clear_task_data_cache(key=None):
+    if key is None: _task_data_cache.clear()
+    else: _task_data_cache.pop(key, None)
+
+def init(task, algorithm, option, model_name='', Logger=flgo.experiment.logger.simple_logger.Logger, simulator=flgo.system_simulator.default_simulator, scene='horizontal', resume=''):
+    # close the worker pool left by the previous run in this process
+    if getattr(cfg, 'worker_pool', None) is not None:
+        cfg.worker_pool.close()
+        cfg.worker_pool = None
+    # init option
+    option = merge_option(option)
     setup_seed(seed=option['seed'])
     option['task'] = task
     option['algorithm'] = (algorithm.__name__).split('.')[-1]
@@ -250,7 +353,7 @@ def init(task, algorithm, option, model_name='', Logger=flgo.experiment.logger.s
     core_module = '.'.join(['flgo','benchmark',benchmark, 'core'])
     task_pipe = getattr(importlib.import_module(core_module), 'TaskPipe')(task)
     cfg.TaskCalculator = getattr(importlib.import_module(core_module), 'TaskCalculator')
-    task_data = task_pipe.load_data(option)
+    task_data = load_task_data(task_pipe, option)
 
     # init model
     if model_name=='': model_name = getattr(importlib.import_module('.'.join(['flgo','benchmark',benchmark])), 'default_model')
@@ -274,16 +377,31 @@ def init(task, algorithm, option, model_name='', Logger=flgo.experiment.logger.s
     # init objects
     objects = task_pipe.generate_objects(option, algorithm, scene=scene)
     task_pipe.distribute(task_data, objects)
-    for ob in objects: ob.initialize()
+    flgo.utils.fcheckpoint.initialize_objects(objects)
 
     # init virtual system environment
     cfg.logger.info('Use `{}` as the system simulator'.format(simulator))
     flgo.system_simulator.base.random_seed_gen = flgo.system_simulator.base.seed_generator(option['seed'])
-    cfg.clock = flgo.system_simulator.base.ElemClock()
+    cfg.clock = flgo.system_simulator.base.ElemClock(option['event_skipping'])
     cfg.state_updater = getattr(simulator, 'StateUpdater')(objects, option)
     cfg.clock.register_state_updater(state_updater=cfg.state_updater)
 
-    cfg.logger.register_variable(coordinator=objects[0], participants=objects[1:], option=option, clock=cfg.clock)
+    profiler = flgo.utils.fprofile.Profiler() if option['profile'] else None
+    cfg.logger.register_variable(coordinator=objects[0], participants=objects[1:], option=option, clock=cfg.clock, profiler=profiler)
     cfg.logger.initialize()
+
+    # resume the run from the checkpoint
+    worker_rng = None
+    if resume != '':
+        worker_rng = flgo.utils.fcheckpoint.load_checkpoint(resume, objects[0])
+        cfg.logger.info('Resume from the checkpoint {} at round {}'.format(resume, objects[0].current_round))
+
+    # init the persistent pool for training clients in parallel, which happens after resuming the run so
+    # that the workers are seeded with the restored clients
+    cfg.worker_pool = flgo.utils.fpool.WorkerPool(option['num_threads'], objects[1:], objects[0].model, profiler, option['seed'], worker_rng) if option['num_threads']>1 else None
+
+    # profile the phases of training by wrapping the methods of the objects, which happens after the clients
+    # being copied into the workers so that the resident clients are profiled by the workers themselves
+    if profiler is not None: profiler.attach(objects[0], objects[1:], cfg.state_updater, cfg.logger)
     cfg.logger.info('Ready to start.')
     return objects[0]
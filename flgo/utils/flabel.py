@@ -0,0 +1,72 @@
+"""
+The label index of datasets. The labels of a dataset are read from its index without touching
+the features of samples whenever possible (e.g. `targets` of torchvision datasets, the label
+tensor of TensorDataset, the label array of MemmapXYDataset, and the indices of subsets into
+their parent datasets), and only the datasets of unknown types are iterated sample by sample.
+The labels and the label histograms are cached for each dataset, so that partitioners,
+visualizers and system simulators can query them repeatedly for free.
+"""
+import collections
+import weakref
+import numpy as np
+import torch
+
+_label_cache = weakref.WeakKeyDictionary()
+
+def _as_label(value):
+    if isinstance(value, torch.Tensor) and value.numel() == 1: return value.item()
+    if isinstance(value, np.ndarray) and value.size == 1: return value.item()
+    return value
+
+def _read_labels(dataset, flag_index):
+    # the dataset that defers building itself (e.g. LazyDataset) is read through the built one
+    if callable(getattr(type(dataset), 'materialize', None)): return get_labels(dataset.materialize(), flag_index)
+    if isinstance(dataset, torch.utils.data.Subset): return get_labels(dataset.dataset, flag_index)[np.asarray(dataset.indices, dtype=np.int64)]
+    if isinstance(dataset, torch.utils.data.ConcatDataset):
+        return np.concatenate([get_labels(d, flag_index) for d in dataset.datasets]) if len(dataset.datasets) > 0 else np.array([])
+    if isinstance(dataset, torch.utils.data.TensorDataset): return dataset.tensors[flag_index].numpy()
+    # the samples of torchvision datasets and MemmapXYDataset are (x, y)
+    if flag_index in [-1, 1]:
+        for attr in ['targets', 'labels', 'y']:
+            labels = getattr(dataset, attr, None)
+            if isinstance(labels, (list, np.ndarray, torch.Tensor)) and len(labels) == len(dataset):
+                return labels.numpy() if isinstance(labels, torch.Tensor) else np.asarray(labels)
+    return np.asarray([_as_label(dataset[i][flag_index]) for i in range(len(dataset))])
+
+def _get_entry(dataset, flag_index):
+    try:
+        entry = _label_cache.setdefault(dataset, {})
+    except TypeError:
+        # the dataset cannot be weakly referenced or hashed
+        entry = {}
+    return entry.setdefault(flag_index, {})
+
+def get_labels(dataset, flag_index=-1):
+    """
+    Get the labels of all the samples in the dataset
+    :param
+        dataset: the dataset
+        flag_index: the position of the label in each sample
+    :return
+        an np.ndarray of the labels
+    """
+    if dataset is None: return np.array([])
+    entry = _get_entry(dataset, flag_index)
+    if 'labels' not in entry: entry['labels'] = _read_labels(dataset, flag_index)
+    return entry['labels']
+
+def get_label_counter(dataset, flag_index=-1):
+    """
+    Get the histogram of the labels in the dataset
+    :param
+        dataset: the dataset
+        flag_index: the position of the label in each sample
+    :return
+        a collections.Counter of {label: the number of samples}
+    """
+    if dataset is None: return collections.Counter()
+    entry = _get_entry(dataset, flag_index)
+    if 'counter' not in entry:
+        labels, counts = np.unique(get_labels(dataset, flag_index), return_counts=True)
+        entry['counter'] = collections.Counter(dict(zip(labels.tolist(), counts.tolist())))
+    return entry['counter']
@@ -1,3 +1,5 @@
+import copy
+import itertools
 import torch
 from torch import nn
 import config as cfg
@@ -6,6 +8,7 @@ class FModule(nn.Module):
     def __init__(self):
         super().__init__()
         self.ingraph = False
+        self._flat = None
 
     def __add__(self, other):
         if isinstance(other, int) and other == 0 : return self
@@ -36,19 +39,30 @@ class FModule(nn.Module):
         return _model_scale(self, -1.0)
 
     def __sizeof__(self):
-        if not hasattr(self, '__size'):
-            param_size = 0
-            param_sum = 0
-            for param in self.parameters():
-                param_size += param.nelement() * param.element_size()
-                param_sum += param.nelement()
-            buffer_size = 0
-            buffer_sum = 0
-            for buffer in self.buffers():
-                buffer_size += buffer.nelement() * buffer.element_size()
-                buffer_sum += buffer.nelement()
-            self.__size = param_size + buffer_size
-        return self.__size
+        # only the cached byte footprint is read since the size is queried for each package
+        return self._get_size_cache()['bytes']
+
+    def _get_size_cache(self):
+        info = self.__dict__.get('_size_info', None)
+        if info is None:
+            params, buffers = list(self.parameters()), [b for b in self.buffers() if b is not None]
+            info = {
+                'bytes': sum([t.nelement() * t.element_size() for t in params + buffers]),
+                'num_params': sum([p.numel() for p in params]),
+            }
+            self.__dict__['_size_info'] = info
+        return info
+
+    def size_info(self):
+        """
+        Return the byte footprint and the numbers of parameters of the model. The byte footprint and the
+        number of parameters are computed once and cached in the model (i.e. copied along with the model
+        and reset when the tensors are moved or cast by `_apply`), while the number of trainable parameters
+        is not cached and is counted on each call since `requires_grad` can be switched in place (e.g. freezing layers).
+        :return
+            a dict of {'bytes': ..., 'num_params': ..., 'num_trainable_params': ...}
+        """
+        return dict(self._get_size_cache(), num_trainable_params=sum([p.numel() for p in self.parameters() if p.requires_grad]))
 
     def norm(self, p=2):
         return self**p
@@ -93,7 +107,64 @@ class FModule(nn.Module):
     def get_device(self):
         return next(self.parameters()).device
 
+    def flatten(self):
+        """
+        Back all the parameters and the buffers (sharing the dtype of the first parameter)
+        of the model with views into one contiguous 1-D tensor `self._flat`, so that the
+        arithmetic between flattened models of the same architecture is computed by fused
+        vector operations without re-constructing modules layer by layer.
+        Directly assigning `p.data` of any parameter will break the backing, and calling
+        this method again will re-flatten the model.
+        :return
+            self
+        """
+        members = [(n, t) for n, t in itertools.chain(self.named_parameters(), self.named_buffers()) if t is not None]
+        if len(members)==0: return self
+        dtype, device = members[0][1].dtype, members[0][1].device
+        members = [(n, t) for n, t in members if t.dtype==dtype]
+        flat = torch.empty(sum([t.numel() for _, t in members]), dtype=dtype, device=device)
+        offset = 0
+        with torch.no_grad():
+            for _, t in members:
+                numel = t.numel()
+                flat[offset:offset+numel].copy_(t.data.reshape(-1))
+                t.data = flat[offset:offset+numel].view(t.shape)
+                offset += numel
+        member_names = set([n for n, _ in members])
+        self._flat = flat
+        self._flat_num_params = sum([p.numel() for p in self.parameters() if p.dtype==dtype])
+        self._flat_extra = [k for k in self.state_dict().keys() if k not in member_names]
+        return self
+
+    def is_flat(self):
+        """Check whether the parameters of the model are still backed by `self._flat`"""
+        if getattr(self, '_flat', None) is None: return False
+        p = next(self.parameters(), None)
+        return p is not None and p.device==self._flat.device and p.data_ptr()==self._flat.data_ptr()
+
+    def _apply(self, fn, *args, **kwargs):
+        res = super()._apply(fn, *args, **kwargs)
+        self.__dict__['_size_info'] = None
+        # re-flatten the model if its tensors were moved (e.g. to another device or dtype)
+        if getattr(self, '_flat', None) is not None and not self.is_flat(): self.flatten()
+        return res
+
+    def __deepcopy__(self, memo):
+        # copy the flattened model as a whole vector to keep the copy flattened
+        if self.is_flat() and id(self._flat) not in memo:
+            return _model_from_flat(self, self._flat.clone(), memo=memo)
+        res = self.__class__.__new__(self.__class__)
+        memo[id(self)] = res
+        res.__setstate__(copy.deepcopy(self.__dict__, memo))
+        return res
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        # the views are not preserved by pickling (e.g. when transferring models across processes)
+        if getattr(self, '_flat', None) is not None and not self.is_flat(): self.flatten()
+
     def count_parameters(self, output=True):
+        if not output: return self.size_info()['num_trainable_params']
         try:
             import prettytable as pt
         except:
@@ -113,6 +184,44 @@ class FModule(nn.Module):
             print(f"TotalTrainableParams: {total_params}")
         return total_params
 
+class ModelSnapshot:
+    """
+    A read-only snapshot of the weights of a model that is shared by all the receivers
+    instead of deeply copying the model for each of them. The receivers materialize the
+    snapshot lazily into their own reusable local models by `materialize`.
+    """
+    def __init__(self, model, share_memory=False):
+        """
+        :param
+            model: the model to be snapshotted
+            share_memory: move the weights into shared memory so that the snapshot can be sent to other processes without copying
+        """
+        self.model_class = model.__class__
+        self.device = model.get_device()
+        self.flat = model.is_flat()
+        self.state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        if share_memory:
+            for v in self.state.values(): v.share_memory_()
+        self.size = sum([v.nelement() * v.element_size() for v in self.state.values()])
+
+    def materialize(self, model=None):
+        """
+        Load the weights into `model` in place, and create a new model only when `model`
+        is None or of a different architecture.
+        :param
+            model: the reusable local model
+        :return
+            the model with the snapshotted weights
+        """
+        if model is None or model.__class__ is not self.model_class:
+            model = self.model_class().to(self.device)
+            if self.flat: model.flatten()
+        model.load_state_dict(self.state)
+        return model
+
+    def __sizeof__(self):
+        return self.size
+
 def normalize(m):
     return m/(m**2)
 
@@ -132,6 +241,8 @@ def log(m):
 
 def element_wise_func(m, func):
     if m is None: return None
+    if not m.ingraph and m.is_flat():
+        return _model_from_flat(m, func(m._flat), _modeldict_element_wise(_flat_extra_dict(m), func))
     res = m.__class__().to(m.get_device())
     if m.ingraph:
         res.op_with_graph()
@@ -145,6 +256,7 @@ def element_wise_func(m, func):
     return res
 
 def _model_to_tensor(m):
+    if m.is_flat(): return m._flat[:m._flat_num_params].clone()
     return torch.cat([mi.data.view(-1) for mi in m.parameters()])
 
 def _model_from_tensor(mt, model_class=None):
@@ -163,6 +275,10 @@ def _model_from_tensor(mt, model_class=None):
 def _model_sum(ms):
     if len(ms)==0: return None
     op_with_graph = sum([mi.ingraph for mi in ms]) > 0
+    if not op_with_graph and all([_flat_compatible(ms[0], mi) for mi in ms]):
+        vec = ms[0]._flat.clone()
+        for mi in ms[1:]: vec.add_(mi._flat)
+        return _model_from_flat(ms[0], vec, _modeldict_sum([_flat_extra_dict(mi) for mi in ms]))
     res = ms[0].__class__().to(ms[0].get_device())
     if op_with_graph:
         mlks = [get_module_from_model(mi) for mi in ms]
@@ -182,6 +298,10 @@ def _model_average(ms = [], p = []):
     if len(ms)==0: return None
     if len(p)==0: p = [1.0 / len(ms) for _ in range(len(ms))]
     op_with_graph = sum([w.ingraph for w in ms]) > 0
+    if not op_with_graph and all([_flat_compatible(ms[0], mi) for mi in ms]):
+        vec = torch.zeros_like(ms[0]._flat)
+        for mi, pi in zip(ms, p): vec.add_(mi._flat, alpha=pi)
+        return _model_from_flat(ms[0], vec, _modeldict_weighted_average([_flat_extra_dict(mi) for mi in ms], p))
     res = ms[0].__class__().to(ms[0].get_device())
     if op_with_graph:
         mlks = [get_module_from_model(mi) for mi in ms]
@@ -199,6 +319,8 @@ def _model_average(ms = [], p = []):
 
 def _model_add(m1, m2):
     op_with_graph = m1.ingraph or m2.ingraph
+    if not op_with_graph and _flat_compatible(m1, m2):
+        return _model_from_flat(m1, m1._flat + m2._flat, _modeldict_add(_flat_extra_dict(m1), _flat_extra_dict(m2)))
     res = m1.__class__().to(m1.get_device())
     if op_with_graph:
         res.op_with_graph()
@@ -216,6 +338,8 @@ def _model_add(m1, m2):
 
 def _model_sub(m1, m2):
     op_with_graph = m1.ingraph or m2.ingraph
+    if not op_with_graph and _flat_compatible(m1, m2):
+        return _model_from_flat(m1, m1._flat - m2._flat, _modeldict_sub(_flat_extra_dict(m1), _flat_extra_dict(m2)))
     res = m1.__class__().to(m1.get_device())
     if op_with_graph:
         res.op_with_graph()
@@ -233,6 +357,8 @@ def _model_sub(m1, m2):
 
 def _model_scale(m, s):
     op_with_graph = m.ingraph
+    if not op_with_graph and m.is_flat():
+        return _model_from_flat(m, m._flat * s, _modeldict_scale(_flat_extra_dict(m), s))
     res = m.__class__().to(m.get_device())
     if op_with_graph:
         ml = get_module_from_model(m)
@@ -249,6 +375,11 @@ def _model_scale(m, s):
 
 def _model_norm(m, power=2):
     op_with_graph = m.ingraph
+    if not op_with_graph and m.is_flat() and m._flat.dtype in [torch.float, torch.float32, torch.float64]:
+        res = torch.sum(torch.pow(m._flat, power))
+        extra = _flat_extra_dict(m)
+        if len(extra)>0: res = res + torch.pow(_modeldict_norm(extra, power), power)
+        return torch.pow(res, 1.0 / power)
     res = torch.tensor(0.).to(m.get_device())
     if op_with_graph:
         ml = get_module_from_model(m)
@@ -263,6 +394,11 @@ def _model_norm(m, power=2):
 
 def _model_dot(m1, m2):
     op_with_graph = m1.ingraph or m2.ingraph
+    if not op_with_graph and _flat_compatible(m1, m2):
+        res = m1._flat.dot(m2._flat)
+        extra1 = _flat_extra_dict(m1)
+        if len(extra1)>0: res = res + _modeldict_dot(extra1, _flat_extra_dict(m2))
+        return res
     if op_with_graph:
         res = torch.tensor(0.).to(m1.get_device())
         ml1 = get_module_from_model(m1)
@@ -273,8 +409,54 @@ def _model_dot(m1, m2):
     else:
         return _modeldict_dot(m1.state_dict(), m2.state_dict())
 
+def _model_add_(m1, m2, alpha=1.0):
+    """
+    In-place m1 += alpha * m2 without creating any new model. The integer tensors
+    (e.g. num_batches_tracked) of m1 are kept unchanged.
+    """
+    with torch.no_grad():
+        if _flat_compatible(m1, m2):
+            m1._flat.add_(m2._flat, alpha=alpha)
+            _modeldict_add_(_flat_extra_dict(m1), _flat_extra_dict(m2), alpha)
+        else:
+            _modeldict_add_(m1.state_dict(), m2.state_dict(), alpha)
+    return m1
+
+def _model_scale_(m, s):
+    """In-place m *= s without creating any new model. The integer tensors of m are kept unchanged."""
+    with torch.no_grad():
+        if m.is_flat():
+            m._flat.mul_(s)
+            _modeldict_scale_(_flat_extra_dict(m), s)
+        else:
+            _modeldict_scale_(m.state_dict(), s)
+    return m
+
+def _model_stream_sum(ms, weights, res=None):
+    """
+    Accumulate Σ weights[k] * ms[k] into a single running model so that only one extra
+    copy of the model is created no matter how many models are summed.
+    :param
+        ms: an iterable of models (e.g. a generator that yields the models as they arrive)
+        weights: an iterable of the weights of models
+        res: the model to accumulate into. A copy of the first model will be created if res is None.
+    :return
+        res: the weighted sum, whose integer tensors (e.g. num_batches_tracked) are the element-wise maximum over
+        the models (and res) so that they don't depend on the order of the models
+    """
+    for m, w in zip(ms, weights):
+        if res is None: res = _model_scale_(copy.deepcopy(m), w)
+        else:
+            _model_add_(res, m, w)
+            with torch.no_grad():
+                if _flat_compatible(res, m): _modeldict_int_max_(_flat_extra_dict(res), _flat_extra_dict(m))
+                else: _modeldict_int_max_(res.state_dict(), m.state_dict())
+    return res
+
 def _model_cossim(m1, m2):
     op_with_graph = m1.ingraph or m2.ingraph
+    if not op_with_graph and _flat_compatible(m1, m2):
+        return m1._flat.dot(m2._flat) / (torch.norm(m1._flat) * torch.norm(m2._flat))
     if op_with_graph:
         res = torch.tensor(0.).to(m1.get_device())
         ml1 = get_module_from_model(m1)
@@ -290,6 +472,46 @@ def _model_cossim(m1, m2):
     else:
         return _modeldict_cossim(m1.state_dict(), m2.state_dict())
 
+def _flat_compatible(m1, m2):
+    """Check whether two models are flattened with the same layout so that they can be operated as vectors"""
+    if not (isinstance(m2, FModule) and m1.__class__ == m2.__class__ and m1.is_flat() and m2.is_flat()): return False
+    f1, f2 = m1._flat, m2._flat
+    return f1.shape==f2.shape and f1.dtype==f2.dtype and f1.device==f2.device and m1._flat_extra==m2._flat_extra
+
+def _flat_extra_dict(m):
+    """Return the tensors in the state_dict of the flattened model `m` that are not backed by `m._flat` (e.g. num_batches_tracked)"""
+    res = {}
+    for name in m._flat_extra:
+        obj = m
+        for attr in name.split('.'): obj = getattr(obj, attr)
+        res[name] = obj
+    return res
+
+def _model_from_flat(m, vec, extra={}, memo=None):
+    """
+    Create a flattened model that shares the architecture of the flattened model `m` and whose
+    parameters are views into `vec`, without re-constructing the modules by `m.__class__()`
+    :param
+        m: the flattened template model
+        vec: the 1-D tensor that has the same layout as `m._flat`
+        extra: the values of the tensors in the state_dict that are not backed by the vector
+        memo: the memo of copy.deepcopy
+    :return
+        res: the new model
+    """
+    if memo is None: memo = {}
+    memo[id(m._flat)] = vec
+    offset = 0
+    for t in itertools.chain(m.parameters(), m.buffers()):
+        if t is None or t.dtype != m._flat.dtype or id(t) in memo: continue
+        numel = t.numel()
+        view = vec[offset:offset+numel].view(t.shape)
+        memo[id(t)] = nn.Parameter(view, requires_grad=t.requires_grad) if isinstance(t, nn.Parameter) else view
+        offset += numel
+    res = copy.deepcopy(m, memo)
+    if len(extra)>0: _modeldict_cp(_flat_extra_dict(res), extra)
+    return res
+
 def get_module_from_model(model, res = None):
     if res==None: res = []
     ch_names = [item[0] for item in model.named_children()]
@@ -380,6 +602,24 @@ def _modeldict_scale(md, c):
         res[layer] = md[layer] * c
     return res
 
+def _modeldict_add_(md1, md2, alpha=1.0):
+    for layer in md1.keys():
+        if md1[layer] is None or not torch.is_floating_point(md1[layer]): continue
+        md1[layer].add_(md2[layer], alpha=alpha)
+    return md1
+
+def _modeldict_int_max_(md1, md2):
+    for layer in md1.keys():
+        if md1[layer] is None or torch.is_floating_point(md1[layer]) or torch.is_complex(md1[layer]): continue
+        md1[layer].copy_(torch.maximum(md1[layer], md2[layer]))
+    return md1
+
+def _modeldict_scale_(md, c):
+    for layer in md.keys():
+        if md[layer] is None or not torch.is_floating_point(md[layer]): continue
+        md[layer].mul_(c)
+    return md
+
 def _modeldict_sub(md1, md2):
     res = {}
     for layer in md1.keys():
@@ -0,0 +1,178 @@
+"""
+A long-lived process pool for training clients in parallel. The pool is created once
+when initializing the federated system, and each worker keeps a resident copy of all
+the clients (including their local datasets). For each task, only the lightweight
+attributes of the client (e.g. learning rate, number of local steps, device) and the
+weights of the models in the package are shipped to the worker, and only the weights
+of the models in the reply are shipped back. Each client is pinned to one worker (i.e. the
+client k is always trained by the worker k%num_workers), so that the resident state of the
+client (e.g. its DataLoader, compressor residual and optimizer state) lives in exactly one
+worker and can be collected from it when saving checkpoints.
+"""
+import collections
+import copy
+import random
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from flgo.utils.fmodule import FModule
+from flgo.utils.feval import Evaluator
+from flgo.utils.fprofile import Profiler, ProfiledMethod
+
+# the attributes of clients that stay resident in the workers and won't be synchronized per task
+RESIDENT_ATTRS = ['train_data', 'valid_data', 'test_data', 'data_loader', 'server', '_local_model', 'compressor', '_compression_reference', '_data_loader_rng', '_data_loader_pos', '_batch_perm', '_optimizer_state', '_pending_data_loader']
+
+_worker_clients = None
+_worker_model = None
+_worker_evaluator = None
+_worker_profiler = None
+
+class ModelWeights:
+    """The placeholder of a model in a package, which only contains the weights (or the copies of them) of the model"""
+    def __init__(self, model, clone=False):
+        self.state_dict = {k: v.detach().clone() for k, v in model.state_dict().items()} if clone else model.state_dict()
+
+    def to_model(self, template):
+        model = copy.deepcopy(template)
+        model.load_state_dict(self.state_dict)
+        return model
+
+def pack_weights(package, clone=False):
+    if package is None: return None
+    return {k: (ModelWeights(v, clone) if isinstance(v, FModule) else v) for k, v in package.items()}
+
+def unpack_weights(package, template):
+    if package is None: return None
+    return {k: (v.to_model(template) if isinstance(v, ModelWeights) else v) for k, v in package.items()}
+
+def client_state(client):
+    # the methods wrapped by the profiler in the main process are not shipped, and the resident clients are profiled in the workers
+    return {k: v for k, v in client.__dict__.items() if k not in RESIDENT_ATTRS and not isinstance(v, ProfiledMethod)}
+
+def in_worker():
+    """Check whether the current process is a worker of WorkerPool"""
+    return _worker_clients is not None
+
+def _init_worker(clients, model, profile=False, seed=0, rng_state=None):
+    global _worker_clients, _worker_model, _worker_profiler
+    import flgo.utils.fcheckpoint as fcheckpoint
+    _worker_clients = clients
+    _worker_model = model
+    if profile: _worker_profiler = Profiler().attach(None, clients)
+    # the RNGs of the worker are seeded (or restored from the checkpoint) to make the local training reproducible
+    if rng_state is not None: fcheckpoint.set_rng_state(rng_state)
+    else:
+        random.seed(seed)
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+def _reply(client_id, state, package, current_round=0):
+    client = _worker_clients[client_id]
+    client.__dict__.update(state)
+    if _worker_profiler is not None: _worker_profiler.current_round = current_round
+    # the tensors are sent by sharing their memory, so the weights of the model reused by the training context are
+    # copied out before the model is trained again by the next task (e.g. of another client sharing the context)
+    reply = pack_weights(client.reply(unpack_weights(package, _worker_model)), getattr(client, 'train_context', 'none') != 'none')
+    # the records of profiling the reply are sent back together with it
+    return reply, (_worker_profiler.pop_records() if _worker_profiler is not None else None)
+
+def _get_checkpoint_state(client_ids, states):
+    import flgo.utils.fcheckpoint as fcheckpoint
+    client_states = {}
+    for cid, state in zip(client_ids, states):
+        client = _worker_clients[cid]
+        client.__dict__.update(state)
+        client_states[cid] = client.get_checkpoint_state()
+    return client_states, fcheckpoint.get_rng_state()
+
+def _global_test(client_ids, dataflag, package):
+    global _worker_evaluator
+    if _worker_evaluator is None:
+        c = _worker_clients[client_ids[0]]
+        _worker_evaluator = Evaluator(c.calculator, c.test_batch_size)
+    model = unpack_weights(package, _worker_model)['model'].to(_worker_evaluator.calculator.device)
+    datasets = [_worker_clients[cid].train_data if dataflag=='train' else _worker_clients[cid].valid_data for cid in client_ids]
+    return _worker_evaluator.evaluate(model, datasets)
+
+class WorkerPool:
+    def __init__(self, num_workers, clients, model, profiler=None, seed=0, rng_states=None):
+        """
+        :param
+            num_workers: the number of processes
+            clients: the clients that will be resident in each worker
+            model: the template model used to rebuild models from the shipped weights
+            profiler: the profiler that the records of the resident clients in the workers are merged into
+            seed: the random seed of the workers, where the worker k is seeded by seed+k
+            rng_states: the states of the RNGs of the workers restored from the checkpoint
+        """
+        self.num_workers = num_workers
+        self.model = model
+        self.profiler = profiler
+        if rng_states is not None and len(rng_states) != num_workers: rng_states = None
+        # each worker is a single-process pool so that the tasks of a client can be sent to its own worker
+        self.workers = [mp.Pool(1, initializer=_init_worker, initargs=(clients, model, profiler is not None, seed + k, rng_states[k] if rng_states is not None else None)) for k in range(num_workers)]
+
+    def get_worker(self, client_id):
+        """Get the worker that the client is pinned to"""
+        return self.workers[int(client_id) % self.num_workers]
+
+    def reply_async(self, client, package):
+        """
+        Let the resident copy of `client` reply to `package` in its worker.
+        :param
+            client: the client on the server's side whose lightweight attributes will be synchronized to the worker
+            package: the package sent from the server
+        :return
+            an AsyncResult and the reply can be obtained by `self.get(res)`
+        """
+        current_round = self.profiler.get_round() if self.profiler is not None else 0
+        return self.get_worker(client.id).apply_async(_reply, args=(int(client.id), client_state(client), pack_weights(package), current_round))
+
+    def get(self, async_result):
+        reply, records = async_result.get()
+        if self.profiler is not None and records is not None: self.profiler.merge(records)
+        return unpack_weights(reply, self.model)
+
+    def global_test(self, model, client_ids, dataflag='valid'):
+        """
+        Evaluate the model on the resident data of the clients, which are sharded across the workers.
+        :param
+            model: the model to be evaluated
+            client_ids: the ids of the clients to be evaluated
+            dataflag: choose train data or valid data to evaluate
+        :return
+            metrics: a dict contains the lists of each metric_value of the clients in the order of client_ids
+        """
+        package = pack_weights({'model': model})
+        shards = [shard.tolist() for shard in np.array_split(client_ids, self.num_workers) if len(shard) > 0]
+        results = [worker.apply_async(_global_test, args=(shard, dataflag, package)) for worker, shard in zip(self.workers, shards)]
+        metrics = collections.defaultdict(list)
+        for res in results:
+            for met_name, met_val in res.get().items():
+                metrics[met_name].extend(met_val)
+        return metrics
+
+    def get_checkpoint_state(self, clients):
+        """
+        Collect the checkpoint states of the clients from the workers that they are pinned to, where the
+        resident attributes come from the workers and the others come from the clients on the server's side
+        :param
+            clients: the clients on the server's side
+        :return
+            the list of the states of the clients and the list of the states of the RNGs of the workers
+        """
+        results = []
+        for k, worker in enumerate(self.workers):
+            pinned = [c for c in clients if int(c.id) % self.num_workers == k]
+            results.append(worker.apply_async(_get_checkpoint_state, args=([int(c.id) for c in pinned], [client_state(c) for c in pinned])))
+        client_states, rng_states = {}, []
+        for res in results:
+            states, rng_state = res.get()
+            client_states.update(states)
+            rng_states.append(rng_state)
+        return [client_states[int(c.id)] for c in clients], rng_states
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+            worker.join()
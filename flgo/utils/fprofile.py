@@ -0,0 +1,158 @@
+"""
+A profiler of the phases of the federated training. The methods of the server, the clients,
+the state updater and the logger are wrapped on the instances (i.e. without changing the code
+of algorithms) so that the wall time, the CPU time and the change of the resident set size (RSS)
+of each call are recorded with the current round. The peak RSS of the process is also recorded,
+which is the high-water mark of the whole run so far rather than the peak of a phase. The records
+are summarized into percentiles and saved alongside the record of the experiment by the logger.
+"""
+import contextlib
+import os
+import sys
+import time
+import numpy as np
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import ujson as json
+except:
+    import json
+
+# the phases to be profiled: (the role of the object, the name of the method, the name of the phase)
+PHASES = [
+    ('server', 'sample', 'sample'),
+    ('server', 'pack', 'pack'),
+    ('server', 'communicate', 'communicate'),
+    ('server', 'unpack', 'unpack'),
+    ('server', 'aggregate', 'aggregate'),
+    ('client', 'train', 'local_train'),
+    ('logger', 'log_once', 'evaluate'),
+    ('state_updater', 'flush', 'simulator_flush'),
+]
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+def current_rss():
+    """Return the current resident set size of the current process in MB, or None if unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as inf:
+            return int(inf.read().split()[1]) * _PAGE_SIZE / 1024.0 / 1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None: return psutil.Process().memory_info().rss / 1024.0 / 1024.0
+    return None
+
+def process_peak_rss():
+    """Return the peak resident set size of the current process since it started in MB, or None if unavailable"""
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return rss / 1024.0 / 1024.0 if sys.platform == 'darwin' else rss / 1024.0
+
+def new_record():
+    return {'round': [], 'wall': [], 'cpu': [], 'rss_delta': [], 'process_peak_rss': []}
+
+class ProfiledMethod:
+    """The picklable wrapper of a method that records each call into the profiler"""
+    def __init__(self, profiler, method, phase):
+        self.profiler = profiler
+        self.method = method
+        self.phase = phase
+
+    def __call__(self, *args, **kwargs):
+        with self.profiler.profile(self.phase):
+            return self.method(*args, **kwargs)
+
+class Profiler:
+    def __init__(self, server=None):
+        self.server = server
+        self.records = {}
+        # the current round when there is no server (e.g. in the workers of WorkerPool)
+        self.current_round = 0
+
+    def get_round(self):
+        return getattr(self.server, 'current_round', self.current_round)
+
+    @contextlib.contextmanager
+    def profile(self, phase):
+        """Record the wall time, the CPU time and the change of RSS of the code in the context as the phase"""
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss()
+        try:
+            yield
+        finally:
+            rec = self.records.setdefault(phase, new_record())
+            rec['round'].append(self.get_round())
+            rec['wall'].append(time.perf_counter() - wall)
+            rec['cpu'].append(time.process_time() - cpu)
+            rss_after = current_rss()
+            rec['rss_delta'].append(rss_after - rss if rss is not None and rss_after is not None else None)
+            rec['process_peak_rss'].append(process_peak_rss())
+
+    def wrap(self, obj, method_name, phase=None):
+        """Replace the method of the instance `obj` by the profiled one"""
+        if obj is None or not hasattr(obj, method_name): return
+        setattr(obj, method_name, ProfiledMethod(self, getattr(obj, method_name), phase or method_name))
+
+    def attach(self, server, clients=[], state_updater=None, logger=None):
+        """Profile the phases in PHASES of the objects"""
+        self.server = server
+        objects = {'server': [server], 'client': clients, 'state_updater': [state_updater], 'logger': [logger]}
+        for role, method_name, phase in PHASES:
+            for obj in objects[role]:
+                self.wrap(obj, method_name, phase)
+        return self
+
+    def pop_records(self):
+        """Take out the records (e.g. to send the records in a worker process to the main process)"""
+        records, self.records = self.records, {}
+        return records
+
+    def merge(self, records):
+        """Merge the records taken out from another profiler"""
+        for phase, rec in records.items():
+            dst = self.records.setdefault(phase, new_record())
+            for key, values in rec.items(): dst[key].extend(values)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Summarize the records of each phase
+        :param
+            percentiles: the percentiles of the time of calls and of the time per round
+        :return
+            a dict of {phase: {'count':..., 'wall': {...}, 'cpu': {...}, 'round_wall': {...}, 'rss_delta': {...}, 'process_peak_rss': ...}}
+        """
+        res = {}
+        for phase, rec in self.records.items():
+            res[phase] = {'count': len(rec['wall'])}
+            rounds = np.array(rec['round'])
+            for key in ['wall', 'cpu']:
+                values = np.array(rec[key])
+                res[phase][key] = {'total': float(values.sum()), 'mean': float(values.mean())}
+                res[phase][key].update({'p{}'.format(p): float(np.percentile(values, p)) for p in percentiles})
+            # the total wall time of the phase within each round
+            _, inverse = np.unique(rounds, return_inverse=True)
+            round_wall = np.bincount(inverse, weights=np.array(rec['wall']))
+            res[phase]['round_wall'] = {'mean': float(round_wall.mean())}
+            res[phase]['round_wall'].update({'p{}'.format(p): float(np.percentile(round_wall, p)) for p in percentiles})
+            # the change of RSS (in MB) during each call of the phase
+            rss_delta = np.array([r for r in rec['rss_delta'] if r is not None])
+            res[phase]['rss_delta'] = None
+            if len(rss_delta) > 0:
+                res[phase]['rss_delta'] = {'mean': float(rss_delta.mean()), 'max': float(rss_delta.max())}
+                res[phase]['rss_delta'].update({'p{}'.format(p): float(np.percentile(rss_delta, p)) for p in percentiles})
+            peak = [r for r in rec['process_peak_rss'] if r is not None]
+            res[phase]['process_peak_rss'] = max(peak) if len(peak) > 0 else None
+        return res
+
+    def save(self, filepath):
+        with open(filepath, 'w') as outf:
+            json.dump(self.summary(), outf)
@@ -0,0 +1,108 @@
+"""
+Batched local training of "virtual clients" for small models. The parameters of the
+models of all the selected clients are stacked along a new leading dimension, and the
+forward/backward passes of all the clients are vectorized by `torch.func.vmap`, so that
+hundreds of sequential micro-trainings become a few large batched operations. Only
+the models without buffers trained by SGD with loss modules supporting `reduction` are
+supported, and the others should fall back to the serial training.
+"""
+import copy
+import torch
+try:
+    from torch.func import functional_call, vmap, grad
+except ImportError:
+    functional_call = vmap = grad = None
+
+def is_supported(model, calculator):
+    """
+    Check whether the model can be trained in the batched way
+    :param
+        model: the model to be trained
+        calculator: the task calculator of clients
+    :return
+        True if supported else False
+    """
+    if vmap is None: return False
+    if calculator.optimizer_name.lower() != 'sgd': return False
+    if not hasattr(calculator, 'criterion') or not hasattr(calculator.criterion, 'reduction'): return False
+    if len(list(model.buffers())) > 0: return False
+    return len(set([p.dtype for p in model.parameters()])) == 1
+
+def stack_batches(batches, calculator, device):
+    """
+    Stack the batches of clients into tensors with a leading dimension of clients, where
+    the batches are padded to the same size and the padded samples are masked out.
+    :param
+        batches: a list of batches, and the None batches (i.e. the clients that have finished training) will be totally masked
+        calculator: the task calculator used to move the batches to the device
+        device: the device
+    :return
+        xs, ys, masks
+    """
+    data = [calculator.to_device(b) if b is not None else None for b in batches]
+    ref = [d for d in data if d is not None][0]
+    max_size = max([len(d[-1]) for d in data if d is not None])
+    xs, ys, masks = [], [], []
+    for d in data:
+        x, y = (d[0], d[-1]) if d is not None else (ref[0][:0], ref[-1][:0])
+        num_pads = max_size - len(y)
+        xs.append(torch.cat([x, x.new_zeros((num_pads,) + tuple(x.shape[1:]))]))
+        ys.append(torch.cat([y, y.new_zeros((num_pads,) + tuple(y.shape[1:]))]))
+        masks.append(torch.cat([torch.ones(len(y), device=device), torch.zeros(num_pads, device=device)]))
+    return torch.stack(xs), torch.stack(ys), torch.stack(masks)
+
+def train(clients, models):
+    """
+    Train the models of clients simultaneously with SGD, which follows the same procedure
+    as `BasicClient.train` for each client (i.e. the learning rate, momentum, weight decay
+    and the number of steps `_working_amount` of each client are respected).
+    :param
+        clients: a list of clients
+        models: a list of models of the clients, which will be updated in place
+    """
+    calculator = clients[0].calculator
+    device = clients[0].device
+    criterion = copy.copy(calculator.criterion)
+    criterion.reduction = 'none'
+    template = copy.deepcopy(models[0]).to(device)
+    template.train()
+    named_params = [dict(m.named_parameters()) for m in models]
+    names = list(named_params[0].keys())
+    trainable = [n for n in names if named_params[0][n].requires_grad]
+    params = {n: torch.stack([nps[n].detach().to(device) for nps in named_params]) for n in names}
+    dtype = params[names[0]].dtype
+    lrs = torch.tensor([c.learning_rate for c in clients], dtype=dtype, device=device)
+    momentums = torch.tensor([c.momentum for c in clients], dtype=dtype, device=device)
+    weight_decays = torch.tensor([c.weight_decay for c in clients], dtype=dtype, device=device)
+    momentum_buffers = {n: None for n in trainable}
+
+    def compute_loss(p, x, y, mask):
+        outputs = functional_call(template, p, (x,))
+        return (criterion(outputs, y) * mask).sum() / mask.sum().clamp(min=1)
+
+    compute_grads = vmap(grad(compute_loss), randomness='different')
+    # the number of local steps is limited by the working amount of clients as `ss.with_completeness` does
+    num_steps = [c._working_amount for c in clients]
+    old_num_steps = [c.num_steps for c in clients]
+    for c, k in zip(clients, num_steps): c.num_steps = k
+    for step in range(max(num_steps)):
+        active = [step < k for k in num_steps]
+        batches = [c.get_batch_data() if a else None for c, a in zip(clients, active)]
+        xs, ys, masks = stack_batches(batches, calculator, device)
+        grads = compute_grads(params, xs, ys, masks)
+        step_lrs = lrs * torch.tensor(active, dtype=dtype, device=device)
+        with torch.no_grad():
+            for n in trainable:
+                shape = (-1,) + (1,) * (params[n].dim() - 1)
+                g = grads[n] + weight_decays.view(shape) * params[n]
+                if momentum_buffers[n] is None: momentum_buffers[n] = g.clone()
+                else: momentum_buffers[n] = momentum_buffers[n] * momentums.view(shape) + g
+                g = torch.where(momentums.view(shape) != 0, momentum_buffers[n], g)
+                params[n] = params[n] - step_lrs.view(shape) * g
+    for c, k in zip(clients, old_num_steps): c.num_steps = k
+    # write the trained parameters back to the models of clients
+    with torch.no_grad():
+        for cid, nps in enumerate(named_params):
+            for n in trainable:
+                nps[n].copy_(params[n][cid])
+    return
@@ -0,0 +1,36 @@
+"""
+The shared fixtures of the tests. The modules of flgo import the global namespace `config` and
+the packages `utils` and `system_simulator` by their top-level names (i.e. as if running from the
+directory flgo), which are bound to the ones of the package flgo here.
+"""
+import os
+import sys
+import types
+sys.modules.setdefault('config', types.ModuleType('config'))
+import flgo
+import flgo.utils
+import flgo.utils.fmodule
+import flgo.utils.fflow
+import flgo.system_simulator
+import flgo.system_simulator.base
+sys.modules.setdefault('utils', flgo.utils)
+sys.modules.setdefault('utils.fmodule', flgo.utils.fmodule)
+sys.modules.setdefault('utils.fflow', flgo.utils.fflow)
+sys.modules.setdefault('system_simulator', flgo.system_simulator)
+sys.modules.setdefault('system_simulator.base', flgo.system_simulator.base)
+import pytest
+
+@pytest.fixture(autouse=True)
+def clean_argv(monkeypatch):
+    # the options of flgo are parsed from the command line
+    monkeypatch.setattr(sys, 'argv', sys.argv[:1])
+
+@pytest.fixture(scope='session')
+def synthetic_task(tmp_path_factory):
+    """A synthetic regression task of 10 clients"""
+    root = tmp_path_factory.mktemp('task')
+    config = root / 'gen.yml'
+    config.write_text('benchmark:\n  name: synthetic_regression\n  para:\n    num_clients: 10\n    mean_datavol: 100\n')
+    task = str(root / 'syn_task')
+    flgo.gen_task(str(config), task_path=task, seed=0)
+    return task
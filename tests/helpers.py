@@ -0,0 +1,33 @@
+"""The helpers of running the federated systems in the tests"""
+import shutil
+import torch
+import flgo
+import flgo.algorithm.fedbase as fedbase
+import flgo.utils.fcheckpoint as fcheckpoint
+
+def run(task, algorithm, option, resume=''):
+    """Run the algorithm on the task with the logistic regression model and return the server"""
+    option = dict({'no_log_console': True, 'seed': 3}, **option)
+    server = flgo.init(task, algorithm, option, model_name='lr', resume=resume)
+    server.run()
+    return server
+
+def get_weights(model):
+    return {k: v.clone() for k, v in model.state_dict().items()}
+
+def same_weights(w1, w2):
+    return w1.keys() == w2.keys() and all(torch.equal(w1[k], w2[k]) for k in w1)
+
+def run_and_resume(task, algorithm, option, tmp_path, monkeypatch, at_round=3):
+    """Run the algorithm with checkpoints, then resume the run from the checkpoint saved at `at_round`"""
+    path, copied = str(tmp_path / 'run.ckpt'), str(tmp_path / 'copied.ckpt')
+    save = fcheckpoint.save_checkpoint
+    def save_and_copy(filepath, server):
+        save(filepath, server)
+        if server.current_round - 1 >= at_round and not (tmp_path / 'copied.ckpt').exists(): shutil.copy(filepath, copied)
+    monkeypatch.setattr(fedbase.fcheckpoint, 'save_checkpoint', save_and_copy)
+    option = dict(option, checkpoint_interval=1, checkpoint=path)
+    full = run(task, algorithm, option)
+    monkeypatch.setattr(fedbase.fcheckpoint, 'save_checkpoint', save)
+    resumed = run(task, algorithm, option, resume=copied)
+    return full, resumed
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import types
+import warnings
+import pytest
+import flgo.algorithm.fedavg as fedavg
+import flgo.algorithm.fedbuff as fedbuff
+from flgo.algorithm.fedbase import BasicServer, BasicClient
+from helpers import run, run_and_resume, get_weights, same_weights
+
+SYSTEM = {'num_rounds': 6, 'proportion': 0.5, 'availability': 'LN-0.5', 'responsiveness': 'UNI-1-5', 'completeness': 'PDU-0.5', 'optimizer': 'Adam'}
+
+@pytest.mark.parametrize('algorithm', [fedavg, fedbuff])
+def test_resumed_run_equals_the_uninterrupted_one(algorithm, synthetic_task, tmp_path, monkeypatch):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', UserWarning)
+        full, resumed = run_and_resume(synthetic_task, algorithm, SYSTEM, tmp_path, monkeypatch)
+    assert resumed.current_round == full.current_round
+    assert same_weights(get_weights(full.model), get_weights(resumed.model))
+
+class MomentumServer(BasicServer):
+    """The server that keeps the momentum of the global updates across rounds without saving it"""
+    def initialize(self):
+        self.init_algo_para({'beta': 0.5})
+        self.momentum = None
+
+    def aggregate(self, models):
+        new_model = super().aggregate(models)
+        delta = new_model - self.model
+        self.momentum = delta if self.momentum is None else self.beta * self.momentum + delta
+        return self.model + self.momentum
+
+def test_resuming_unsaved_states_warns(synthetic_task, tmp_path, monkeypatch):
+    algorithm = types.ModuleType('momentum')
+    algorithm.Server, algorithm.Client = MomentumServer, BasicClient
+    with pytest.warns(UserWarning, match='momentum'):
+        run_and_resume(synthetic_task, algorithm, {'num_rounds': 4}, tmp_path, monkeypatch)
+
+POOL_SCRIPT = '''
+import sys
+sys.path[:0] = [{tests!r}, {root!r}]
+import conftest
+import shutil
+import flgo
+import flgo.algorithm.fedavg as fedavg
+import flgo.algorithm.fedbase as fedbase
+import flgo.utils.fcheckpoint as fcheckpoint
+if __name__ == '__main__':
+    option = dict({option!r}, num_threads=2, checkpoint_interval=1, checkpoint={path!r}, no_log_console=True, seed=3)
+    save = fcheckpoint.save_checkpoint
+    def save_and_copy(filepath, server):
+        save(filepath, server)
+        if server.current_round - 1 == 3: shutil.copy(filepath, {copied!r})
+    fedbase.fcheckpoint.save_checkpoint = save_and_copy
+    weights = []
+    for resume in ['', {copied!r}]:
+        server = flgo.init({task!r}, fedavg, option, model_name='lr', resume=resume)
+        server.run()
+        weights.append(server.model.state_dict())
+    print(all(weights[0][k].equal(weights[1][k]) for k in weights[0]))
+'''
+
+def test_resumed_pool_run_equals_the_uninterrupted_one(synthetic_task, tmp_path):
+    # the workers of the pool are spawned processes, which re-import the script as the main module
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    script = tmp_path / 'pool_resume.py'
+    script.write_text(POOL_SCRIPT.format(tests=tests_dir, root=os.path.dirname(tests_dir), option=SYSTEM, path=str(tmp_path / 'run.ckpt'), copied=str(tmp_path / 'copied.ckpt'), task=synthetic_task))
+    res = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=600)
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.strip().splitlines()[-1] == 'True'
@@ -0,0 +1,38 @@
+import types
+import pytest
+import torch
+import flgo.algorithm.fedavg as fedavg
+from helpers import run
+
+def test_clients_hold_the_server_versions(synthetic_task):
+    server = run(synthetic_task, fedavg, {'num_rounds': 12, 'proportion': 0.3, 'delta_download': 3})
+    num_checked = 0
+    for c in server.clients:
+        if c._cached_model_version is None: continue
+        assert c._cached_model_version <= server.model_version
+        if c._cached_model_version not in server._model_versions: continue
+        expected = server._model_versions[c._cached_model_version].state
+        for k, v in c._cached_model.state.items():
+            assert torch.equal(v, expected[k])
+        num_checked += 1
+    assert num_checked > 0
+
+def test_lossy_download_compressor_is_rejected(synthetic_task):
+    with pytest.raises(ValueError):
+        run(synthetic_task, fedavg, {'num_rounds': 1, 'delta_download': 3, 'download_compressor': 'qsgd-8'})
+
+class ReferenceCheckingClient(fedavg.Client):
+    def unpack(self, received_pkg):
+        model = super().unpack(received_pkg)
+        # the compressed upload of the client is relative to the received model, which the server should hold exactly
+        reference = self.server.get_upload_reference(self.id)
+        for k, v in model.state_dict().items():
+            assert torch.equal(v, reference.state[k])
+        self.num_checked = getattr(self, 'num_checked', 0) + 1
+        return model
+
+def test_upload_reference_matches_the_received_model(synthetic_task):
+    algorithm = types.ModuleType('fedavg_reference')
+    algorithm.Server, algorithm.Client = fedavg.Server, ReferenceCheckingClient
+    server = run(synthetic_task, algorithm, {'num_rounds': 10, 'proportion': 0.3, 'delta_download': 3, 'compressor': 'topk-0.3'})
+    assert sum([getattr(c, 'num_checked', 0) for c in server.clients]) > 0
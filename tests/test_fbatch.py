@@ -0,0 +1,31 @@
+import torch
+import flgo.algorithm.fedavg as fedavg
+import flgo.utils.fbatch as fbatch
+from helpers import run_and_resume, get_weights, same_weights
+
+def test_loader_covers_the_dataset_once_per_epoch():
+    x, y = torch.randn(23, 4), torch.arange(23)
+    dataset = torch.utils.data.Subset(torch.utils.data.TensorDataset(x, y), list(range(3, 23)))
+    loader = fbatch.IndexBatchLoader(dataset, 6)
+    batches = list(loader)
+    assert len(batches) == len(loader) == 4
+    assert [len(b[1]) for b in batches] == [6, 6, 6, 2]
+    labels = torch.cat([b[1] for b in batches])
+    assert sorted(labels.tolist()) == list(range(3, 23))
+    for bx, by in batches: assert torch.equal(bx, x[by])
+
+def test_skipped_loader_yields_the_remaining_batches():
+    dataset = torch.utils.data.TensorDataset(torch.arange(20))
+    torch.manual_seed(0)
+    full = list(fbatch.IndexBatchLoader(dataset, 3))
+    torch.manual_seed(0)
+    loader = fbatch.IndexBatchLoader(dataset, 3)
+    loader.skip(2)
+    assert all(torch.equal(a[0], b[0]) for a, b in zip(full[2:], loader))
+
+def test_resumed_run_with_index_sampler_equals_the_uninterrupted_one(synthetic_task, tmp_path, monkeypatch):
+    # the permutations of the loaders are seeded by the global RNG, which should be restored from the checkpoint
+    option = {'num_rounds': 6, 'proportion': 0.5, 'batch_size': 8, 'num_steps': 3, 'index_sampler': True}
+    full, resumed = run_and_resume(synthetic_task, fedavg, option, tmp_path, monkeypatch)
+    assert resumed.current_round == full.current_round
+    assert same_weights(get_weights(full.model), get_weights(resumed.model))
@@ -0,0 +1,90 @@
+import types
+import pytest
+import torch
+import flgo.algorithm.fedavg as fedavg
+import flgo.utils.fcompress as fcompress
+from flgo.utils.fmodule import FModule
+from helpers import run
+
+class Model(FModule):
+    def __init__(self):
+        super().__init__()
+        self.fc = torch.nn.Linear(20, 10)
+        self.bn = torch.nn.BatchNorm1d(10)
+
+def perturbed(model, scale=0.1):
+    other = Model()
+    other.load_state_dict(model.state_dict())
+    with torch.no_grad():
+        for p in other.parameters(): p.add_(torch.randn_like(p) * scale)
+    return other
+
+def test_sparse_is_lossless():
+    torch.manual_seed(0)
+    vec = torch.randn(1000) * (torch.rand(1000) < 0.1)
+    c = fcompress.SparseCompressor()
+    assert torch.equal(c.decompress(c.compress(vec), len(vec), vec.dtype, vec.device), vec)
+
+def test_topk_error_feedback_keeps_the_residual():
+    torch.manual_seed(0)
+    vec = torch.randn(1000)
+    c = fcompress.TopKCompressor(0.1)
+    sent = c.decompress(c.compress(vec), len(vec), vec.dtype, vec.device)
+    assert int((sent != 0).sum()) == 100
+    assert torch.allclose(sent + c.residual, vec)
+
+@pytest.mark.parametrize('bits', [1, 2, 4, 8])
+def test_quantization_error_bound(bits):
+    torch.manual_seed(0)
+    vec = torch.randn(1001)
+    c = fcompress.QuantizationCompressor(bits)
+    payload = c.compress(vec)
+    res = c.decompress(payload, len(vec), vec.dtype, vec.device)
+    assert (res - vec).abs().max() <= payload['scale'].item() * (1 + 1e-5)
+
+@pytest.mark.parametrize('bits', [2, 4, 8])
+def test_qsgd_error_bound_and_unbiasedness(bits):
+    torch.manual_seed(0)
+    vec = torch.randn(501)
+    c = fcompress.QSGDCompressor(bits)
+    levels = 2 ** (bits - 1) - 1
+    results = torch.stack([c.decompress(c.compress(vec), len(vec), vec.dtype, vec.device) for _ in range(2000)])
+    assert (results - vec).abs().max() <= vec.norm() / levels * (1 + 1e-5)
+    # the standard error of the mean of the 2000 draws is below norm/levels/sqrt(2000)
+    assert (results.mean(0) - vec).abs().max() <= 5 * vec.norm() / levels / 2000 ** 0.5
+
+def test_compressed_model_round_trip_relative_to_the_reference():
+    torch.manual_seed(0)
+    reference = Model()
+    model = perturbed(reference)
+    compressed = fcompress.CompressedModel(model, fcompress.get_compressor('sparse'), reference)
+    assert compressed.reference is None
+    with pytest.raises(ValueError):
+        compressed.decompress(Model())
+    res = compressed.decompress(Model(), reference)
+    for k, v in model.state_dict().items():
+        assert torch.allclose(res.state_dict()[k], v, atol=1e-6)
+    # the integer buffers (e.g. num_batches_tracked) are sent as they are
+    assert torch.equal(res.bn.num_batches_tracked, model.bn.num_batches_tracked)
+
+def test_compressed_model_is_smaller():
+    model = Model()
+    compressed = fcompress.CompressedModel(model, fcompress.get_compressor('topk-0.1'))
+    assert compressed.__sizeof__() < model.__sizeof__() / 4
+    assert compressed.count_parameters() == model.count_parameters(output=False)
+
+class VersionRecordingServer(fedavg.Server):
+    def iterate(self):
+        res = super().iterate()
+        self.max_num_versions = max(getattr(self, 'max_num_versions', 0), len(self._model_versions))
+        return res
+
+@pytest.mark.parametrize('delta_download', [0, 2])
+def test_retained_model_versions_are_bounded(synthetic_task, delta_download):
+    algorithm = types.ModuleType('fedavg_versions')
+    algorithm.Server, algorithm.Client = VersionRecordingServer, fedavg.Client
+    server = run(synthetic_task, algorithm, {'num_rounds': 30, 'proportion': 0.2, 'compressor': 'topk-0.3',
+                                             'delta_download': delta_download, 'availability': 'LN-0.5', 'responsiveness': 'UNI-1-5'})
+    # each version pinned by an upload is released once the upload is received, so only the latest ones are kept
+    assert len(server._sent_versions) == 0
+    assert server.max_num_versions <= max(delta_download, 1)
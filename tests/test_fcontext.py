@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import types
+import pytest
+import flgo.utils.fcontext as fcontext
+from flgo.algorithm.fedbase import BasicServer, BasicClient
+from helpers import run, get_weights, same_weights
+
+OPTION = {'num_rounds': 5, 'proportion': 0.5, 'optimizer': 'Adam'}
+
+class PreservingClient(BasicClient):
+    preserve_optimizer_state = True
+
+def make_algorithm(client_class):
+    algorithm = types.ModuleType('context_algorithm')
+    algorithm.Server, algorithm.Client = BasicServer, client_class
+    return algorithm
+
+@pytest.mark.parametrize('client_class', [BasicClient, PreservingClient])
+@pytest.mark.parametrize('context', [{'train_context': 'client'}, {'train_context': 'client', 'train_context_capacity': 2}, {'train_context': 'worker'}])
+def test_reused_contexts_train_the_same_models(client_class, context, synthetic_task):
+    algorithm = make_algorithm(client_class)
+    expected = get_weights(run(synthetic_task, algorithm, dict(OPTION, train_context='none')).model)
+    assert same_weights(expected, get_weights(run(synthetic_task, algorithm, dict(OPTION, **context)).model))
+
+def test_context_is_reused_without_touching_the_received_model(synthetic_task):
+    server = run(synthetic_task, make_algorithm(BasicClient), dict(OPTION, num_rounds=1, train_context='client'))
+    client = server.clients[0]
+    received = server.model
+    weights = get_weights(received)
+    model = client.unpack({'model': received})
+    client.train(model)
+    assert model is fcontext.get_context(client.id).model
+    assert model is not received and same_weights(weights, get_weights(received))
+    assert client.unpack({'model': received}) is model
+
+POOL_SCRIPT = '''
+import sys
+sys.path[:0] = [{tests!r}, {root!r}]
+import conftest
+import types
+import flgo
+from flgo.algorithm.fedbase import BasicServer, BasicClient
+
+class PreservingClient(BasicClient):
+    preserve_optimizer_state = True
+
+if __name__ == '__main__':
+    algorithm = types.ModuleType('context_algorithm')
+    algorithm.Server, algorithm.Client = BasicServer, PreservingClient
+    weights = []
+    for context in ['none', 'worker']:
+        option = dict({option!r}, num_threads=2, train_context=context, no_log_console=True, seed=3)
+        server = flgo.init({task!r}, algorithm, option, model_name='lr')
+        server.run()
+        weights.append(server.model.state_dict())
+    print(all(weights[0][k].equal(weights[1][k]) for k in weights[0]))
+'''
+
+def test_shared_worker_contexts_train_the_same_models(synthetic_task, tmp_path):
+    # the workers of the pool are spawned processes, which re-import the script as the main module
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    script = tmp_path / 'pool_context.py'
+    script.write_text(POOL_SCRIPT.format(tests=tests_dir, root=os.path.dirname(tests_dir), option=OPTION, task=synthetic_task))
+    res = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=600)
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.strip().splitlines()[-1] == 'True'
@@ -0,0 +1,14 @@
+import pytest
+import flgo.algorithm.fedavg as fedavg
+from helpers import run
+
+@pytest.mark.parametrize('test_batch_size', [7, 512])
+def test_consolidated_evaluation_equals_per_client_test(synthetic_task, test_batch_size):
+    server = run(synthetic_task, fedavg, {'num_rounds': 2, 'train_holdout': 0.2, 'test_batch_size': test_batch_size})
+    assert server.evaluator.is_supported()
+    for dataflag in ['train', 'valid']:
+        metrics = server.global_test(dataflag)
+        expected = [c.test(server.model, dataflag) for c in server.clients]
+        assert set(metrics.keys()) == set(expected[0].keys())
+        for name, values in metrics.items():
+            assert values == pytest.approx([e[name] for e in expected], rel=1e-5, abs=1e-7)
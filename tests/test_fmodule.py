@@ -0,0 +1,88 @@
+import copy
+import torch
+import flgo.algorithm.fedavg as fedavg
+import flgo.utils.fmodule as fmodule
+from flgo.utils.fmodule import FModule
+from helpers import run, get_weights
+
+class Model(FModule):
+    def __init__(self):
+        super().__init__()
+        self.fc1 = torch.nn.Linear(8, 4)
+        self.bn = torch.nn.BatchNorm1d(4)
+        self.fc2 = torch.nn.Linear(4, 2)
+
+def test_size_info():
+    model = Model()
+    tensors = list(model.parameters()) + list(model.buffers())
+    assert model.__sizeof__() == sum([t.numel() * t.element_size() for t in tensors])
+    assert model.size_info()['num_params'] == sum([p.numel() for p in model.parameters()])
+    assert model.count_parameters(output=False) == model.size_info()['num_params']
+
+def test_sizeof_reads_the_cache(monkeypatch):
+    model = Model()
+    size = model.__sizeof__()
+    def fail(*args, **kwargs): raise AssertionError('the parameters are walked again')
+    monkeypatch.setattr(model, 'parameters', fail)
+    monkeypatch.setattr(model, 'buffers', fail)
+    assert model.__sizeof__() == size
+
+def test_trainable_params_follow_requires_grad():
+    model = Model()
+    total = model.count_parameters(output=False)
+    model.fc1.requires_grad_(False)
+    assert model.count_parameters(output=False) == total - 8 * 4 - 4
+    model.fc1.weight.requires_grad = True
+    assert model.size_info()['num_trainable_params'] == total - 4
+
+def test_size_cache_is_reset_by_casting():
+    model = Model()
+    size = model.__sizeof__()
+    model.double()
+    assert model.__sizeof__() == size * 2 - model.bn.num_batches_tracked.element_size()
+
+def test_stream_sum_of_integer_buffers_is_order_free():
+    for flat in [False, True]:
+        models = [Model() for _ in range(3)]
+        for model, n in zip(models, [5, 9, 2]):
+            model.bn.num_batches_tracked.fill_(n)
+            if flat: model.flatten()
+        weights = [0.2, 0.3, 0.5]
+        forward = fmodule._model_stream_sum(models, weights)
+        backward = fmodule._model_stream_sum(models[::-1], weights[::-1])
+        assert int(forward.bn.num_batches_tracked) == int(backward.bn.num_batches_tracked) == 9
+        expected = sum(w * m.fc1.weight for w, m in zip(weights, models))
+        assert torch.allclose(forward.fc1.weight, expected) and torch.allclose(backward.fc1.weight, expected)
+
+def random_models(num_models=2):
+    models = [Model() for _ in range(num_models)]
+    for m in models:
+        m.bn.running_mean.normal_()
+        m.bn.running_var.uniform_(0.5, 2.0)
+    return models
+
+def same_state(m1, m2):
+    s1, s2 = m1.state_dict(), m2.state_dict()
+    return s1.keys() == s2.keys() and all(s1[k].dtype == s2[k].dtype and torch.allclose(s1[k], s2[k], atol=1e-6) for k in s1)
+
+def test_flat_arithmetic_equals_layerwise_arithmetic():
+    m1, m2 = random_models()
+    f1, f2 = copy.deepcopy(m1).flatten(), copy.deepcopy(m2).flatten()
+    assert f1.is_flat() and not m1.is_flat()
+    for op in [lambda a, b: a + b, lambda a, b: a - b, lambda a, b: 0.3 * a, lambda a, b: a / 4, lambda a, b: -a,
+               lambda a, b: (1 - 0.3) * a + 0.3 * b, lambda a, b: fmodule._model_sum([a, b, a]),
+               lambda a, b: fmodule._model_average([a, b], [0.25, 0.75])]:
+        res, flat_res = op(m1, m2), op(f1, f2)
+        assert flat_res.is_flat() and same_state(res, flat_res)
+    for op in [lambda a, b: a.norm(), lambda a, b: a.dot(b)]:
+        assert torch.allclose(op(m1, m2), op(f1, f2), rtol=1e-5)
+    # the layer-wise cos_sim skips the tensors without gradients (i.e. all the tensors in state_dict)
+    assert torch.allclose(f1.cos_sim(f2), m1.dot(m2) / (m1.norm() * m2.norm()), rtol=1e-5)
+
+def test_flat_global_model_trains_the_same(synthetic_task):
+    option = {'num_rounds': 3, 'proportion': 0.5}
+    layerwise = run(synthetic_task, fedavg, option)
+    flat = run(synthetic_task, fedavg, dict(option, flat_model=True))
+    assert flat.model.is_flat() and not layerwise.model.is_flat()
+    w1, w2 = get_weights(layerwise.model), get_weights(flat.model)
+    assert all(torch.allclose(w1[k], w2[k], atol=1e-6) for k in w1)
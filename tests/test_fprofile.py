@@ -0,0 +1,33 @@
+import numpy as np
+import flgo.algorithm.fedavg as fedavg
+import flgo.utils.fprofile as fprofile
+from helpers import run
+
+def test_rss_delta_is_attributed_to_the_phase():
+    profiler = fprofile.Profiler()
+    with profiler.profile('allocate'):
+        buffer = np.ones(64 * 1024 * 1024 // 8)
+    with profiler.profile('idle'):
+        pass
+    summary = profiler.summary()
+    if fprofile.current_rss() is None: return
+    assert summary['allocate']['rss_delta']['max'] >= 32
+    assert abs(summary['idle']['rss_delta']['max']) < 32
+    assert summary['idle']['process_peak_rss'] >= summary['allocate']['rss_delta']['max']
+    del buffer
+
+def test_merged_records_of_workers():
+    main, worker = fprofile.Profiler(), fprofile.Profiler()
+    for profiler in [main, worker]:
+        with profiler.profile('local_train'): pass
+    main.merge(worker.pop_records())
+    assert main.summary()['local_train']['count'] == 2
+    assert worker.records == {}
+
+def test_profiled_run(synthetic_task):
+    server = run(synthetic_task, fedavg, {'num_rounds': 2, 'profile': True})
+    import config as cfg
+    summary = cfg.logger.profiler.summary()
+    for phase in ['local_train', 'communicate', 'aggregate', 'evaluate']:
+        assert summary[phase]['count'] > 0
+        assert set(summary[phase].keys()) == {'count', 'wall', 'cpu', 'round_wall', 'rss_delta', 'process_peak_rss'}
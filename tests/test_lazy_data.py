@@ -0,0 +1,21 @@
+import pickle
+import torch
+import flgo.benchmark.toolkits.base as base
+import flgo.benchmark.synthetic_regression.core as core
+
+def test_pickled_lazy_dataset_is_its_recipe(synthetic_task):
+    pipe = core.TaskPipe(synthetic_task)
+    task_data = pipe.load_data({'lazy_data': True, 'lazy_data_capacity': 1, 'train_holdout': 0.2, 'test_holdout': 0.0})
+    train_data = task_data[pipe.feddata['client_names'][0]]['train']
+    payload = pickle.dumps(train_data)
+    assert len(pipe.dataset_cache.items) == 0
+    restored = pickle.loads(payload)
+    assert isinstance(restored, base.LazyDataset) and len(restored) == len(train_data)
+    # the restored handles share the task pipe and the cache of the receiving process
+    other = pickle.loads(pickle.dumps(task_data[pipe.feddata['client_names'][1]]['train']))
+    assert restored.client_data.cache is other.client_data.cache
+    assert restored.client_data.build_fn.func.__self__ is other.client_data.build_fn.func.__self__
+    for i in range(len(train_data)):
+        x, y = train_data[i]
+        rx, ry = restored[i]
+        assert torch.equal(x, rx) and torch.equal(torch.as_tensor(y), torch.as_tensor(ry))
@@ -0,0 +1,47 @@
+import json
+import os
+import pytest
+import flgo.algorithm.fedavg as fedavg
+import config as cfg
+from flgo.experiment.logger.basic_logger import Logger, RecordStream
+from helpers import run
+
+def get_record_path(suffix='.json'):
+    return os.path.join(cfg.logger.get_output_path(), cfg.logger.get_output_name(suffix))
+
+def test_streamed_run_keeps_the_record(synthetic_task, monkeypatch):
+    option = {'num_rounds': 4, 'proportion': 0.5}
+    run(synthetic_task, fedavg, option)
+    with open(get_record_path()) as inf: expected = json.load(inf)
+    # record the outputs of all the rounds that are organized into the saved record
+    organized = {}
+    organize_output = Logger.organize_output
+    def recording_organize_output(self, *args, **kwargs):
+        organized.update({k: list(v) for k, v in self.output.items() if '_dist' in k})
+        return organize_output(self, *args, **kwargs)
+    monkeypatch.setattr(Logger, 'organize_output', recording_organize_output)
+    run(synthetic_task, fedavg, dict(option, stream_record=True))
+    with open(get_record_path()) as inf: record = json.load(inf)
+    dist_keys = [k for k in expected if '_dist' in k]
+    assert len(dist_keys) > 0
+    for key in dist_keys:
+        assert len(organized[key]) == 5
+        assert record[key] == expected[key] == organized[key][-1]
+    # the streaming record contains the lists of the values of the rounds
+    stream = RecordStream(get_record_path('.jsonl'))
+    full, latest = stream.read(keep_dist=True), stream.read()
+    for key in dist_keys:
+        assert full[key] == organized[key]
+        assert latest[key] == organized[key][-1:]
+    for key in [k for k in expected if k != 'option' and '_dist' not in k and k in full]:
+        assert full[key] == expected[key]
+
+def test_analyzer_reads_the_same_record_from_the_stream(synthetic_task):
+    analyzer = pytest.importorskip('flgo.experiment.analyzer')
+    run(synthetic_task, fedavg, {'num_rounds': 3, 'stream_record': True})
+    name = cfg.logger.get_output_name()
+    from_json = analyzer.Record(synthetic_task, name).data
+    from_stream = analyzer.Record(synthetic_task, os.path.splitext(name)[0] + '.jsonl').data
+    assert from_json.keys() == from_stream.keys()
+    for key in from_json:
+        if key != 'option': assert from_json[key] == from_stream[key]
@@ -0,0 +1,103 @@
+import collections
+import time
+import numpy as np
+import pytest
+import torch
+from flgo.benchmark.toolkits.partition import DiversityPartitioner, DirichletPartitioner
+import flgo.utils.flabel as flabel
+
+class Samples(torch.utils.data.Dataset):
+    """The dataset of (feature, int label) whose labels can only be read sample by sample"""
+    def __init__(self, labels):
+        self.labels = [int(lb) for lb in labels]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return torch.zeros(2), self.labels[idx]
+
+class IndexedSamples(Samples):
+    """The dataset that exposes its labels as `targets` like the torchvision datasets"""
+    @property
+    def targets(self):
+        return self.labels
+
+def diversity_partition_by_samples(partitioner, data):
+    """The partition of DiversityPartitioner that reads the label of each sample"""
+    labels = [d[partitioner.flag_index] for d in data]
+    num_classes = len(set(labels))
+    dpairs = [[did, lb] for did,lb in zip(list(range(len(data))), labels)]
+    num = max(int(partitioner.diversity* num_classes), 1)
+    K = num_classes
+    local_datas = [[] for _ in range(partitioner.num_clients)]
+    if num == K:
+        for k in range(K):
+            idx_k = [p[0] for p in dpairs if p[1] == k]
+            np.random.shuffle(idx_k)
+            split = np.array_split(idx_k, partitioner.num_clients)
+            for cid in range(partitioner.num_clients):
+                local_datas[cid].extend(split[cid].tolist())
+    else:
+        times = [0 for _ in range(num_classes)]
+        contain = []
+        for i in range(partitioner.num_clients):
+            current = []
+            j = 0
+            while (j < num):
+                mintime = np.min(times)
+                ind = np.random.choice(np.where(times == mintime)[0])
+                if (ind not in current):
+                    j = j + 1
+                    current.append(ind)
+                    times[ind] += 1
+            contain.append(current)
+        for k in range(K):
+            idx_k = [p[0] for p in dpairs if p[1] == k]
+            np.random.shuffle(idx_k)
+            split = np.array_split(idx_k, times[k])
+            ids = 0
+            for cid in range(partitioner.num_clients):
+                if k in contain[cid]:
+                    local_datas[cid].extend(split[ids].tolist())
+                    ids += 1
+    return local_datas
+
+@pytest.mark.parametrize('diversity', [1.0, 0.3])
+@pytest.mark.parametrize('Dataset', [Samples, IndexedSamples])
+def test_diversity_partition_is_unchanged(diversity, Dataset):
+    data = Dataset(np.random.RandomState(0).randint(0, 10, 500))
+    partitioner = DiversityPartitioner(num_clients=20, diversity=diversity)
+    np.random.seed(1)
+    expected = diversity_partition_by_samples(partitioner, data)
+    np.random.seed(1)
+    assert partitioner(data) == expected
+
+def test_labels_are_read_from_the_index():
+    labels = np.random.RandomState(0).randint(0, 10, 100)
+    tensors = torch.utils.data.TensorDataset(torch.randn(100, 2), torch.tensor(labels))
+    subset = torch.utils.data.Subset(IndexedSamples(labels), [5, 3, 9])
+    concat = torch.utils.data.ConcatDataset([Samples(labels[:40]), tensors])
+    for data in [Samples(labels), IndexedSamples(labels), tensors, subset, concat]:
+        assert flabel.get_labels(data).tolist() == [int(d[-1]) for d in data]
+        assert flabel.get_label_counter(data) == collections.Counter([int(d[-1]) for d in data])
+
+@pytest.mark.parametrize('alpha', [0.1, 1.0])
+def test_dirichlet_partition_is_a_fitted_split(alpha):
+    labels = np.random.RandomState(0).randint(0, 10, 60000)
+    data = torch.utils.data.TensorDataset(torch.zeros(len(labels), 1), torch.tensor(labels))
+    partitioner = DirichletPartitioner(num_clients=1000, alpha=alpha)
+    np.random.seed(1)
+    start = time.time()
+    local_datas = partitioner(data)
+    assert time.time() - start < 10
+    # every sample is assigned to exactly one client
+    assert sorted(sum(local_datas, [])) == list(range(len(labels)))
+    # dirichlet_dist records the numbers of samples of each label of the clients
+    counts = np.array([np.bincount(labels[ld], minlength=10) if len(ld) > 0 else np.zeros(10, dtype=int) for ld in local_datas])
+    assert (counts == partitioner.dirichlet_dist).all()
+    # the label proportions are fitted so that the clients keep about their planned data sizes
+    sizes = np.array([len(ld) for ld in local_datas])
+    assert np.abs(sizes - len(labels) // 1000).mean() < 2
+    np.random.seed(1)
+    assert partitioner(data) == local_datas
@@ -0,0 +1,64 @@
+import types
+import numpy as np
+import config as cfg
+import flgo
+import flgo.algorithm.fedasync as fedasync
+import flgo.algorithm.fedavg as fedavg
+import flgo.system_simulator.base as base
+from flgo.system_simulator.base import BasicStateUpdater
+from helpers import run
+
+def test_legacy_views_of_the_client_variables(synthetic_task):
+    server = run(synthetic_task, fedavg, {'num_rounds': 2, 'availability': 'LN-0.5', 'responsiveness': 'UNI-1-5'})
+    updater = cfg.state_updater
+    variables = updater.variables
+    assert len(variables) == len(server.clients)
+    for cid, client in enumerate(server.clients):
+        for var in updater._VAR_NAMES:
+            assert variables[cid][var] == updater.get_variable(cid, var)[0]
+        assert client._prob_available == variables[cid]['prob_available']
+        assert client._prob_unavailable == variables[cid]['prob_unavailable']
+        assert client._latency == variables[cid]['latency']
+    assert any(v['prob_available'] != 1.0 for v in variables)
+    counters = updater.state_counter
+    assert [c['dropped_counter'] for c in counters] == updater._dropped_counter.tolist()
+    assert [c['latency_counter'] for c in counters] == updater._latency_counter.tolist()
+
+class TimetableUpdater:
+    """The state updater whose availability changes every 5 units of time"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.flushes = []
+
+    def get_time_to_availability_change(self):
+        return 5 - self.clock.current_time % 5
+
+    def flush(self, delta_t=1):
+        self.flushes.append((self.clock.current_time, delta_t))
+
+def test_event_skipping_splits_the_jump_where_the_availability_changes():
+    clock = base.ElemClock(event_skipping=True)
+    updater = TimetableUpdater(clock)
+    clock.register_state_updater(updater)
+    clock.step(3)
+    clock.step(9)
+    assert updater.flushes == [(0, 3), (3, 2), (5, 5), (10, 2)]
+    assert clock.current_time == 12
+
+def test_time_varying_availability_falls_back_to_unit_steps(synthetic_task):
+    class StateUpdater(BasicStateUpdater):
+        def update_client_availability(self):
+            pa = [0.5 + 0.4 * np.sin(cfg.clock.current_time) for _ in self.clients]
+            self.set_variable(self.all_clients, 'prob_available', pa)
+            self.set_variable(self.all_clients, 'prob_unavailable', [1 - p for p in pa])
+    deltas = []
+    flush = StateUpdater.flush
+    def recording_flush(self, delta_t=1):
+        deltas.append(delta_t)
+        return flush(self, delta_t)
+    StateUpdater.flush = recording_flush
+    simulator = types.ModuleType('time_varying_simulator')
+    simulator.StateUpdater = StateUpdater
+    server = flgo.init(synthetic_task, fedasync, {'num_rounds': 3, 'event_skipping': True, 'responsiveness': 'UNI-5-10', 'no_log_console': True, 'seed': 3}, model_name='lr', simulator=simulator)
+    server.run()
+    assert len(deltas) > 0 and set(deltas) == {1}
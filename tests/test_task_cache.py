@@ -0,0 +1,62 @@
+import os
+import shutil
+import numpy as np
+import torch
+import flgo.algorithm.fedavg as fedavg
+import flgo.benchmark.toolkits.base as base
+import flgo.utils.fflow as fflow
+from helpers import run, get_weights, same_weights
+
+def test_prepared_task_data_round_trip(tmp_path):
+    task_data = {
+        'server': {'test': torch.utils.data.TensorDataset(torch.randn(7, 3), torch.arange(7)), 'valid': None, 'info': {'num_classes': 7}},
+        'Client0': {'train': torch.utils.data.TensorDataset(torch.randn(5, 3), torch.arange(5)), 'valid': torch.utils.data.TensorDataset(torch.randn(0, 3), torch.arange(0))},
+    }
+    path = str(tmp_path / 'cache')
+    assert base.save_prepared_task_data(task_data, path)
+    assert sorted(os.listdir(path)) == sorted(['meta.json'] + ['prepared.{}.{}{}.npy'.format(flag, field, suffix) for flag in ['test', 'train'] for field in 'xy' for suffix in ['', '.offsets']])
+    loaded = base.load_prepared_task_data(path)
+    assert loaded['server']['info'] == {'num_classes': 7}
+    assert loaded['server']['valid'] is None
+    assert len(loaded['Client0']['valid']) == 0
+    for name, flag in [('server', 'test'), ('Client0', 'train')]:
+        x, y = task_data[name][flag].tensors
+        for i in range(len(x)):
+            assert torch.equal(loaded[name][flag][i][0], x[i]) and int(loaded[name][flag][i][1]) == int(y[i])
+
+class Graphs(torch.utils.data.Dataset):
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, idx):
+        return {'nodes': list(range(idx + 1))}
+
+def test_uncacheable_task_data_leaves_nothing(tmp_path):
+    path = str(tmp_path / 'cache')
+    extra = {'server': {'test': torch.utils.data.TensorDataset(torch.randn(3, 2), torch.arange(3)), 'model': torch.nn.Linear(2, 2)}}
+    assert not base.save_prepared_task_data(extra, path)
+    graphs = {'server': {'test': Graphs()}}
+    texts = {'Client0': {'train': base.MemmapXYDataset(np.zeros((2, 2)), np.zeros(2)), 'valid': torch.utils.data.TensorDataset(torch.randn(2, 3), torch.arange(2))},
+             'Client1': {'train': base.MemmapXYDataset(np.zeros((2, 5)), np.zeros(2)), 'valid': None}}
+    assert not base.save_prepared_task_data(graphs, path)
+    assert not base.save_prepared_task_data(texts, path)
+    assert os.listdir(str(tmp_path)) == []
+
+def test_lazy_data_is_cached_within_the_capacity(synthetic_task, monkeypatch):
+    shutil.rmtree(os.path.join(synthetic_task, 'cache'), ignore_errors=True)
+    sizes = []
+    get = base.DatasetLRU.get
+    def recording_get(self, handle):
+        res = get(self, handle)
+        sizes.append(len(self.items))
+        return res
+    monkeypatch.setattr(base.DatasetLRU, 'get', recording_get)
+    option = {'num_rounds': 2, 'lazy_data': True, 'lazy_data_capacity': 2, 'train_holdout': 0.2}
+    expected = get_weights(run(synthetic_task, fedavg, option).model)
+    assert 0 < max(sizes) <= 2
+    sizes.clear()
+    first = get_weights(run(synthetic_task, fedavg, dict(option, cache_task_data_on_disk=True)).model)
+    assert max(sizes) <= 2
+    cached = get_weights(run(synthetic_task, fedavg, dict(option, cache_task_data_on_disk=True)).model)
+    assert os.path.exists(os.path.join(synthetic_task, 'cache', 'S3_TRH0.2_TEH0.0_LD', 'rng_state.pt'))
+    assert same_weights(expected, first) and same_weights(expected, cached)
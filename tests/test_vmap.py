@@ -0,0 +1,25 @@
+import config as cfg
+import flgo.algorithm.fedavg as fedavg
+from flgo.algorithm.fedbase import BasicServer
+from helpers import run, get_weights
+
+def test_batched_training_equals_serial_training(synthetic_task, monkeypatch):
+    # the clients draw their batches in a different order when trained in batch, so each batch holds the whole local data
+    option = {'num_rounds': 3, 'proportion': 0.5, 'num_epochs': 3, 'batch_size': 1000, 'completeness': 'PDU-0.5'}
+    batches = []
+    communicate_in_batch = BasicServer.communicate_in_batch
+    def recording_communicate_in_batch(self, client_ids):
+        batches.append(list(client_ids))
+        return communicate_in_batch(self, client_ids)
+    monkeypatch.setattr(BasicServer, 'communicate_in_batch', recording_communicate_in_batch)
+    serial = get_weights(run(synthetic_task, fedavg, option).model)
+    assert batches == []
+    batched = get_weights(run(synthetic_task, fedavg, dict(option, vmap_clients=True)).model)
+    assert len(batches) > 0
+    assert all((serial[k] - batched[k]).abs().max() < 1e-5 for k in serial)
+
+def test_profiled_clients_are_trained_one_by_one(synthetic_task, monkeypatch):
+    monkeypatch.setattr(BasicServer, 'communicate_in_batch', lambda self, client_ids: (_ for _ in ()).throw(AssertionError('batched')))
+    server = run(synthetic_task, fedavg, {'num_rounds': 2, 'proportion': 0.5, 'vmap_clients': True, 'profile': True})
+    summary = cfg.logger.profiler.summary()
+    assert summary['local_train']['count'] > 0